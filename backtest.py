@@ -0,0 +1,141 @@
+# backtest.py
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import optimizer
+from engine import HedgeEngine, QUARTER_LEN_DAYS
+from gcurve import GCurve
+from portfolio import Portfolio
+
+BASE = {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}
+
+_portfolio = None   # портфель воркера (передаётся один раз через initializer)
+_cache = None       # кеш решений воркера, общий для всех его путей
+
+
+def _init_worker(portfolio: Portfolio, cache=None) -> None:
+    global _portfolio, _cache
+    _portfolio = portfolio
+    _cache = cache
+
+
+def run_path(portfolio: Portfolio, seed: np.random.SeedSequence, days: int = 365,
+             hedge: bool = False, base: dict | None = None,
+             rebalance_kwargs: dict | None = None) -> np.ndarray:
+    """
+    Один путь: своя копия портфеля, своя GCurve от seed.
+    Возвращает квартальный PnL (прирост bank_account + swap_account) [n_quarters].
+    При hedge=True каждый клиринг вызывает optimizer.rebalance_once;
+    деревья берут зерно из того же seed, так что путь воспроизводим.
+    """
+    curve_seed, tree_seed = seed.spawn(2)
+    gc = GCurve(portfolio.T0, base or BASE, seed=curve_seed)
+    engine = HedgeEngine(portfolio.fork(), gc)
+    if hedge:
+        engine.optimizer = optimizer
+        engine.rebalance_kwargs = dict(rebalance_kwargs or {}, seed=np.random.default_rng(tree_seed))
+
+    n_quarters = days // QUARTER_LEN_DAYS
+    values = np.empty(n_quarters + 1)
+    values[0] = engine.bank_account + engine.swap_account
+    for q in range(n_quarters):
+        engine.step(QUARTER_LEN_DAYS)
+        values[q + 1] = engine.bank_account + engine.swap_account
+    return np.diff(values)
+
+
+def _run_one(args) -> dict:
+    seed, days, hedge, base, rebalance_kwargs = args
+    out = {"unhedged": run_path(_portfolio, seed, days, False, base)}
+    if hedge:
+        if _cache is not None:
+            rebalance_kwargs = dict(rebalance_kwargs or {}, cache=_cache)
+        out["hedged"] = run_path(_portfolio, seed, days, True, base, rebalance_kwargs)
+        if _cache is not None:
+            out["cache"] = _cache.pop_fresh()
+    return out
+
+
+def summarize(pnl: np.ndarray, alpha: float = 0.95) -> dict:
+    """Метрики по матрице квартальных PnL [n_paths, n_quarters]."""
+    pnl = np.asarray(pnl, dtype=float)
+    quarterly = pnl.ravel()
+    total = pnl.sum(axis=1)
+    cvar_q, var_q = optimizer.cvar_of_losses(-quarterly, alpha)
+    cvar_t, var_t = optimizer.cvar_of_losses(-total, alpha)
+    return {
+        "paths": int(pnl.shape[0]),
+        "mean_q": float(quarterly.mean()) if quarterly.size else 0.0,
+        "VaR_q": var_q,
+        "CVaR_q": cvar_q,
+        "mean_total": float(total.mean()) if total.size else 0.0,
+        "VaR_total": var_t,
+        "CVaR_total": cvar_t,
+    }
+
+
+def backtest(portfolio: Portfolio, n_paths: int, days: int = 365, seed: int = 0,
+             hedge: bool = True, workers: int | None = None, alpha: float = 0.95,
+             base: dict | None = None, rebalance_kwargs: dict | None = None,
+             cache=None) -> dict:
+    """
+    N независимых путей HedgeEngine в ProcessPoolExecutor.
+    Каждый путь получает своё SeedSequence(seed).spawn(n_paths)[i], поэтому
+    результат не зависит от числа воркеров. workers=1 — без пула (отладка).
+    cache — DecisionCache: копия уходит в каждый воркер, новые решения
+    сливаются обратно и, если у кеша есть path, сохраняются на диск.
+    С кешем хедж зависит от порядка путей, т.е. и от числа воркеров.
+    Возвращает {"unhedged"/"hedged": {"pnl": [n_paths, n_quarters], метрики...}}.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(n_paths)
+    tasks = [(s, days, hedge, base, rebalance_kwargs) for s in seeds]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(portfolio, cache)
+        results = [_run_one(t) for t in tasks]
+    else:
+        chunksize = max(1, n_paths // (4 * workers))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(portfolio, cache)) as pool:
+            results = list(pool.map(_run_one, tasks, chunksize=chunksize))
+
+    if cache is not None:
+        for r in results:
+            cache.update(r.get("cache", {}))
+        if cache.path is not None:
+            cache.save()
+
+    report = {}
+    for key in ("unhedged", "hedged"):
+        if key not in results[0]:
+            continue
+        pnl = np.stack([r[key] for r in results])
+        report[key] = dict(summarize(pnl, alpha), pnl=pnl)
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    ap = argparse.ArgumentParser(description="Monte Carlo backtest HedgeEngine")
+    ap.add_argument("--paths", type=int, default=64)
+    ap.add_argument("--days", type=int, default=365)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-hedge", action="store_true")
+    ap.add_argument("--n-c", type=int, default=100)
+    ap.add_argument("--n-d", type=int, default=120)
+    ap.add_argument("--volume", type=float, default=1_000_000)
+    args = ap.parse_args()
+
+    portfolio = Portfolio(N_C=args.n_c, N_D=args.n_d, V=args.volume)
+    t = time.perf_counter()
+    report = backtest(portfolio, args.paths, days=args.days, seed=args.seed,
+                      hedge=not args.no_hedge, workers=args.workers)
+    for key, stats in report.items():
+        print(key, {k: v for k, v in stats.items() if k != "pnl"})
+    print(f"{args.paths} paths in {time.perf_counter() - t:.2f}s")
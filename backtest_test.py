@@ -0,0 +1,28 @@
+import unittest
+
+import numpy as np
+
+from backtest import backtest, summarize
+from portfolio import Portfolio
+
+
+class TestBacktest(unittest.TestCase):
+    def test_result_independent_of_workers(self):
+        p = Portfolio(N_C=5, N_D=5, V=100000)
+        one = backtest(p, n_paths=4, days=182, seed=1, workers=1,
+                       rebalance_kwargs={"levels": 3, "branch": 3})
+        two = backtest(p, n_paths=4, days=182, seed=1, workers=2,
+                       rebalance_kwargs={"levels": 3, "branch": 3})
+        self.assertEqual(one["hedged"]["pnl"].shape, (4, 2))
+        for key in ("unhedged", "hedged"):
+            np.testing.assert_array_equal(one[key]["pnl"], two[key]["pnl"])
+        # пути действительно разные
+        self.assertGreater(np.ptp(one["unhedged"]["pnl"][:, 0]), 0.0)
+
+    def test_summarize(self):
+        stats = summarize(np.array([[1.0, -2.0], [3.0, -4.0]]), alpha=0.5)
+        self.assertEqual(stats["mean_q"], -0.5)
+        # потери [-3, -1, 2, 4]: k = ceil(0.5 * 4) - 1 = 1
+        self.assertEqual(stats["VaR_q"], -1.0)
+        self.assertAlmostEqual(stats["CVaR_q"], 5.0 / 3.0)
+        self.assertEqual(stats["mean_total"], -1.0)
@@ -0,0 +1,231 @@
+# batch_engine.py
+from datetime import timedelta
+from types import SimpleNamespace
+
+import numpy as np
+
+from dates import ORD_DTYPE, add_months
+from engine import DAYS_PER_MONTH, QUARTER_LEN_DAYS, SWAP_FLOAT_TERM
+from gcurve import GCurve
+from portfolio import DEPOSIT, LOAN, Portfolio
+from profiling import profiler
+
+
+class BatchHedgeEngine:
+    """
+    K путей HedgeEngine в lockstep: за день — один набор операций NumPy
+    над всеми путями.
+    От пути зависят только ставки (кривая, перекат по ней, решения
+    оптимизатора), поэтому:
+      - сроки, даты выплат/погашений портфеля и свопов общие — [n];
+      - ставки портфеля — [K, n_contracts];
+      - номиналы и ставки свопов — [K, n_swaps];
+      - счета — [K].
+    Ребалансировка — по пути: optimizer.rebalance_once видит кривую пути k.
+    Решение в 0 у части путей даёт своп с нулевым номиналом (слот общий);
+    слот не заводится, только если решение нулевое на всех путях.
+    При K=1 результат совпадает с HedgeEngine(portfolio, gcurve) бит в бит.
+    Кривая — gcurve.batch(K): шоки [K, len(TERMS)] из копии генератора gcurve.
+    """
+
+    def __init__(self, portfolio: Portfolio, gcurve: GCurve | None = None, n_paths: int = 1,
+                 swap_capacity: int = 16):
+        if gcurve is None:
+            base = {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}
+            gcurve = GCurve(portfolio.T0, base)
+        K = int(n_paths)
+        self.n_paths = K
+        self.portfolio = portfolio
+        self.curve = gcurve.batch(K)
+        self.t0 = portfolio.T0
+        self.t_curr = self.t0
+        self.days_since_quarter_start = 0
+        self.bank_account = np.zeros(K)
+        self.swap_account = np.zeros(K)
+        self.accrued_swap = np.zeros(K)
+        self.rebalance_kwargs = {}
+
+        # портфель: общие колонки + ставки по путям
+        p = portfolio
+        self.sign = p.sign
+        self.volume = p.volume
+        self.contract_months = p.contract_months
+        self.remaining_months = p.remaining_months.copy()
+        self.start_ord = p.start_ord.copy()
+        self.next_payout_ord = p.next_payout_ord.copy()
+        self.maturity_ord = p.maturity_ord.copy()
+        self.rate = np.tile(p.rate, (K, 1))
+
+        # свопы: общие сроки/даты, номиналы и ставки по путям
+        self.n_swaps = 0
+        cap = max(int(swap_capacity), 1)
+        self._swap_shared = {"term_months": np.zeros(cap, dtype=np.int64),
+                             "remaining_months": np.zeros(cap),
+                             "start_ord": np.zeros(cap, dtype=ORD_DTYPE),
+                             "maturity_ord": np.zeros(cap, dtype=ORD_DTYPE)}
+        self._swap_path = {"sign": np.zeros((K, cap), dtype=np.int8),
+                           "notional": np.zeros((K, cap)),
+                           "fixed_rate": np.zeros((K, cap)),
+                           "float_rate_q": np.zeros((K, cap))}
+
+    def swap_column(self, name: str) -> np.ndarray:
+        """Заполненная часть колонки свопов: общая [n_swaps] или по путям [K, n_swaps]."""
+        if name in self._swap_shared:
+            return self._swap_shared[name][:self.n_swaps]
+        return self._swap_path[name][:, :self.n_swaps]
+
+    def swaps_count(self) -> np.ndarray:
+        """Число свопов с ненулевым номиналом по путям [K]."""
+        return (self.swap_column("notional") != 0).sum(axis=1)
+
+    # ---------------- дневной шаг ---------------------------------------------
+
+    def step(self, days: int = 1):
+        phase = profiler.phase
+        for _ in range(days):
+            with phase("swap_accrual"):
+                self.accrued_swap += self.daily_net()
+                self.swap_account *= (1.0 + self.curve.rate_overnight() / 365.0)
+
+            t_ord = self.t_curr.toordinal()
+            with phase("portfolio_cashflows"):
+                self.bank_account += self._pay_coupons(t_ord)
+                self.remaining_months -= 1.0 / DAYS_PER_MONTH
+            with phase("portfolio_rollover"):
+                self.bank_account += self._rollover(t_ord)
+
+            with phase("swap_rollover"):
+                self._age_swaps_and_rollover(t_ord)
+            with phase("quarterly_settle"):
+                self._quarterly_settle()
+
+            self.bank_account *= (1.0 + self.curve.rate_overnight() / 365.0)
+            with phase("gcurve_step"):
+                self.curve.step()
+            self.t_curr += timedelta(days=1)
+
+    def daily_net(self) -> np.ndarray:
+        """Чистое дневное начисление по свопам для каждого пути [K]."""
+        if self.n_swaps == 0:
+            return np.zeros(self.n_paths)
+        exposure = self.swap_column("sign") * self.swap_column("notional")
+        spread = self.swap_column("fixed_rate") - self.swap_column("float_rate_q")
+        return (exposure * spread).sum(axis=1) / 365.0
+
+    def _signed_coupon(self, mask) -> np.ndarray:
+        coupon = self.volume[mask] * self.rate[:, mask] / 12.0
+        sign = self.sign[mask]
+        return coupon[:, sign == LOAN].sum(axis=1) - coupon[:, sign == DEPOSIT].sum(axis=1)
+
+    def _pay_coupons(self, t_ord: int):
+        due = self.next_payout_ord <= t_ord
+        if not due.any():
+            return 0.0
+        cash = self._signed_coupon(due)
+        self.next_payout_ord[due] = add_months(self.next_payout_ord[due], 1)
+        return cash
+
+    def _rollover(self, t_ord: int):
+        matured = np.flatnonzero(self.remaining_months <= 0)
+        if matured.size == 0:
+            return 0.0
+        sign = self.sign[matured]
+        cash = (sign * self.volume[matured] * (self.rate[:, matured] / 12)).sum(axis=1)
+        terms = self.contract_months[matured]
+        for term in np.unique(terms):
+            cols = matured[terms == term]
+            self.rate[:, cols] = self.curve.rate(int(term))[:, None]
+        self.start_ord[matured] = t_ord
+        self.maturity_ord[matured] = add_months(np.full(matured.size, t_ord), terms)
+        self.remaining_months[matured] = terms.astype(float)
+        return cash
+
+    def _age_swaps_and_rollover(self, t_ord: int):
+        if self.n_swaps == 0:
+            return
+        remaining = self.swap_column("remaining_months")
+        remaining -= 1.0 / DAYS_PER_MONTH
+        matured = np.flatnonzero(remaining <= 0)
+        if matured.size == 0:
+            return
+        terms = self.swap_column("term_months")[matured]
+        fixed = self._swap_path["fixed_rate"]
+        for term in np.unique(terms):
+            fixed[:, matured[terms == term]] = self.curve.rate(int(term))[:, None]
+        self._swap_path["float_rate_q"][:, matured] = self.curve.rate(SWAP_FLOAT_TERM)[:, None]
+        shared = self._swap_shared
+        shared["start_ord"][matured] = t_ord
+        shared["maturity_ord"][matured] = add_months(np.full(matured.size, t_ord), terms)
+        remaining[matured] = terms.astype(float)
+
+    # ---------------- клиринг квартала ----------------------------------------
+
+    def _quarterly_settle(self):
+        self.days_since_quarter_start += 1
+        if self.days_since_quarter_start < QUARTER_LEN_DAYS:
+            return
+        if hasattr(self, "optimizer") and callable(getattr(self.optimizer, "rebalance_once", None)):
+            decisions = [self.optimizer.rebalance_once(self._path_view(k), **self.rebalance_kwargs)
+                         for k in range(self.n_paths)]
+            x = np.array([[d.x_6, d.x_12, d.x_24] for d in decisions])
+            for j, term in enumerate((6, 12, 24)):
+                if (x[:, j] != 0).any():
+                    self.add_swap(term, x[:, j])
+        self.swap_account += self.accrued_swap
+        self.accrued_swap[:] = 0.0
+        if self.n_swaps:
+            self._swap_path["float_rate_q"][:, :self.n_swaps] = self.curve.rate(SWAP_FLOAT_TERM)[:, None]
+        self.days_since_quarter_start = 0
+
+    def _path_view(self, k: int):
+        """То, что читает optimizer.rebalance_once: portfolio.V и кривая пути k."""
+        return SimpleNamespace(portfolio=self.portfolio, gcurve=self.curve.path(k))
+
+    def _reserve_swaps(self, n: int) -> None:
+        cap = self._swap_shared["term_months"].size
+        if n <= cap:
+            return
+        while cap < n:
+            cap *= 2
+        for name, arr in self._swap_shared.items():
+            grown = np.zeros(cap, dtype=arr.dtype)
+            grown[:self.n_swaps] = arr[:self.n_swaps]
+            self._swap_shared[name] = grown
+        for name, arr in self._swap_path.items():
+            grown = np.zeros((self.n_paths, cap), dtype=arr.dtype)
+            grown[:, :self.n_swaps] = arr[:, :self.n_swaps]
+            self._swap_path[name] = grown
+
+    def add_swap(self, term_months: int, notional) -> None:
+        """
+        Своп term_months на всех путях: notional [K] со знаком
+        (> 0 — receive_fixed, иначе pay_fixed; 0 — путь без свопа).
+        """
+        notional = np.broadcast_to(np.asarray(notional, dtype=float), (self.n_paths,))
+        self._reserve_swaps(self.n_swaps + 1)
+        i = self.n_swaps
+        t_ord = self.t_curr.toordinal()
+        shared, path = self._swap_shared, self._swap_path
+        shared["term_months"][i] = term_months
+        shared["remaining_months"][i] = float(term_months)
+        shared["start_ord"][i] = t_ord
+        shared["maturity_ord"][i] = add_months(t_ord, int(term_months))
+        path["sign"][:, i] = np.where(notional > 0, 1, -1)
+        path["notional"][:, i] = np.abs(notional)
+        path["fixed_rate"][:, i] = self.curve.rate(term_months)
+        path["float_rate_q"][:, i] = self.curve.rate(SWAP_FLOAT_TERM)
+        self.n_swaps += 1
+
+    def snapshot_state(self) -> dict:
+        vr_loan = self.rate[:, self.sign == LOAN] @ self.volume[self.sign == LOAN].astype(float)
+        vr_dep = self.rate[:, self.sign == DEPOSIT] @ self.volume[self.sign == DEPOSIT].astype(float)
+        return {
+            "date": self.t_curr,
+            "bank_account": self.bank_account.copy(),
+            "swap_account": self.swap_account.copy(),
+            "accrued_swap": self.accrued_swap.copy(),
+            "gcurve": self.curve.current.copy(),
+            "portfolio_loan_vr": vr_loan,
+            "portfolio_deposit_vr": vr_dep,
+            "swaps_count": self.swaps_count(),
+        }
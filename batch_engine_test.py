@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+
+import optimizer
+from batch_engine import BatchHedgeEngine
+from engine import HedgeEngine, QUARTER_LEN_DAYS
+from gcurve import GCurve, TERMS
+from portfolio import Portfolio
+
+BASE = {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}
+
+
+class TestBatchEngine(unittest.TestCase):
+    def _hedged(self, engine):
+        engine.optimizer = optimizer
+        engine.rebalance_kwargs = {"levels": 3, "branch": 3, "seed": 0}
+        return engine
+
+    def test_single_path_reproduces_hedge_engine(self):
+        p = Portfolio(N_C=25, N_D=25, V=100000, seed=2)
+        ref = self._hedged(HedgeEngine(p.fork(), GCurve(p.T0, BASE, seed=9)))
+        batch = self._hedged(BatchHedgeEngine(p, GCurve(p.T0, BASE, seed=9), n_paths=1))
+        ref.add_swap("pay_fixed", 12, 20000)
+        batch.add_swap(12, -20000)
+        days = 2 * QUARTER_LEN_DAYS + 40
+        ref.step(days)
+        batch.step(days)
+        self.assertEqual(batch.t_curr, ref.t_curr)
+        for attr in ("bank_account", "swap_account", "accrued_swap"):
+            self.assertEqual(getattr(batch, attr)[0], getattr(ref, attr), attr)
+        self.assertEqual(batch.rate[0].tolist(), ref.portfolio.rate.tolist())
+        self.assertEqual(batch.swaps_count()[0], len(ref.swap_book))
+        self.assertEqual(batch.swap_column("fixed_rate")[0].tolist(), ref.swap_book.fixed_rate.tolist())
+        self.assertEqual(batch.curve.current[0].tolist(), [ref.gcurve.current[m] for m in TERMS])
+
+    def test_each_path_matches_replayed_engine(self):
+        p = Portfolio(N_C=15, N_D=15, V=100000, seed=5)
+        K, days = 4, QUARTER_LEN_DAYS + 30
+        batch = self._hedged(BatchHedgeEngine(p, GCurve(p.T0, BASE, seed=1), n_paths=K))
+        path = np.empty((K, days, len(TERMS)))
+        for d in range(days):
+            batch.step()
+            path[:, d] = batch.curve.current
+        self.assertGreater(np.ptp(batch.bank_account), 0.0)     # пути различаются
+        for k in range(K):
+            g = GCurve(p.T0, BASE).replay(path[k])
+            e = self._hedged(HedgeEngine(p.fork(), g))
+            e.step(days)
+            for attr in ("bank_account", "swap_account", "accrued_swap"):
+                a, b = getattr(batch, attr)[k], getattr(e, attr)
+                self.assertLess(abs(a - b), 1e-9 * max(1.0, abs(b)), (k, attr))
+            self.assertEqual(batch.swaps_count()[k], len(e.swap_book))
+
+
+if __name__ == "__main__":
+    unittest.main()
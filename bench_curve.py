@@ -1,4 +1,3 @@
-from copy import deepcopy
 from statistics import mean
 import numpy as np
 from gcurve import GCurve
@@ -13,16 +12,14 @@ V    = 1_000_000   # суммарный объём кредитов / депоз
 SEED = 42
 DAYS_PER_MONTH = 365.25 / 12
 
-portfolio = Portfolio(N_C=N_C, N_D=N_D, V=V)
-
 def bench_engine(portfolio, days=365):
     base = {0:0.09,3:0.095,6:0.10,12:0.105,24:0.11}
 
     gc = GCurve(portfolio.T0, base, seed=42)
-    en_g = HedgeEngine(deepcopy(portfolio), gcurve=gc); en_g.enable_rebalance = False
+    en_g = HedgeEngine(portfolio.fork(), gcurve=gc); en_g.enable_rebalance = False
 
     ns = NSCurve(portfolio.T0, base_points=base, seed=42)
-    en_n = HedgeEngine(deepcopy(portfolio), gcurve=ns); en_n.enable_rebalance = False
+    en_n = HedgeEngine(portfolio.fork(), gcurve=ns); en_n.enable_rebalance = False
 
     pnl_g, pnl_n = [], []
     for _ in range(days):
@@ -59,4 +56,7 @@ def bench_engine(portfolio, days=365):
         "NS_CVaR95_q": cvar_quarterly(pnl_n),
     }
 
-print(bench_engine(portfolio))
+if __name__ == "__main__":
+    # полный набор бенчмарков — bench_suite.py
+    portfolio = Portfolio(N_C=N_C, N_D=N_D, V=V)
+    print(bench_engine(portfolio))
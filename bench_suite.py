@@ -0,0 +1,200 @@
+# bench_suite.py
+"""
+Набор бенчмарков с параметрами по размеру портфеля и книги свопов.
+
+    python bench_suite.py run --out base.json             # полный прогон (до 1e6 контрактов)
+    python bench_suite.py run --quick --only engine_step  # быстрый, только часть
+    python bench_suite.py compare base.json new.json --threshold 0.2
+
+Для каждого случая — время (лучшее из repeat), пиковая память (tracemalloc,
+отдельным прогоном) и ops/sec; compare отмечает случаи, ставшие медленнее
+более чем на threshold (код выхода 1).
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+from engine import HedgeEngine
+from gcurve import GCurve
+from optimizer import Decision, grid_search_cvar, simulate_terminal_pnl, unit_grid
+from portfolio import Portfolio
+from scenarios import build_tree_arrays
+from streaming import stream_grid_search_cvar
+
+BASE = {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}
+SIZES = [100, 10_000, 1_000_000]
+QUICK_SIZES = [100, 10_000]
+SWAP_SIZES = [0, 100]
+TREES = [(4, 5), (5, 5), (6, 10)]
+
+
+def _portfolio(n: int) -> Portfolio:
+    return Portfolio(N_C=n // 2, N_D=n - n // 2, V=1_000_000, seed=0, compact=n >= 1_000_000)
+
+
+def bench_portfolio_build(sizes):
+    for n in sizes:
+        yield {"contracts": n}, (lambda n=n: _portfolio(n)), n
+
+
+def bench_engine_step(sizes, days=365):
+    for n in sizes:
+        p = _portfolio(n)
+        for swaps in SWAP_SIZES:
+            def run(p=p, swaps=swaps):
+                e = HedgeEngine(p.fork(), GCurve(p.T0, BASE, seed=0))
+                for i in range(swaps):
+                    e.add_swap("pay_fixed" if i % 2 else "receive_fixed", (6, 12, 24)[i % 3], 1000.0)
+                e.step(days)
+            yield {"contracts": n, "swaps": swaps, "days": days}, run, days
+
+
+def bench_build_tree(sizes):
+    g = GCurve(Portfolio.T0, BASE)
+    for levels, branch in TREES:
+        n_nodes = sum(branch ** L for L in range(levels))
+        yield ({"levels": levels, "branch": branch},
+               (lambda levels=levels, branch=branch: build_tree_arrays(g, levels, branch, seed=0)), n_nodes)
+
+
+def bench_terminal_pnl(sizes):
+    g = GCurve(Portfolio.T0, BASE)
+    for levels, branch in TREES:
+        tree = build_tree_arrays(g, levels, branch, seed=0)
+        decision = Decision(1e5, -1e5, 5e4)
+        yield ({"levels": levels, "branch": branch},
+               (lambda tree=tree: simulate_terminal_pnl(tree, decision, 1e5)), tree.n_leaves)
+
+
+def bench_grid_search(sizes):
+    g = GCurve(Portfolio.T0, BASE)
+    for levels, branch in TREES[:2]:
+        tree = build_tree_arrays(g, levels, branch, seed=0)
+        yield ({"levels": levels, "branch": branch},
+               (lambda tree=tree: grid_search_cvar(tree, 1e5)), len(unit_grid(2)))
+
+
+def bench_stream_grid(sizes):
+    g = GCurve(Portfolio.T0, BASE)
+    for levels, branch in TREES:
+        yield ({"levels": levels, "branch": branch},
+               (lambda levels=levels, branch=branch: stream_grid_search_cvar(g, 1e5, levels, branch, seed=0)),
+               branch ** (levels - 1))
+
+
+def bench_curve_step(sizes, days=365):
+    curves = {"GCurve": lambda: GCurve(Portfolio.T0, BASE, seed=0)}
+    try:
+        from gcurve_ns import NSCurve
+        curves["NSCurve"] = lambda: NSCurve(Portfolio.T0, base_points=BASE, seed=0)
+    except ImportError:
+        pass
+    for name, make in curves.items():
+        yield {"curve": name, "days": days}, (lambda make=make: make().step(days)), days
+
+
+BENCHMARKS = {
+    "portfolio_build": bench_portfolio_build,
+    "engine_step": bench_engine_step,
+    "build_tree": bench_build_tree,
+    "terminal_pnl": bench_terminal_pnl,
+    "grid_search": bench_grid_search,
+    "stream_grid": bench_stream_grid,
+    "curve_step": bench_curve_step,
+}
+
+
+def case_key(name: str, params: dict) -> str:
+    return name + "[" + ",".join(f"{k}={v}" for k, v in params.items()) + "]"
+
+
+def measure(fn, ops: int, repeat: int = 3) -> dict:
+    """Лучшее время из repeat, пиковая память — отдельным прогоном под tracemalloc."""
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    best = min(times)
+    return {"seconds": best, "peak_mb": peak / 2 ** 20, "ops": ops, "ops_per_sec": ops / best if best else float("inf")}
+
+
+def run(only=None, sizes=None, repeat: int = 3, log=None) -> dict:
+    """{"meta": ..., "results": {case: metrics}} по всем (или only) бенчмаркам."""
+    sizes = sizes or SIZES
+    results = {}
+    for name, bench in BENCHMARKS.items():
+        if only and not any(name.startswith(o) for o in only):
+            continue
+        for params, fn, ops in bench(sizes):
+            key = case_key(name, params)
+            results[key] = dict(measure(fn, ops, repeat), benchmark=name, params=params)
+            if log is not None:
+                r = results[key]
+                log(f"{key:60s} {r['seconds'] * 1e3:10.2f} ms {r['peak_mb']:9.1f} MB {r['ops_per_sec']:14.0f} ops/s")
+    meta = {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "numpy": np.__version__, "machine": platform.machine()}
+    return {"meta": meta, "results": results}
+
+
+def compare(base: dict, new: dict, threshold: float = 0.2) -> list[dict]:
+    """Случаи из обоих прогонов; regression=True, если время выросло больше чем на threshold."""
+    rows = []
+    for key, b in base["results"].items():
+        n = new["results"].get(key)
+        if n is None:
+            continue
+        ratio = n["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+        rows.append({"case": key, "base_s": b["seconds"], "new_s": n["seconds"], "ratio": ratio,
+                     "peak_mb_base": b["peak_mb"], "peak_mb_new": n["peak_mb"],
+                     "regression": ratio > 1.0 + threshold})
+    return rows
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="hedging benchmark suite")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("run")
+    r.add_argument("--out", default=None, help="JSON-файл результатов (baseline)")
+    r.add_argument("--only", nargs="*", default=None, help=f"префиксы из {list(BENCHMARKS)}")
+    r.add_argument("--quick", action="store_true", help=f"размеры {QUICK_SIZES} вместо {SIZES}")
+    r.add_argument("--repeat", type=int, default=3)
+    c = sub.add_parser("compare")
+    c.add_argument("base")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.2)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "run":
+        report = run(args.only, QUICK_SIZES if args.quick else SIZES, args.repeat, log=print)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(report, f, indent=2)
+        return 0
+
+    rows = compare(_load(args.base), _load(args.new), args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['case']:60s} {row['base_s'] * 1e3:10.2f} -> {row['new_s'] * 1e3:10.2f} ms x{row['ratio']:.2f} {flag}")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+import json
+import os
+import tempfile
+import unittest
+
+import bench_suite
+
+
+class TestBenchSuite(unittest.TestCase):
+    def test_run_reports_metrics(self):
+        report = bench_suite.run(only=["portfolio_build", "build_tree"], sizes=[100], repeat=1)
+        res = report["results"]
+        self.assertIn("portfolio_build[contracts=100]", res)
+        self.assertIn("build_tree[levels=4,branch=5]", res)
+        for r in res.values():
+            self.assertGreater(r["seconds"], 0.0)
+            self.assertGreaterEqual(r["peak_mb"], 0.0)
+            self.assertAlmostEqual(r["ops_per_sec"], r["ops"] / r["seconds"])
+        json.dumps(report)
+
+    def test_compare_flags_regressions(self):
+        def report(**seconds):
+            return {"results": {k: {"seconds": v, "peak_mb": 1.0} for k, v in seconds.items()}}
+        base = report(a=1.0, b=1.0, c=1.0)
+        new = report(a=1.1, b=1.5, d=9.0)
+        rows = {r["case"]: r for r in bench_suite.compare(base, new, threshold=0.2)}
+        self.assertEqual(set(rows), {"a", "b"})
+        self.assertFalse(rows["a"]["regression"])
+        self.assertTrue(rows["b"]["regression"])
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = [os.path.join(tmp, n) for n in ("base.json", "new.json")]
+            for path, r in zip(paths, (base, new)):
+                with open(path, "w") as f:
+                    json.dump(r, f)
+            self.assertEqual(bench_suite.main(["compare", *paths, "--threshold", "0.6"]), 0)
+            self.assertEqual(bench_suite.main(["compare", *paths]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
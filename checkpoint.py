@@ -0,0 +1,65 @@
+# checkpoint.py
+import io
+import json
+
+import numpy as np
+
+FORMAT_VERSION = 1
+_META_KEY = "__meta__"
+_GENERATOR_KEY = "__generator__"
+
+
+def generator_from_state(state: dict) -> np.random.Generator:
+    """np.random.Generator с тем же bit_generator и состоянием (bit_generator.state)."""
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def dump_kwargs(kwargs: dict) -> dict:
+    """
+    rebalance_kwargs в JSON-совместимый вид: Generator — его
+    bit_generator.state, скаляры numpy — .item(). Остальное (RollingTree,
+    DecisionCache, AdaptiveSizing...) не сохраняется — ValueError с ключом.
+    """
+    out = {}
+    for key, value in kwargs.items():
+        if isinstance(value, np.random.Generator):
+            value = {_GENERATOR_KEY: value.bit_generator.state}
+        elif isinstance(value, np.generic):
+            value = value.item()
+        try:
+            json.dumps(value)
+        except TypeError:
+            raise ValueError(f"rebalance_kwargs[{key!r}]: {type(value).__name__} "
+                             f"cannot be checkpointed") from None
+        out[key] = value
+    return out
+
+
+def load_kwargs(data: dict) -> dict:
+    """Обратное к dump_kwargs: Generator восстанавливается с тем же состоянием."""
+    return {key: generator_from_state(value[_GENERATOR_KEY])
+            if isinstance(value, dict) and _GENERATOR_KEY in value else value
+            for key, value in data.items()}
+
+
+def pack(arrays: dict, meta: dict) -> bytes:
+    """
+    Бинарный снимок: несжатый .npz — буферы массивов как есть, скаляры
+    и состояния генераторов — JSON в отдельной uint8-записи.
+    """
+    meta = dict(meta, format_version=FORMAT_VERSION)
+    blob = np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8)
+    buf = io.BytesIO()
+    np.savez(buf, **{_META_KEY: blob}, **arrays)
+    return buf.getvalue()
+
+
+def unpack(data: bytes) -> tuple[dict, dict]:
+    with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+        arrays = {name: npz[name] for name in npz.files if name != _META_KEY}
+        meta = json.loads(npz[_META_KEY].tobytes().decode())
+    if meta.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"unsupported checkpoint format {meta.get('format_version')!r}")
+    return arrays, meta
@@ -0,0 +1,80 @@
+# dates.py
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+ORD_DTYPE = np.int32             # даты — порядковые номера дней (date.toordinal())
+HORIZON = (date(2000, 1, 1), date(2100, 12, 31))
+
+_EPOCH_ORD = date(1970, 1, 1).toordinal()
+
+
+def _build_tables(first: date, last: date):
+    """
+        Таблицы на горизонт: для каждого дня — номер месяца и день месяца (с 0),
+        для каждого месяца — первый день и длина.
+    """
+    months = np.arange(np.datetime64(first, "M"), np.datetime64(last, "M") + 25)
+    month_start = months.astype("datetime64[D]")
+    month_len = ((months + 1).astype("datetime64[D]") - month_start).astype(ORD_DTYPE)
+    days = np.arange(np.datetime64(first, "D"), np.datetime64(last, "D") + 1)
+    month_idx = (days.astype("datetime64[M]") - months[0]).astype(ORD_DTYPE)
+    day_of_month = (days - month_start[month_idx]).astype(np.int8)
+    month_start_ord = (month_start.astype(np.int64) + _EPOCH_ORD).astype(ORD_DTYPE)
+    return month_idx, day_of_month, month_start_ord, month_len
+
+
+_FIRST_ORD = HORIZON[0].toordinal()
+_LAST_ORD = HORIZON[1].toordinal()
+_MONTH_IDX, _DAY_OF_MONTH, _MONTH_START, _MONTH_LEN = _build_tables(*HORIZON)
+# таблица месяцев продолжена на 2 года вперёд, поэтому сдвиг до +24 месяцев не выходит за неё
+_MAX_SHIFT = len(_MONTH_START) - 1 - int(_MONTH_IDX[-1])
+
+
+def to_ordinals(values) -> np.ndarray:
+    """
+        Даты (datetime / datetime64 / Series) -> порядковые номера дней (date.toordinal()).
+    """
+    d = pd.to_datetime(pd.Series(values)).dt.normalize()
+    return (d.to_numpy(dtype="datetime64[D]").astype(np.int64) + _EPOCH_ORD).astype(ORD_DTYPE)
+
+
+def from_ordinals(ordinals) -> np.ndarray:
+    """
+        Порядковые номера дней -> datetime64[ns].
+    """
+    days = np.asarray(ordinals, dtype=np.int64) - _EPOCH_ORD
+    return days.astype("datetime64[D]").astype("datetime64[ns]")
+
+
+def _add_months_datetime64(ordinals: np.ndarray, months: np.ndarray) -> np.ndarray:
+    d = (ordinals - _EPOCH_ORD).astype("datetime64[D]")
+    month = d.astype("datetime64[M]")
+    day = (d - month.astype("datetime64[D]")).astype(np.int64)
+    target = month + months
+    first = target.astype("datetime64[D]")
+    days_in_month = ((target + 1).astype("datetime64[D]") - first).astype(np.int64)
+    res = first + np.minimum(day, days_in_month - 1)
+    return res.astype(np.int64) + _EPOCH_ORD
+
+
+def add_months(ordinals, months) -> np.ndarray:
+    """
+        Векторный аналог d + relativedelta(months=k): день месяца
+        обрезается по концу целевого месяца (31.01 + 1м = 28.02).
+        Внутри HORIZON — два обращения к таблицам, вне — арифметика datetime64.
+    """
+    ords = np.asarray(ordinals, dtype=np.int64)
+    months = np.asarray(months, dtype=np.int64)
+    ords, months = np.broadcast_arrays(ords, months)
+    if ords.size == 0:
+        return ords.astype(ORD_DTYPE)
+    i = ords - _FIRST_ORD
+    inside = (ords >= _FIRST_ORD) & (ords <= _LAST_ORD)
+    if inside.all():
+        m = _MONTH_IDX[i] + months
+        if m.min() >= 0 and months.max() <= _MAX_SHIFT:
+            return (_MONTH_START[m] + np.minimum(_DAY_OF_MONTH[i], _MONTH_LEN[m] - 1)).astype(ORD_DTYPE)
+    return _add_months_datetime64(ords, months).astype(ORD_DTYPE)
+
@@ -0,0 +1,35 @@
+import unittest
+from datetime import date, timedelta
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+import dates
+from dates import add_months, from_ordinals, to_ordinals
+
+
+class TestDates(unittest.TestCase):
+    def test_add_months_matches_relativedelta_over_horizon(self):
+        first, last = dates.HORIZON
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        ords = np.array([d.toordinal() for d in days])
+        for k in (-24, -12, -3, -1, 1, 3, 6, 12, 24):
+            got = add_months(ords, k)
+            exp = np.array([(d + relativedelta(months=k)).toordinal() for d in days])
+            self.assertTrue((got == exp).all(), k)
+            self.assertEqual(got.dtype, dates.ORD_DTYPE)
+
+    def test_add_months_outside_table(self):
+        days = [date(1899, 12, 31), date(1999, 1, 31), date(2100, 12, 31), date(2300, 2, 28)]
+        ords = np.array([d.toordinal() for d in days])
+        for k in (-25, 1, 30, 1200):
+            exp = [(d + relativedelta(months=k)).toordinal() for d in days]
+            self.assertEqual(add_months(ords, k).tolist(), exp)
+
+    def test_per_element_months_and_roundtrip(self):
+        ords = np.full(3, date(2016, 1, 31).toordinal())
+        got = add_months(ords, np.array([1, 2, 13]))
+        self.assertEqual([date.fromordinal(int(o)) for o in got],
+                         [date(2016, 2, 29), date(2016, 3, 31), date(2017, 2, 28)])
+        back = to_ordinals(from_ordinals(got))
+        self.assertTrue((back == got).all())
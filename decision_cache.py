@@ -0,0 +1,87 @@
+# decision_cache.py
+import os
+import pickle
+from collections import OrderedDict
+
+from gcurve import TERMS
+
+
+class DecisionCache:
+    """
+    LRU-кеш решений rebalance_once. Ключ — кривая, квантованная с шагом
+    quantum (по умолчанию 1 б.п.), плюс параметры дерева и оптимизатора.
+    Значение — (x_6, x_12, x_24) в номиналах.
+    path — файл для сохранения между запусками (pickle): читается при
+    создании, пишется через save().
+    """
+
+    def __init__(self, maxsize: int = 4096, quantum: float = 1e-4, path: str | None = None):
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = int(maxsize)
+        self.quantum = float(quantum)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._fresh = {}
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._data)
+
+    def key(self, snapshot: dict, **params) -> tuple:
+        curve = tuple(int(round(float(snapshot[m]) / self.quantum)) for m in TERMS)
+        return curve + tuple(sorted(params.items()))
+
+    def get(self, key):
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value) -> None:
+        self._insert(key, value)
+        self._fresh[key] = value
+
+    def update(self, entries: dict) -> None:
+        """Слияние чужих записей (не считаются «свежими» для pop_fresh)."""
+        for key, value in entries.items():
+            self._insert(key, value)
+
+    def _insert(self, key, value) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop_fresh(self) -> dict:
+        """Записи, добавленные после прошлого вызова (для слияния кешей воркеров)."""
+        fresh, self._fresh = self._fresh, {}
+        return fresh
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
+
+    def save(self, path: str | None = None) -> None:
+        path = path or self.path
+        if path is None:
+            raise ValueError("no path to save the decision cache to")
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump({"quantum": self.quantum, "entries": list(self._data.items())}, f)
+        os.replace(tmp, path)
+
+    def load(self, path: str | None = None) -> None:
+        path = path or self.path
+        with open(path, "rb") as f:
+            state = pickle.load(f)
+        if state["quantum"] != self.quantum:
+            raise ValueError(f"cache {path} was built with quantum={state['quantum']}, not {self.quantum}")
+        self.update(dict(state["entries"]))
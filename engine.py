@@ -1,9 +1,19 @@
+import copy
+import importlib
+import os
+import types
+
 import pandas as pd
 from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
 
+import checkpoint
+
+from decision_cache import DecisionCache
 from portfolio import Portfolio
-from gcurve import GCurve
+from gcurve import GCurve, curve_from_state
+from events import EventCalendar
+from swapbook import SwapBook
+from profiling import profiler
 import optimizer
 
 DAYS_PER_MONTH = 365.25 / 12
@@ -12,6 +22,9 @@ SWAP_FLOAT_TERM = 3
 
 class HedgeEngine:
     t0 = datetime(2016, 12, 31)
+    # скалярное состояние движка, сохраняемое checkpoint()
+    _STATE_FIELDS = ("bank_account", "days_since_quarter_start", "days_since_month_start",
+                     "swap_account", "accrued_swap", "accumulating_account", "_swap_id")
 
     def __init__(self, portfolio: Portfolio, gcurve: GCurve | None = None):
         self.portfolio = portfolio
@@ -28,87 +41,176 @@ class HedgeEngine:
         self.swap_account = 0.0
         self.accrued_swap = 0.0
         self.accumulating_account = 0
+        self.rebalance_kwargs = {}       # доп. параметры для optimizer.rebalance_once
+        self.recorder = None             # recorder.Recorder: дневной ряд состояния
 
-        self.swaps = pd.DataFrame(columns=[
-            "id", "direction", "notional",
-            "term_months", "remaining_months",
-            "fixed_rate", "float_rate_q",
-            "start_date", "maturity_date"
-        ])
+        self.swap_book = SwapBook()
         self._swap_id = 1
+
+    @property
+    def swaps(self) -> pd.DataFrame:
+        """DataFrame-представление книги свопов (только для чтения)."""
+        return self.swap_book.to_frame()
     
     def step(self, days: int = 1):
+        phase = profiler.phase
         for _ in range(days):
-            self._accrue_swaps_one_day() 
-
-            portfolio_df = self.portfolio.get_portfolio()
-
-            if "next_payout_date" not in portfolio_df.columns:
-                portfolio_df["next_payout_date"] = portfolio_df["start_date"].apply(
-                    lambda d: d + relativedelta(months=+1)
-                )
-
-            due_mask = portfolio_df["next_payout_date"] <= self.t_curr
-            if due_mask.any():
-                due = portfolio_df.loc[due_mask]
-
-                cash_loans = (due.loc[due["type"] == "loan",    "volume"]
-                            * due.loc[due["type"] == "loan",    "rate"] / 12.0).sum()
-                cash_deps  = (due.loc[due["type"] == "deposit", "volume"]
-                            * due.loc[due["type"] == "deposit", "rate"] / 12.0).sum()
-
-                self.bank_account += float(cash_loans - cash_deps)
-
-                portfolio_df.loc[due_mask, "next_payout_date"] = portfolio_df.loc[
-                    due_mask, "next_payout_date"
-                ].apply(lambda d: d + relativedelta(months=+1))
-
-            portfolio_df.loc[:, "remaining_months"] = portfolio_df["remaining_months"] - (1.0 / DAYS_PER_MONTH)
-
-            matured_idx = portfolio_df.index[portfolio_df["remaining_months"] <= 0].tolist()
-            if matured_idx:
-                for idx in matured_idx:
-                    row = portfolio_df.loc[idx]
-                    term = int(row["contract_months"])
-                    rate = row["rate"]
-                    volume = row["volume"]
-                    monthly_rate = rate / 12
-                    type  = row["type"]
-                    if (type == "loan"):
-                        self.bank_account += volume * monthly_rate
-                    elif (type == "deposit"):
-                        self.bank_account -= volume * monthly_rate
-
-                    new_rate = float(self.gcurve.rate(term))
-                    portfolio_df.at[idx, "start_date"] = self.t_curr
-                    portfolio_df.at[idx, "maturity_date"] = self.t_curr + relativedelta(months=term)
-                    portfolio_df.at[idx, "remaining_months"] = float(term)
-                    portfolio_df.at[idx, "rate"] = new_rate
-                    portfolio_df.at[idx, "type"] = type
-
-            self.portfolio.set_portfolio(portfolio_df)         
-            self._age_swaps_and_rollover()    
-            self._quarterly_settle()
+            with phase("swap_accrual"):
+                self._accrue_swaps_one_day() 
+
+            # купоны, старение и перекат портфеля — векторно по колонкам
+            t_ord = self.t_curr.toordinal()
+            with phase("portfolio_cashflows"):
+                self.bank_account += self.portfolio.pay_coupons(t_ord)
+                self.portfolio.age()
+            with phase("portfolio_rollover"):
+                self.bank_account += self.portfolio.rollover(t_ord, self.gcurve.rate)
+
+            with phase("swap_rollover"):
+                self._age_swaps_and_rollover()    
+            with phase("quarterly_settle"):
+                self._quarterly_settle()
 
             # овернайт на остаток текущего дня
             rate_over_night = self.gcurve.rate_overnight()
             self.bank_account *= (1.0 + rate_over_night / 365.0)
             # сдвиг на день
-            self.gcurve.step()
+            with phase("gcurve_step"):
+                self.gcurve.step()
             self.t_curr += timedelta(days=1)
-            
-            
+            if self.recorder is not None:
+                self.recorder.record(self)
+
+
+    def advance(self, days: int = 1):
+        """
+        Событийный аналог step(days): полный дневной шаг выполняется только
+        в дни выплат, погашений, перекатов свопов и клиринга квартала.
+        Между событиями овернайт по bank_account/swap_account наращивается
+        одним произведением, accrued_swap — n * daily_net, сроки стареют
+        одним вычитанием. Расхождение с step() — только округление:
+        относительно ~1e-15 за год (engine_test проверяет < 1e-13).
+        С подключённым recorder нужен каждый день — считается через step().
+        """
+        if self.recorder is not None:
+            return self.step(days)
+        calendar = EventCalendar.from_engine(self)
+        t_ord = self.t_curr.toordinal()
+        end_ord = t_ord + days
+        while t_ord < end_ord:
+            next_ord = calendar.peek()
+            next_ord = end_ord if next_ord is None else min(max(next_ord, t_ord), end_ord)
+            if next_ord > t_ord:
+                self._skip_quiet_days(next_ord - t_ord)
+                t_ord = next_ord
+                if t_ord == end_ord:
+                    break
+            events = calendar.pop(t_ord)
+            self.step(1)
+            calendar.reschedule(self, events)
+            t_ord += 1
+
+    def _skip_quiet_days(self, n: int):
+        """n дней без событий: только наращение и старение сроков."""
+        daily_net = self.swap_book.daily_net()
+        growth = 1.0
+        with profiler.phase("gcurve_step"):
+            for _ in range(n):
+                growth *= 1.0 + self.gcurve.rate_overnight() / 365.0
+                self.gcurve.step()
+        self.swap_account *= growth
+        self.bank_account *= growth
+        self.accrued_swap += n * daily_net
+        self.portfolio.age(n)
+        self.swap_book.age(n)
+        self.days_since_quarter_start += n
+        self.t_curr += timedelta(days=n)
+
+    # ---------------- checkpoint / restore / fork -------------------------------
+
+    def checkpoint(self, path: str | None = None) -> bytes:
+        """
+        Полное состояние в компактном бинарном виде (см. checkpoint.pack):
+        колонки портфеля и книги свопов, счета, счётчики квартала, кривая
+        вместе с состоянием генератора, rebalance_kwargs (Generator — с
+        состоянием, см. checkpoint.dump_kwargs). restore() продолжает прогон
+        бит в бит. optimizer сохраняется по имени модуля, recorder — нет.
+        """
+        arrays = {}
+        p_arrays, p_meta = self.portfolio.get_state()
+        g_arrays, g_meta = self.gcurve.get_state()
+        arrays.update({f"portfolio.{k}": v for k, v in p_arrays.items()})
+        arrays.update({f"swaps.{k}": v for k, v in self.swap_book.get_state().items()})
+        arrays.update({f"gcurve.{k}": v for k, v in g_arrays.items()})
+        optimizer = getattr(self, "optimizer", None)
+        meta = {
+            "engine": {name: getattr(self, name) for name in self._STATE_FIELDS},
+            "t0": self.t0.isoformat(),
+            "t_curr": self.t_curr.isoformat(),
+            "rebalance_kwargs": checkpoint.dump_kwargs(self.rebalance_kwargs),
+            "optimizer": optimizer.__name__ if isinstance(optimizer, types.ModuleType) else None,
+            "portfolio": p_meta,
+            "gcurve": g_meta,
+        }
+        data = checkpoint.pack(arrays, meta)
+        if path is not None:
+            tmp = f"{path}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return data
+
+    @classmethod
+    def restore(cls, data: bytes | str) -> "HedgeEngine":
+        """Движок из checkpoint(): байты или путь к файлу."""
+        if isinstance(data, str):
+            with open(data, "rb") as f:
+                data = f.read()
+        arrays, meta = checkpoint.unpack(data)
+
+        def part(prefix):
+            return {k[len(prefix):]: v for k, v in arrays.items() if k.startswith(prefix)}
+
+        portfolio = Portfolio.from_state(part("portfolio."), meta["portfolio"])
+        engine = cls(portfolio, curve_from_state(part("gcurve."), meta["gcurve"]))
+        engine.swap_book = SwapBook.from_state(part("swaps."))
+        for name, value in meta["engine"].items():
+            setattr(engine, name, value)
+        engine.t0 = datetime.fromisoformat(meta["t0"])
+        engine.t_curr = datetime.fromisoformat(meta["t_curr"])
+        engine.rebalance_kwargs = checkpoint.load_kwargs(meta["rebalance_kwargs"])
+        if meta["optimizer"] is not None:
+            engine.optimizer = importlib.import_module(meta["optimizer"])
+        return engine
+
+    def fork(self) -> "HedgeEngine":
+        """
+        What-if ветка от текущего состояния без deepcopy: неизменяемые колонки
+        портфеля общие (read-only), изменяемые и книга свопов копируются,
+        кривая — независимая копия с тем же состоянием генератора.
+        rebalance_kwargs копируются глубоко (Generator, RollingTree), кроме
+        DecisionCache — он общий: решения по ключу от ветки не зависят.
+        """
+        new = copy.copy(self)
+        new.portfolio = self.portfolio.fork()
+        new.gcurve = self.gcurve.fork()
+        new.swap_book = self.swap_book.fork()
+        new.rebalance_kwargs = {k: v if isinstance(v, DecisionCache) else copy.deepcopy(v)
+                                for k, v in self.rebalance_kwargs.items()}
+        new.recorder = None
+        return new
 
     def snapshot_state(self):
+        agg = self.portfolio.aggregates()
         return {
             "date": self.t_curr,
             "bank_account": self.bank_account,
             "swap_account": self.swap_account,
             "accrued_swap": self.accrued_swap,
             "gcurve": self.gcurve.snapshot(),
-            "portfolio_total_loans": float(self.portfolio.get_portfolio().query("type=='loan'")["volume"].sum()),
-            "portfolio_total_deps": float(self.portfolio.get_portfolio().query("type=='deposit'")["volume"].sum()),
-            "swaps_count": 0 if self.swaps.empty else int(len(self.swaps)),
+            "portfolio_total_loans": agg["loan"]["volume"],
+            "portfolio_total_deps": agg["deposit"]["volume"],
+            "swaps_count": len(self.swap_book),
         }
     
     def step_to_quarter_end(self):
@@ -131,7 +233,7 @@ class HedgeEngine:
         self.days_since_quarter_start += 1
         if self.days_since_quarter_start >= QUARTER_LEN_DAYS:
             if hasattr(self, "optimizer") and callable(getattr(self.optimizer, "rebalance_once", None)):
-                decision = self.optimizer.rebalance_once(self)   # вернёт x_6,x_12,x_24
+                decision = self.optimizer.rebalance_once(self, **self.rebalance_kwargs)   # вернёт x_6,x_12,x_24
                 if decision.x_6 != 0:
                     self.add_swap("receive_fixed" if decision.x_6>0 else "pay_fixed", 6,  abs(decision.x_6))
                 if decision.x_12 != 0:
@@ -144,9 +246,8 @@ class HedgeEngine:
             self.swap_account += self.accrued_swap
             self.accrued_swap = 0.0
 
-            if not self.swaps.empty:
-                new_flt = float(self.gcurve.rate(SWAP_FLOAT_TERM))
-                self.swaps.loc[:, "float_rate_q"] = new_flt
+            if not self.swap_book.empty:
+                self.swap_book.reset_float(self.gcurve.rate(SWAP_FLOAT_TERM))
 
             self.days_since_quarter_start = 0
     
@@ -162,63 +263,20 @@ class HedgeEngine:
         fixed = float(self.gcurve.rate(term_months))
         flt   = float(self.gcurve.rate(SWAP_FLOAT_TERM))
 
-        start = self.t_curr
-        mat   = self.t_curr + relativedelta(months=term_months)
-
-        row = {
-            "id": self._swap_id,
-            "direction": direction,
-            "notional": float(notional),
-            "term_months": int(term_months),
-            "remaining_months": float(term_months),
-            "fixed_rate": fixed,
-            "float_rate_q": flt,         
-            "start_date": start,
-            "maturity_date": mat,
-        }
-        self.swaps.loc[len(self.swaps)] = row
+        self.swap_book.add(self._swap_id, direction, notional, term_months,
+                           fixed, flt, self.t_curr.toordinal())
         self._swap_id += 1
 
     def _accrue_swaps_one_day(self):
-        if self.swaps.empty:
-            rate_over_night = self.gcurve.rate_overnight()
-            self.swap_account *= (1.0 + rate_over_night / 365.0)
-            return
-
-        daily_net = 0.0
-        for _, s in self.swaps.iterrows():
-            fixed_rate = s["notional"] * s["fixed_rate"] / 365.0
-            float_rate = s["notional"] * s["float_rate_q"] / 365.0
-
-            if s["direction"] == "pay_fixed":
-                # платим фикс, получаем плавающую
-                daily_net += (float_rate - fixed_rate)
-            else:  # receive_fixed
-                daily_net += (fixed_rate - float_rate)
-
-        self.accrued_swap += float(daily_net)
+        # чистое начисление по книге одним скалярным произведением
+        self.accrued_swap += self.swap_book.daily_net()
 
         # овернайт на своп-счёт
         rate_over_night = self.gcurve.rate_overnight()
         self.swap_account *= (1.0 + rate_over_night / 365.0)
     
     def _age_swaps_and_rollover(self):
-        if self.swaps.empty:
+        if self.swap_book.empty:
             return
-
-        # уменьшаем срок
-        self.swaps.loc[:, "remaining_months"] = self.swaps["remaining_months"] - (1.0 / DAYS_PER_MONTH)
-
-        matured = self.swaps.index[self.swaps["remaining_months"] <= 0].tolist()
-        if not matured:
-            return
-
-        for idx in matured:
-            s = self.swaps.loc[idx]
-            term = int(s["term_months"])
-
-            self.swaps.at[idx, "start_date"] = self.t_curr
-            self.swaps.at[idx, "maturity_date"] = self.t_curr + relativedelta(months=term)
-            self.swaps.at[idx, "remaining_months"] = float(term)
-            self.swaps.at[idx, "fixed_rate"] = float(self.gcurve.rate(term))
-            self.swaps.at[idx, "float_rate_q"] = float(self.gcurve.rate(SWAP_FLOAT_TERM))
+        self.swap_book.age()
+        self.swap_book.rollover(self.t_curr.toordinal(), self.gcurve.rate, SWAP_FLOAT_TERM)
@@ -1,6 +1,8 @@
 import unittest
 from datetime import datetime, timedelta
 
+import numpy as np
+
 from engine import HedgeEngine, QUARTER_LEN_DAYS
 from portfolio import Portfolio
 
@@ -72,3 +74,148 @@ class TestEngineMethods(unittest.TestCase):
         # кто-то обязательно «перекатился»: remaining == contract_months
         self.assertTrue(((df1["remaining_months"] - df1["contract_months"]).abs() < 1e-6).any())
 
+
+    def test_advance_matches_daily_step(self):
+        from copy import deepcopy
+        from gcurve import GCurve
+        base = {0:0.09,3:0.095,6:0.10,12:0.105,24:0.11}
+        p = Portfolio(N_C=20, N_D=20, V=100000)
+        daily = HedgeEngine(deepcopy(p), GCurve(p.T0, base, seed=5))
+        jumpy = HedgeEngine(deepcopy(p), GCurve(p.T0, base, seed=5))
+        for e in (daily, jumpy):
+            e.add_swap("pay_fixed", 6, 30000)
+            e.add_swap("receive_fixed", 24, 10000)
+        daily.step(300)
+        jumpy.advance(300)
+        self.assertEqual(daily.t_curr, jumpy.t_curr)
+        self.assertEqual(daily.days_since_quarter_start, jumpy.days_since_quarter_start)
+        for attr in ("bank_account", "swap_account", "accrued_swap"):
+            a, b = getattr(daily, attr), getattr(jumpy, attr)
+            self.assertLess(abs(a - b), 1e-13 * max(1.0, abs(a)), attr)
+        self.assertTrue((daily.portfolio.rate == jumpy.portfolio.rate).all())
+
+    def test_swap_book_grows_and_nets(self):
+        p = Portfolio(N_C=2, N_D=2, V=50000)
+        e = HedgeEngine(p)
+        for i in range(40):   # больше начальной ёмкости книги
+            e.add_swap("pay_fixed" if i % 2 else "receive_fixed", 12, 1000 + i)
+        self.assertEqual(len(e.swaps), 40)
+        self.assertEqual(list(e.swaps["id"]), list(range(1, 41)))
+        expected = 0.0
+        for _, s in e.swaps.iterrows():
+            leg = s["notional"] * (s["fixed_rate"] - s["float_rate_q"]) / 365.0
+            expected += leg if s["direction"] == "receive_fixed" else -leg
+        self.assertAlmostEqual(e.swap_book.daily_net(), expected, places=12)
+
+    def test_profiler_phases(self):
+        import json
+        import optimizer
+        from profiling import profiler
+        e = HedgeEngine(Portfolio(N_C=3, N_D=3, V=100000))
+        e.optimizer = optimizer
+        e.rebalance_kwargs = {"levels": 3, "branch": 3, "seed": 0}
+        profiler.reset()
+        e.step(5)
+        self.assertEqual(profiler.report(), {})     # выключен — ничего не копится
+        profiler.enable()
+        try:
+            e.step(QUARTER_LEN_DAYS)
+        finally:
+            profiler.disable()
+        rep = json.loads(profiler.to_json())
+        self.assertEqual(rep["gcurve_step"]["calls"], QUARTER_LEN_DAYS)
+        self.assertEqual(rep["rebalance_once"]["calls"], 1)
+        self.assertEqual(rep["build_tree"]["calls"], 1)
+        self.assertGreaterEqual(rep["quarterly_settle"]["seconds"], rep["rebalance_once"]["seconds"])
+        profiler.reset()
+
+    def _state(self, e):
+        return (e.t_curr, e.bank_account, e.swap_account, e.accrued_swap, e.days_since_quarter_start,
+                e.gcurve.snapshot(), e.portfolio.rate.tolist(), e.portfolio.remaining_months.tolist(),
+                e.swap_book.fixed_rate.tolist(), e.swap_book.remaining_months.tolist())
+
+    def test_checkpoint_restore_resumes_bit_for_bit(self):
+        import optimizer
+        e = HedgeEngine(Portfolio(N_C=15, N_D=15, V=100000, seed=4))
+        e.optimizer = optimizer
+        e.rebalance_kwargs = {"levels": 3, "branch": 3, "seed": 0}
+        e.add_swap("pay_fixed", 6, 20000)
+        e.step(100)
+        blob = e.checkpoint()
+        e.step(120)
+        r = HedgeEngine.restore(blob)
+        self.assertIs(r.optimizer, optimizer)
+        r.step(120)
+        self.assertEqual(self._state(r), self._state(e))
+        self.assertEqual(len(r.swap_book), len(e.swap_book))
+        self.assertEqual(r.portfolio.aggregates(), e.portfolio.aggregates())
+
+    def test_checkpoint_restores_generator_seed(self):
+        import optimizer
+        def make():
+            e = HedgeEngine(Portfolio(N_C=15, N_D=15, V=100000, seed=4))
+            e.optimizer = optimizer
+            e.rebalance_kwargs = {"levels": 3, "branch": 3, "seed": np.random.default_rng(0)}
+            e.step(60)
+            return e
+        e, ref = make(), make()
+        r = HedgeEngine.restore(e.checkpoint())
+        r.step(QUARTER_LEN_DAYS)
+        ref.step(QUARTER_LEN_DAYS)
+        self.assertIsInstance(r.rebalance_kwargs["seed"], np.random.Generator)
+        self.assertGreater(len(ref.swap_book), 0)
+        self.assertEqual(self._state(r), self._state(ref))
+
+    def test_checkpoint_rejects_unserializable_kwargs(self):
+        from scenarios import RollingTree
+        e = HedgeEngine(Portfolio(N_C=3, N_D=3, V=100000))
+        e.rebalance_kwargs = {"seed": np.int64(3), "rolling": RollingTree()}
+        with self.assertRaisesRegex(ValueError, "rolling"):
+            e.checkpoint()
+        e.rebalance_kwargs = {"seed": np.int64(3)}
+        self.assertEqual(HedgeEngine.restore(e.checkpoint()).rebalance_kwargs, {"seed": 3})
+
+    def test_fork_is_independent_and_shares_static_columns(self):
+        e = HedgeEngine(Portfolio(N_C=15, N_D=15, V=100000, seed=4))
+        e.add_swap("receive_fixed", 12, 20000)
+        e.step(40)
+        f = e.fork()
+        self.assertTrue(np.shares_memory(f.portfolio.volume, e.portfolio.volume))
+        self.assertFalse(np.shares_memory(f.portfolio.rate, e.portfolio.rate))
+        with self.assertRaises(ValueError):
+            f.portfolio.volume[0] = 0.0
+        before = self._state(e)
+        f.add_swap("pay_fixed", 24, 5000)
+        f.step(200)
+        self.assertEqual(self._state(e), before)
+        e.step(200)
+        self.assertNotEqual(len(f.swap_book), len(e.swap_book))
+        g = HedgeEngine.restore(HedgeEngine(Portfolio(N_C=15, N_D=15, V=100000, seed=4)).checkpoint())
+        g.step(40)
+        self.assertEqual(self._state(g.fork()), self._state(g))
+
+    def test_forks_do_not_share_generator_or_rolling_tree(self):
+        import optimizer
+        from decision_cache import DecisionCache
+        from scenarios import RollingTree
+        e = HedgeEngine(Portfolio(N_C=15, N_D=15, V=100000, seed=4))
+        e.optimizer = optimizer
+        e.rebalance_kwargs = {"levels": 3, "branch": 3, "seed": np.random.default_rng(0),
+                              "rolling": RollingTree(), "cache": DecisionCache()}
+        e.step(60)
+        a, b = e.fork(), e.fork()
+        self.assertIs(a.rebalance_kwargs["cache"], e.rebalance_kwargs["cache"])
+        a.step(2 * QUARTER_LEN_DAYS)
+        b.step(2 * QUARTER_LEN_DAYS)
+        c, d = e.fork(), e.fork()
+        d.step(2 * QUARTER_LEN_DAYS)
+        c.step(2 * QUARTER_LEN_DAYS)
+        self.assertGreater(len(a.swap_book), 0)
+        self.assertEqual(e.rebalance_kwargs["rolling"].stats()["rebuilt"], 0)
+        for f in (b, c, d):
+            self.assertEqual(self._state(f), self._state(a))
+            self.assertEqual(f.rebalance_kwargs["rolling"].stats(), a.rebalance_kwargs["rolling"].stats())
+            np.testing.assert_array_equal(f.rebalance_kwargs["rolling"].tree.curves[-1],
+                                          a.rebalance_kwargs["rolling"].tree.curves[-1])
+            self.assertEqual(f.rebalance_kwargs["seed"].bit_generator.state,
+                             a.rebalance_kwargs["seed"].bit_generator.state)
@@ -0,0 +1,104 @@
+# events.py
+import heapq
+from collections import defaultdict
+
+import numpy as np
+
+DAYS_PER_MONTH = 365.25 / 12
+QUARTER_LEN_DAYS = 91
+
+PAYOUT = "payout"
+MATURITY = "maturity"
+SWAP_ROLLOVER = "swap_rollover"
+QUARTER_SETTLE = "quarter_settle"
+
+
+def days_to_maturity(remaining_months) -> np.ndarray:
+    """
+        Через сколько дней (0 = сегодня) step() увидит remaining_months <= 0.
+        Берём на день раньше точного ceil(r * DAYS_PER_MONTH) - 1, чтобы
+        округления при пропуске дней не «перепрыгнули» погашение: лишний
+        событийный день безвреден, пропущенный — нет.
+    """
+    k = np.ceil(np.asarray(remaining_months, dtype=float) * DAYS_PER_MONTH).astype(np.int64)
+    return np.maximum(k - 2, 0)
+
+
+class EventCalendar:
+    """
+        Очередь событий по датам: куча порядковых номеров дней + корзины
+        {день: {вид события: [индексы]}}. Устаревшие записи допустимы —
+        они дают лишний событийный день, но не меняют результат.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._buckets = defaultdict(lambda: defaultdict(list))
+
+    @classmethod
+    def from_engine(cls, engine) -> "EventCalendar":
+        cal = cls()
+        t_ord = engine.t_curr.toordinal()
+        p = engine.portfolio
+        idx = np.arange(len(p))
+        cal.push_many(PAYOUT, p.next_payout_ord, idx)
+        cal.push_many(MATURITY, t_ord + days_to_maturity(p.remaining_months), idx)
+        cal.schedule_swaps(engine)
+        return cal
+
+    def push(self, t_ord: int, kind: str, idx=None) -> None:
+        t_ord = int(t_ord)
+        if t_ord not in self._buckets:
+            heapq.heappush(self._heap, t_ord)
+        bucket = self._buckets[t_ord]
+        if idx is not None:
+            bucket[kind].append(np.atleast_1d(idx))
+        else:
+            bucket.setdefault(kind, [])
+
+    def push_many(self, kind: str, ordinals, idx) -> None:
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if ordinals.size == 0:
+            return
+        order = np.argsort(ordinals, kind="stable")
+        days, starts = np.unique(ordinals[order], return_index=True)
+        for day, chunk in zip(days, np.split(np.asarray(idx)[order], starts[1:])):
+            self.push(day, kind, chunk)
+
+    def schedule_swaps(self, engine) -> None:
+        """Ближайший клиринг квартала и погашения свопов — от текущего дня движка."""
+        t_ord = engine.t_curr.toordinal()
+        settle_in = QUARTER_LEN_DAYS - 1 - engine.days_since_quarter_start
+        self.push(t_ord + max(settle_in, 0), QUARTER_SETTLE)
+        if not engine.swap_book.empty:
+            due = days_to_maturity(engine.swap_book.remaining_months)
+            self.push(t_ord + int(due.min()), SWAP_ROLLOVER)
+
+    def peek(self) -> int | None:
+        return self._heap[0] if self._heap else None
+
+    def pop(self, t_ord: int) -> dict:
+        """Снимает с очереди все дни <= t_ord и возвращает события дня t_ord."""
+        events = {}
+        while self._heap and self._heap[0] <= t_ord:
+            day = heapq.heappop(self._heap)
+            bucket = self._buckets.pop(day)
+            for kind, chunks in bucket.items():
+                events.setdefault(kind, []).extend(chunks)
+        return {kind: (np.concatenate(chunks) if chunks else np.empty(0, dtype=np.int64))
+                for kind, chunks in events.items()}
+
+    def reschedule(self, engine, events: dict) -> None:
+        """
+            После обработки событийного дня (t_curr уже сдвинут на следующий)
+            ставит в очередь новые даты для затронутых контрактов и свопов.
+        """
+        t_ord = engine.t_curr.toordinal()
+        p = engine.portfolio
+        paid = events.get(PAYOUT)
+        if paid is not None and paid.size:
+            self.push_many(PAYOUT, p.next_payout_ord[paid], paid)
+        matured = events.get(MATURITY)
+        if matured is not None and matured.size:
+            self.push_many(MATURITY, t_ord + days_to_maturity(p.remaining_months[matured]), matured)
+        self.schedule_swaps(engine)
@@ -1,11 +1,37 @@
 # gcurve.py
 import numpy as np
+from copy import deepcopy
 from datetime import datetime, timedelta
 
+from checkpoint import generator_from_state
+
 TERMS = [0, 3, 6, 12, 24]
+DEFAULT_PHI = 0.97
+DEFAULT_SIGMA = {0: 0.0008, 3: 0.0006, 6: 0.0006, 12: 0.0005, 24: 0.0005}
+
+def ar1_jump(rate, mu, phi: float, sigma, days: int, z) -> np.ndarray:
+    """
+    Переход AR(1) r' = mu + phi (r - mu) + sigma eps сразу на days дней:
+    без пола это N(mu + phi^n (r - mu), sigma^2 (1 - phi^2n) / (1 - phi^2)),
+    z — стандартные нормальные шоки той же формы, что rate.
+    Пол в нуле — цензурированием конечной точки: max(x, 0). Дневной пол
+    отражает траекторию вверх, поэтому точная закрытая форма с полом
+    смещена вниз там, где путь задевает ноль; при ставках во много
+    стационарных стандартных отклонениях (~sigma / sqrt(1 - phi^2)) от нуля
+    разница пренебрежима. Для точного распределения — шаг по дням (exact=True).
+    """
+    mu = np.asarray(mu, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    decay = phi ** days
+    if phi == 1.0:
+        scale = sigma * np.sqrt(days)
+    else:
+        scale = sigma * np.sqrt((1.0 - phi ** (2 * days)) / (1.0 - phi ** 2))
+    return np.maximum(mu + decay * (np.asarray(rate, dtype=float) - mu) + scale * z, 0.0)
+
 
 class GCurve:
-    def __init__(self, t0: datetime, base: dict, phi: float = 0.97, sigma: dict | None = None, seed: int = 42):
+    def __init__(self, t0: datetime, base: dict, phi: float = DEFAULT_PHI, sigma: dict | None = None, seed: int = 42):
         if set(base.keys()) != set(TERMS):
             raise ValueError(f"base must have keys {TERMS}, got {sorted(base.keys())}")
         self.mu = {m: float(base[m]) for m in TERMS}
@@ -14,7 +40,7 @@ class GCurve:
         self.rng = np.random.default_rng(seed)
         self.current = dict(base)
         if sigma is None:
-            sigma = {0: 0.0008, 3: 0.0006, 6: 0.0006, 12: 0.0005, 24: 0.0005}
+            sigma = DEFAULT_SIGMA
         if set(sigma.keys()) != set(TERMS):
             raise ValueError(f"sigma must have keys {TERMS}")
         self.sigma = {m: float(sigma[m]) for m in TERMS}
@@ -37,8 +63,182 @@ class GCurve:
                 self.current[m] = max(r_new, 0.0)
             self.t_curr += timedelta(days=1)
 
+    def jump(self, days: int = 1, exact: bool = False) -> None:
+        """
+        Состояние через days дней одним розыгрышем (см. ar1_jump): 5 нормалей
+        вместо 5 * days. exact=True — обычный step(days) с полом на каждом дне.
+        Поток генератора отличается от step(), траектории не совпадают —
+        совпадает распределение конечной точки.
+        """
+        if exact or days <= 1:
+            self.step(days)
+            return
+        rate = ar1_jump([float(self.current[m]) for m in TERMS], [self.mu[m] for m in TERMS],
+                        self.phi, [self.sigma[m] for m in TERMS], days, self.rng.normal(0.0, 1.0, len(TERMS)))
+        self.current = dict(zip(TERMS, rate.tolist()))
+        self.t_curr += timedelta(days=days)
+
+    def batch(self, n_paths: int) -> "BatchCurve":
+        """
+        n_paths независимых копий кривой с текущего состояния одним массивом
+        (см. BatchCurve). Генератор копируется: при n_paths=1 траектория
+        совпадает с тем, что дали бы вызовы step() самой кривой.
+        """
+        mu = np.array([self.mu[m] for m in TERMS])
+        sigma = np.array([self.sigma[m] for m in TERMS])
+        current = np.tile([float(self.current[m]) for m in TERMS], (n_paths, 1))
+        return BatchCurve(self.t_curr, mu, self.phi, sigma, current, deepcopy(self.rng))
+
+    def simulate_paths(self, n_paths: int = 1, n_days: int = 1, seed: int | None = None) -> np.ndarray:
+        """
+        Траектории кривой без изменения состояния: массив [n_paths, n_days, len(TERMS)],
+        out[p, d] — кривая после d+1 шагов. Все шоки берутся одним вызовом,
+        рекурсия AR(1) с полом в нуле векторна по путям и срокам.
+        seed=None — копия генератора кривой: путь 0 в точности совпадает с тем,
+        что дали бы n_days вызовов step().
+        """
+        rng = deepcopy(self.rng) if seed is None else np.random.default_rng(seed)
+        eps = rng.normal(0.0, 1.0, size=(n_paths, n_days, len(TERMS)))
+        mu = np.array([self.mu[m] for m in TERMS])
+        sigma = np.array([self.sigma[m] for m in TERMS])
+        rate = np.tile([float(self.current[m]) for m in TERMS], (n_paths, 1))
+        out = np.empty_like(eps)
+        for d in range(n_days):
+            rate = np.maximum(mu + self.phi * (rate - mu) + sigma * eps[:, d], 0.0)
+            out[:, d] = rate
+        return out
+
+    def replay(self, path: np.ndarray) -> "PathCurve":
+        """Кривая, проигрывающая готовую траекторию [n_days, len(TERMS)] с текущего состояния."""
+        return PathCurve(self.t_curr, self.current, path)
+
+    def snapshot(self) -> dict:
+        snap = {m: round(float(self.current[m]), 6) for m in TERMS}
+        snap['date'] = self.t_curr
+        return snap
+
+    def get_state(self) -> tuple[dict, dict]:
+        """(массивы, скаляры для JSON) — для checkpoint; генератор — через bit_generator.state."""
+        meta = {
+            "kind": "GCurve",
+            "t_curr": self.t_curr.isoformat(),
+            "phi": self.phi,
+            "mu": [self.mu[m] for m in TERMS],
+            "sigma": [self.sigma[m] for m in TERMS],
+            "current": [float(self.current[m]) for m in TERMS],
+            "rng": self.rng.bit_generator.state,
+        }
+        return {}, meta
+
+    @classmethod
+    def from_state(cls, arrays: dict, meta: dict) -> "GCurve":
+        g = cls(datetime.fromisoformat(meta["t_curr"]), dict(zip(TERMS, meta["mu"])),
+                phi=meta["phi"], sigma=dict(zip(TERMS, meta["sigma"])))
+        g.current = dict(zip(TERMS, meta["current"]))
+        g.rng = generator_from_state(meta["rng"])
+        return g
+
+    def fork(self) -> "GCurve":
+        return deepcopy(self)
+
+
+class BatchCurve:
+    """
+    K траекторий GCurve в lockstep: current [K, len(TERMS)], за день —
+    один розыгрыш шоков [K, len(TERMS)] и та же рекурсия AR(1), что в
+    GCurve.step (поэлементно те же операции в том же порядке).
+    rate()/rate_overnight() отдают векторы [K].
+    """
+
+    def __init__(self, t0: datetime, mu: np.ndarray, phi: float, sigma: np.ndarray,
+                 current: np.ndarray, rng: np.random.Generator):
+        self.t_curr = t0
+        self.mu = mu
+        self.phi = float(phi)
+        self.sigma = sigma
+        self.current = np.array(current, dtype=float)
+        self.rng = rng
+
+    def __len__(self):
+        return self.current.shape[0]
+
+    def rate_overnight(self) -> np.ndarray:
+        return self.current[:, 0]
+
+    def rate(self, term_months: int) -> np.ndarray:
+        if term_months not in TERMS:
+            raise ValueError(f"Unsupported term: {term_months}. Allowed: {TERMS}")
+        return self.current[:, TERMS.index(term_months)]
+
+    def step(self, days: int = 1) -> None:
+        for _ in range(days):
+            eps = self.rng.normal(0.0, 1.0, size=self.current.shape)
+            r_new = self.mu + self.phi * (self.current - self.mu) + self.sigma * eps
+            self.current = np.maximum(r_new, 0.0)
+            self.t_curr += timedelta(days=1)
+
+    def path(self, k: int) -> "PathCurve":
+        """Текущее состояние пути k как кривая с интерфейсом GCurve (для оптимизатора)."""
+        return PathCurve(self.t_curr, dict(zip(TERMS, self.current[k].tolist())), np.empty((0, len(TERMS))))
+
+
+def curve_from_state(arrays: dict, meta: dict):
+    """GCurve или PathCurve по meta["kind"] из get_state()."""
+    kinds = {"GCurve": GCurve, "PathCurve": PathCurve}
+    if meta.get("kind") not in kinds:
+        raise ValueError(f"unknown curve kind {meta.get('kind')!r}")
+    return kinds[meta["kind"]].from_state(arrays, meta)
+
+
+class PathCurve:
+    """
+    Тот же интерфейс, что у GCurve (rate, rate_overnight, step, snapshot),
+    но ставки берутся из заранее посчитанной траектории (см. simulate_paths).
+    """
+    def __init__(self, t0: datetime, base: dict, path: np.ndarray):
+        path = np.asarray(path, dtype=float)
+        if path.ndim != 2 or path.shape[1] != len(TERMS):
+            raise ValueError(f"path must have shape (n_days, {len(TERMS)}), got {path.shape}")
+        self.t_curr = t0
+        self.path = path
+        self.day = 0
+        self.current = {m: float(base[m]) for m in TERMS}
+
+    def rate_overnight(self) -> float:
+        return self.current[0]
+
+    def rate(self, term_months: int) -> float:
+        if term_months not in TERMS:
+            raise ValueError(f"Unsupported term: {term_months}. Allowed: {TERMS}")
+        return float(self.current[term_months])
+
+    def step(self, days: int = 1) -> None:
+        if self.day + days > len(self.path):
+            raise ValueError(f"path exhausted: {len(self.path)} days, requested {self.day + days}")
+        row = self.path[self.day + days - 1] if days > 0 else None
+        if row is not None:
+            self.current = dict(zip(TERMS, row.tolist()))
+        self.day += days
+        self.t_curr += timedelta(days=days)
+
     def snapshot(self) -> dict:
         snap = {m: round(float(self.current[m]), 6) for m in TERMS}
         snap['date'] = self.t_curr
         return snap
-    
+
+    def get_state(self) -> tuple[dict, dict]:
+        meta = {"kind": "PathCurve", "t_curr": self.t_curr.isoformat(), "day": self.day,
+                "current": [float(self.current[m]) for m in TERMS]}
+        return {"path": self.path}, meta
+
+    @classmethod
+    def from_state(cls, arrays: dict, meta: dict) -> "PathCurve":
+        c = cls(datetime.fromisoformat(meta["t_curr"]), dict(zip(TERMS, meta["current"])), arrays["path"])
+        c.day = meta["day"]
+        return c
+
+    def fork(self) -> "PathCurve":
+        """Траектория неизменна — общая у веток, копируется только позиция."""
+        c = PathCurve(self.t_curr, self.current, self.path)
+        c.day = self.day
+        return c
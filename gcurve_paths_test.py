@@ -0,0 +1,38 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from gcurve import GCurve
+
+
+class TestGCurvePaths(unittest.TestCase):
+    def setUp(self):
+        self.t0 = datetime(2016,12,31)
+        self.base = {0:0.09,3:0.095,6:0.10,12:0.105,24:0.11}
+
+    def test_simulate_paths_reproduces_step(self):
+        gc = GCurve(self.t0, self.base, seed=11)
+        paths = gc.simulate_paths(n_paths=3, n_days=50)
+        self.assertEqual(paths.shape, (3, 50, 5))
+        for d in range(50):
+            gc.step()
+            self.assertEqual([gc.rate(m) for m in [0,3,6,12,24]], paths[0, d].tolist())
+
+    def test_floor_and_independent_paths(self):
+        gc = GCurve(self.t0, {m: 0.0005 for m in [0,3,6,12,24]}, seed=3)
+        paths = gc.simulate_paths(n_paths=4, n_days=30, seed=5)
+        self.assertGreaterEqual(paths.min(), 0.0)
+        self.assertFalse(np.allclose(paths[0], paths[1]))
+
+    def test_engine_runs_from_replayed_path(self):
+        from engine import HedgeEngine
+        from portfolio import Portfolio
+        from copy import deepcopy
+        p = Portfolio(N_C=5, N_D=5, V=10000)
+        gc = GCurve(self.t0, self.base, seed=2)
+        replay = gc.replay(gc.simulate_paths(1, 120)[0])
+        e1 = HedgeEngine(deepcopy(p), gc)
+        e2 = HedgeEngine(deepcopy(p), replay)
+        e1.step(120); e2.step(120)
+        self.assertEqual(e1.bank_account, e2.bank_account)
@@ -1,9 +1,12 @@
 # optimizer.py
+import time
+from collections import Counter
 from dataclasses import dataclass
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
 import numpy as np
 
-from scenarios import build_tree
+from scenarios import ScenarioTree, TERM_COL, build_tree_arrays, reduce_tree, tree_seed
+from profiling import profiler
 
 SWAP_FLOAT_TERM = 3
 
@@ -24,109 +27,421 @@ class Decision:
     x_12: float
     x_24: float
 
-def simulate_terminal_pnl(nodes: List, decision: Decision, notional_unit: float, alpha: float=0.95) -> np.ndarray:
-    # найдём листья
-    levels = max(n.level for n in nodes) + 1
-    leaf_indices = [i for i,n in enumerate(nodes) if n.level == levels-1]
-
-    # фиксированные ставки на корне
-    root = [n for n in nodes if n.level == 0][0]
-    r_fix = {6: float(root.gcurve_snapshot[6]),
-             12: float(root.gcurve_snapshot[12]),
-             24: float(root.gcurve_snapshot[24])}
-
-    # родительские связи
-    parent = {i: nodes[i].parent for i in range(len(nodes))}
-    pnl = []
-    for leaf in leaf_indices:
-        # путь корень->лист
-        path = []
-        cur = leaf
-        while cur is not None:
-            path.append(cur)
-            cur = parent[cur]
-        path = path[::-1]
-
-        acc = 0.0
-        for s in range(1, len(path)):
-            p_idx = path[s-1]; c_idx = path[s]
-            p_node = nodes[p_idx]
-            r_flt = float(p_node.gcurve_snapshot[SWAP_FLOAT_TERM])
-
-            # разложим знак на направление ножек
-            dir6  = 'receive_fixed' if decision.x_6  >= 0 else 'pay_fixed'
-            dir12 = 'receive_fixed' if decision.x_12 >= 0 else 'pay_fixed'
-            dir24 = 'receive_fixed' if decision.x_24 >= 0 else 'pay_fixed'
-
-            c6  = swap_coupon_quarter(abs(decision.x_6),  r_fix[6],  r_flt, dir6)
-            c12 = swap_coupon_quarter(abs(decision.x_12), r_fix[12], r_flt, dir12)
-            c24 = swap_coupon_quarter(abs(decision.x_24), r_fix[24], r_flt, dir24)
-
-            coupon = c6 + c12 + c24
-            acc = (acc + coupon) * nodes[c_idx].acc_mult_to_child
-        pnl.append(acc)
-    return np.array(pnl, dtype=float)
-
-def cvar_of_losses(losses: np.ndarray, alpha: float = 0.95) -> Tuple[float, float]:
+def leaf_exposures(tree: ScenarioTree) -> np.ndarray:
     """
-    CVaR_α = E[ Loss | Loss >= VaR_α ]. Возвращает (CVaR, VaR).
+    Матрица [n_leaves, 3]: терминальный PnL листа на 1 номинала x_6, x_12, x_24.
+    Купон линеен по x: x_T * (r_fix_T - r_flt(parent)) / 4 при любом знаке,
+    поэтому PnL = leaf_exposures(tree) @ (x_6, x_12, x_24).
+    Один проход по уровням: e_child = (e_parent + купон_parent) * acc_mult_child.
     """
-    x = np.sort(np.asarray(losses, dtype=float))
-    S = x.size
+    return propagate_exposures(tree, swap_fixed_rates(tree), np.zeros((1, 3)))
+
+def swap_fixed_rates(tree: ScenarioTree) -> np.ndarray:
+    """Фиксированные ставки x_6, x_12, x_24 — с корня дерева."""
+    return tree.curves[0][0][[TERM_COL[6], TERM_COL[12], TERM_COL[24]]]
+
+def propagate_exposures(tree: ScenarioTree, r_fix: np.ndarray, expo: np.ndarray) -> np.ndarray:
+    """
+    Экспозиции листьев [n_leaves, 3] от экспозиций узлов уровня 0 tree
+    expo [n_0, 3] (для поддеревьев StreamingTree — узлов уровня split).
+    """
+    for L in range(1, tree.levels):
+        r_flt = tree.curves[L-1][:, TERM_COL[SWAP_FLOAT_TERM]]
+        coupon = (r_fix[None, :] - r_flt[:, None]) / 4.0
+        expo = (expo + coupon)[tree.parent[L]] * tree.acc_mult[L][:, None]
+    return expo
+
+def simulate_terminal_pnl(nodes, decision: Decision, notional_unit: float, alpha: float=0.95) -> np.ndarray:
+    expo = leaf_exposures(ScenarioTree.from_nodes(nodes))
+    return expo @ np.array([decision.x_6, decision.x_12, decision.x_24], dtype=float)
+
+def cvar_of_losses_batch(losses: np.ndarray, alpha: float = 0.95,
+                         weights: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    CVaR/VaR по столбцам матрицы потерь [S, K] (сценарии x кандидаты).
+    Вместо полной сортировки — np.partition по k-й порядковой статистике.
+    weights [S] — вероятности сценариев (reduce_tree): хвост — сценарии,
+    на которых накопленная по возрастанию потерь вероятность >= alpha
+    (при равных весах — ровно те же, что без weights).
+    """
+    x = np.asarray(losses, dtype=float)
+    S = x.shape[0]
     if S == 0:
-        return 0.0, 0.0
+        return np.zeros(x.shape[1:]), np.zeros(x.shape[1:])
+    if weights is not None:
+        return _weighted_cvar_batch(x, np.asarray(weights, dtype=float), alpha)
     k = int(np.ceil(alpha * S)) - 1
     k = max(0, min(S-1, k))
-    var = x[k]
-    tail = x[k:]
-    cvar = float(tail.mean()) if tail.size else float(var)
-    return cvar, float(var)
+    part = np.partition(x, k, axis=0)
+    var = part[k]
+    cvar = part[k:].mean(axis=0)
+    return cvar, var
 
-def grid_search_cvar(nodes: List, notional_unit: float, alpha: float = 0.95,
+def _weighted_cvar_batch(x: np.ndarray, w: np.ndarray, alpha: float) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(x, axis=0, kind="stable")
+    xs = np.take_along_axis(x, order, axis=0)
+    ws = w[order]
+    cum = np.cumsum(ws, axis=0) / w.sum()
+    tail = cum >= alpha - 1e-12
+    k = tail.argmax(axis=0)
+    cols = np.arange(x.shape[1])
+    var = xs[k, cols]
+    tw = np.where(tail, ws, 0.0)
+    cvar = (tw * xs).sum(axis=0) / tw.sum(axis=0)
+    return cvar, var
+
+def cvar_of_losses(losses: np.ndarray, alpha: float = 0.95,
+                   weights: np.ndarray | None = None) -> Tuple[float, float]:
+    """
+    CVaR_α = E[ Loss | Loss >= VaR_α ]. Возвращает (CVaR, VaR).
+    weights — вероятности сценариев (см. cvar_of_losses_batch).
+    """
+    x = np.asarray(losses, dtype=float)
+    if x.size == 0:
+        return 0.0, 0.0
+    cvar, var = cvar_of_losses_batch(x.reshape(-1, 1), alpha, weights)
+    return float(cvar[0]), float(var[0])
+
+def unit_grid(max_abs_units: int) -> np.ndarray:
+    """Все (n6, n12, n24) из [-k, k]^3 без нуля — в порядке вложенных циклов."""
+    r = np.arange(-max_abs_units, max_abs_units+1)
+    grid = np.stack(np.meshgrid(r, r, r, indexing="ij"), axis=-1).reshape(-1, 3)
+    return grid[np.any(grid != 0, axis=1)]
+
+def grid_search_cvar(nodes, notional_unit: float, alpha: float = 0.95,
                      mu: float = 0.0, max_abs_units: int = 2) -> Tuple[Decision, dict]:
     """
-    Грубый, но беззависимый от внешних либ грид-поиск по x_6,x_12,x_24 (в «юнитах»).
+    Грид-поиск по x_6,x_12,x_24 (в «юнитах»): весь грид оценивается одним
+    матричным произведением leaf_exposures @ decisions.T.
+    Для редуцированного дерева (tree.prob) среднее и CVaR — с весами листьев.
     Возвращает Decision в НОМИНАЛАХ (x_T * notional_unit) и метрики.
     """
+    tree = ScenarioTree.from_nodes(nodes)
+    return _grid_on_exposures(leaf_exposures(tree), tree.leaf_prob, notional_unit, alpha, mu, max_abs_units)
+
+def _grid_on_exposures(expo: np.ndarray, w: np.ndarray | None, notional_unit: float, alpha: float,
+                       mu: float, max_abs_units: int) -> Tuple[Decision, dict]:
+    decisions = unit_grid(max_abs_units) * float(notional_unit)
+    pnl = expo @ decisions.T
+    means = pnl.mean(axis=0) if w is None else w @ pnl
+    cvars, _ = cvar_of_losses_batch(-pnl, alpha, w)
+    return _pick_grid(decisions, means, cvars, alpha, mu)
+
+def _pick_grid(decisions: np.ndarray, means: np.ndarray, cvars: np.ndarray,
+               alpha: float, mu: float) -> Tuple[Decision, dict]:
     best_score = None
     best_dec = Decision(0.0, 0.0, 0.0)
     tried = 0
-    for n6 in range(-max_abs_units, max_abs_units+1):
-        for n12 in range(-max_abs_units, max_abs_units+1):
-            for n24 in range(-max_abs_units, max_abs_units+1):
-                if n6 == 0 and n12 == 0 and n24 == 0:
-                    continue
-                # переведём в НОМИНАЛЫ
-                dec = Decision(n6 * notional_unit, n12 * notional_unit, n24 * notional_unit)
-                pnl = simulate_terminal_pnl(nodes, dec, notional_unit, alpha)
-                mean_pnl = float(np.mean(pnl))
-                if mean_pnl < mu:
-                    continue
-                losses = -pnl
-                cvar, _ = cvar_of_losses(losses, alpha)
-                score = cvar  # минимизируем хвостовой риск
-                if (best_score is None) or (score < best_score) or \
-                   (np.isclose(score, best_score) and mean_pnl > 0):
-                    best_score = score
-                    best_dec = dec
-                tried += 1
+    # порядок обхода и правило ничьих — как у прежнего тройного цикла
+    for j in np.flatnonzero(means >= mu):
+        score = float(cvars[j])  # минимизируем хвостовой риск
+        if (best_score is None) or (score < best_score) or \
+           (np.isclose(score, best_score) and means[j] > 0):
+            best_score = score
+            best_dec = Decision(*(float(v) for v in decisions[j]))
+        tried += 1
     info = {"alpha": alpha, "mu": mu, "tried": tried, "best_cvar": best_score}
     return best_dec, info
 
+def ru_cvar(losses: np.ndarray, alpha: float = 0.95) -> float:
+    """CVaR по Рокафеллару–Урясеву: min_z z + E[(L - z)+] / (1 - α)."""
+    x = np.sort(np.asarray(losses, dtype=float))
+    if x.size == 0:
+        return 0.0
+    z = x[min(x.size - 1, int(np.floor(alpha * x.size)))]
+    return float(z + np.maximum(x - z, 0.0).mean() / (1.0 - alpha))
+
+def lp_search_cvar(nodes, notional_unit: float, alpha: float = 0.95,
+                   mu: float = 0.0, max_abs_units: int = 2,
+                   round_to_units: bool = False) -> Tuple[Decision, dict]:
+    """
+    Непрерывная задача min CVaR_α при E[PnL] >= mu и |x_T| <= max_abs_units * notional_unit
+    как ЛП Рокафеллара–Урясева по листьям дерева (scipy.optimize.linprog, HiGHS):
+        min  z + 1/(1-α) Σ p_s u_s
+        u_s >= -E_s·x - z,  u_s >= 0,  Σ p_s E_s·x >= mu
+    p_s = 1/S или вероятности листьев редуцированного дерева.
+    Размер задачи линеен по числу листьев S.
+    round_to_units=True — округление до юнитов: из 8 соседних точек сетки
+    берётся допустимая с наименьшим CVaR (как в grid_search_cvar).
+    """
+    tree = ScenarioTree.from_nodes(nodes)
+    return _lp_on_exposures(leaf_exposures(tree), tree.leaf_prob, notional_unit, alpha, mu,
+                            max_abs_units, round_to_units)
+
+def _lp_on_exposures(expo: np.ndarray, w: np.ndarray | None, notional_unit: float, alpha: float,
+                     mu: float, max_abs_units: int, round_to_units: bool) -> Tuple[Decision, dict]:
+    try:
+        from scipy.optimize import linprog
+        from scipy import sparse
+    except ImportError as exc:
+        raise ImportError("lp_search_cvar requires scipy (scipy.optimize.linprog)") from exc
+    if not 0.0 < alpha < 1.0:
+        raise ValueError(f"alpha must be in (0, 1), got {alpha}")
+
+    S = expo.shape[0]
+    p = np.full(S, 1.0 / S) if w is None else w / w.sum()
+    bound = float(max_abs_units) * float(notional_unit)
+
+    # переменные: x_6, x_12, x_24, z, u_1..u_S
+    c = np.concatenate([np.zeros(3), [1.0], p / (1.0 - alpha)])
+    A_tail = sparse.hstack([sparse.csr_matrix(-expo), sparse.csr_matrix(-np.ones((S, 1))), -sparse.identity(S)])
+    A_mean = sparse.csr_matrix(np.concatenate([-(p @ expo), np.zeros(S + 1)]))
+    A_ub = sparse.vstack([A_tail, A_mean]).tocsr()
+    b_ub = np.concatenate([np.zeros(S), [-mu]])
+    bounds = [(-bound, bound)] * 3 + [(None, None)] + [(0.0, None)] * S
+    res = linprog(c, A_ub=A_ub, b_ub=b_ub, bounds=bounds, method="highs")
+
+    info = {"alpha": alpha, "mu": mu, "status": res.status, "message": res.message,
+            "lp_cvar": None, "best_cvar": None}
+    if res.status != 0:
+        return Decision(0.0, 0.0, 0.0), info
+    x = res.x[:3]
+    info["lp_cvar"] = float(res.fun)
+    info["var"] = float(res.x[3])
+
+    if round_to_units:
+        units = x / notional_unit
+        best = None
+        for corner in np.stack(np.meshgrid(*[[np.floor(u), np.ceil(u)] for u in units], indexing="ij"), -1).reshape(-1, 3):
+            cand = np.clip(corner, -max_abs_units, max_abs_units) * notional_unit
+            pnl = expo @ cand
+            if (pnl.mean() if w is None else p @ pnl) < mu:
+                continue
+            score = cvar_of_losses(-pnl, alpha, w)[0]
+            if best is None or score < best[0]:
+                best = (score, cand)
+        if best is None:
+            info["message"] = "no feasible rounding"
+            return Decision(0.0, 0.0, 0.0), info
+        x = best[1]
+
+    info["best_cvar"] = cvar_of_losses(-(expo @ x), alpha, w)[0]
+    return Decision(*(float(v) for v in x)), info
+
+class AdaptiveSizing:
+    """
+    Адаптивный размер дерева для rebalance_once(adaptive=...).
+    Вместо одного дерева levels x branch строятся независимые реплики
+    levels x self.branch (шоки из одного генератора), листья всех реплик
+    оптимизируются вместе. Начиная с min_reps, число реплик удваивается,
+    пока не выполнено:
+      - решение одно и то же stable_rounds раундов подряд;
+      - полуширина ДИ CVaR этого решения (t-интервал по CVaR отдельных
+        реплик, уровень ci_level) <= tol * |CVaR| + atol.
+    Жёсткий бюджет — max_reps, max_leaves (листьев суммарно; и для первых
+    min_reps реплик) и max_seconds (проверяется перед каждой репликой).
+    Реплик всегда не меньше 2 (иначе нет ДИ): max_leaves меньше двух
+    деревьев — ValueError, max_seconds — не раньше второй реплики.
+    Отчёт по каждому вызову — в history (реплики, листья, секунды,
+    причина остановки), сводка — stats().
+    """
+
+    def __init__(self, branch: int = 3, tol: float = 0.1, atol: float = 0.0, min_reps: int = 4,
+                 max_reps: int = 256, stable_rounds: int = 2, max_leaves: int = 100_000,
+                 max_seconds: float | None = None, ci_level: float = 0.95):
+        if min_reps < 2:
+            raise ValueError("min_reps must be at least 2 (CI needs replicates)")
+        if max_reps < min_reps:
+            raise ValueError("max_reps must be >= min_reps")
+        self.branch = int(branch)
+        self.tol = float(tol)
+        self.atol = float(atol)
+        self.min_reps = int(min_reps)
+        self.max_reps = int(max_reps)
+        self.stable_rounds = int(stable_rounds)
+        self.max_leaves = int(max_leaves)
+        self.max_seconds = max_seconds
+        self.ci_level = float(ci_level)
+        self.history = []
+
+    def params(self) -> tuple:
+        """Настройки — для ключа DecisionCache."""
+        return (self.branch, self.tol, self.atol, self.min_reps, self.max_reps, self.stable_rounds,
+                self.max_leaves, self.max_seconds, self.ci_level)
+
+    def stats(self) -> dict:
+        """Сводка по вызовам: размеры, время, причины остановки."""
+        if not self.history:
+            return {"calls": 0}
+        leaves = np.array([h["leaves"] for h in self.history])
+        reps = np.array([h["replicates"] for h in self.history])
+        return {"calls": len(self.history),
+                "mean_leaves": float(leaves.mean()), "max_leaves": int(leaves.max()),
+                "mean_replicates": float(reps.mean()), "max_replicates": int(reps.max()),
+                "seconds": float(sum(h["seconds"] for h in self.history)),
+                "stops": dict(Counter(h["stop"] for h in self.history))}
+
+def _ci_halfwidth(values: np.ndarray, level: float) -> float:
+    from scipy.stats import t
+    n = values.size
+    return float(t.ppf(0.5 + level / 2.0, n - 1) * values.std(ddof=1) / np.sqrt(n))
+
+def adaptive_search_cvar(g, sizing: AdaptiveSizing, notional_unit: float, levels: int = 5,
+                         alpha: float = 0.95, mu: float = 0.0, max_abs_units: int = 2,
+                         solver: str = "grid", round_to_units: bool = False, seed=None,
+                         scheme: str = "iid", reduce_to: int | None = None) -> Tuple[Decision, dict]:
+    """
+    min CVaR по растущему числу реплик дерева (см. AdaptiveSizing).
+    seed=None — tree_seed(g). Возвращает (Decision, info); info["sizing"] —
+    запись отчёта, она же добавляется в sizing.history.
+    """
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(tree_seed(g) if seed is None else seed)
+    expos, weights = [], []
+    decision, info, stable, stop = None, None, 0, "max_reps"
+    cvar, hw = float("nan"), float("inf")
+    per_tree = sizing.branch ** (levels - 1)          # reduce_to листьев только убавляет
+    cap = min(sizing.max_reps, sizing.max_leaves // per_tree)
+    if cap < 2:
+        raise ValueError(f"max_leaves={sizing.max_leaves} fits fewer than 2 replicate trees "
+                         f"of {per_tree} leaves (CI needs 2)")
+    target = min(sizing.min_reps, cap)
+    out_of_time = False
+    while True:
+        while len(expos) < target:
+            if (len(expos) >= 2 and sizing.max_seconds is not None
+                    and time.perf_counter() - t0 > sizing.max_seconds):
+                out_of_time = True
+                break
+            tree = build_tree_arrays(g, levels=levels, branch=sizing.branch, seed=rng, scheme=scheme)
+            if reduce_to is not None:
+                tree = reduce_tree(tree, reduce_to)
+            expos.append(leaf_exposures(tree))
+            w = tree.leaf_prob
+            weights.append(np.full(tree.n_leaves, 1.0 / tree.n_leaves) if w is None else w / w.sum())
+        R = len(expos)
+        expo = np.concatenate(expos)
+        w = np.concatenate(weights) / R
+        if solver == "lp":
+            new, info = _lp_on_exposures(expo, w, notional_unit, alpha, mu, max_abs_units, round_to_units)
+        else:
+            new, info = _grid_on_exposures(expo, w, notional_unit, alpha, mu, max_abs_units)
+        stable = stable + 1 if new == decision else 1
+        decision = new
+        x = np.array([decision.x_6, decision.x_12, decision.x_24])
+        per_rep = np.array([cvar_of_losses(-(e @ x), alpha, p)[0] for e, p in zip(expos, weights)])
+        cvar = cvar_of_losses(-(expo @ x), alpha, w)[0]
+        hw = _ci_halfwidth(per_rep, sizing.ci_level)
+
+        if stable >= sizing.stable_rounds and hw <= sizing.tol * abs(cvar) + sizing.atol:
+            stop = "converged"
+            break
+        if out_of_time or (sizing.max_seconds is not None and time.perf_counter() - t0 > sizing.max_seconds):
+            stop = "max_seconds"
+            break
+        # число реплик удваивается: суммарная работа линейна по итоговому числу листьев
+        target = min(2 * R, cap)
+        if target <= R:
+            stop = "max_reps" if R >= sizing.max_reps else "max_leaves"
+            break
+
+    report = {"levels": levels, "branch": sizing.branch, "replicates": len(expos),
+              "leaves": int(sum(e.shape[0] for e in expos)), "seconds": time.perf_counter() - t0,
+              "stop": stop, "cvar": cvar, "ci_halfwidth": hw}
+    sizing.history.append(report)
+    info = dict(info, sizing=report)
+    return decision, info
+
 def rebalance_once(engine,
                    levels: int = 5, branch: int = 5,
                    alpha: float = 0.95, mu: float = 0.0,
-                   unit_frac: float = 0.10, max_abs_units: int = 2) -> Decision:
+                   unit_frac: float = 0.10, max_abs_units: int = 2,
+                   solver: str = "grid", round_to_units: bool = False,
+                   seed=None, cache=None, scheme: str = "iid", rolling=None,
+                   reduce_to: int | None = None, adaptive: AdaptiveSizing | None = None,
+                   stream_block: int | None = None, workers: int | None = None) -> Decision:
     """
-    Точка входа для движка. Строит дерево, делает грид-поиск CVaR и
+    Точка входа для движка. Строит дерево, минимизирует CVaR и
     возвращает Decision (номиналы) для добавления свопов.
     unit_frac — доля от суммарного V портфеля на 1 «юнит»;
     max_abs_units — предел по |юнитам| на срок.
+    solver — "grid" (перебор целых юнитов) или "lp" (непрерывная ЛП
+    Рокафеллара–Урясева, см. lp_search_cvar; round_to_units — округлить).
+    seed — зерно/Generator для дерева (None — из состояния кривой, см. tree_seed).
+    scheme — схема шоков веток дерева (см. scenarios.branch_shocks).
+    rolling — scenarios.RollingTree: дерево прошлого клиринга переиспользуется
+    и достраивается на один уровень вместо полной перестройки.
+    reduce_to — перед оптимизацией свести дерево (scenarios.reduce_tree) к
+    не более чем reduce_to представителям на родителя.
+    adaptive — AdaptiveSizing: вместо дерева levels x branch — растущее число
+    реплик levels x adaptive.branch до стабилизации решения и ДИ CVaR
+    (branch и rolling при этом не используются).
+    stream_block — дерево не материализуется: streaming.stream_grid_search_cvar
+    блоками по stream_block листьев (только solver="grid", без rolling,
+    reduce_to и adaptive).
+    workers — дерево строится по поддеревьям уровня 2 в workers процессах
+    (parallel_tree.build_tree_parallel, там же экспозиции листьев); дерево
+    и решение от workers не зависят, но дерево другое, чем при workers=None
+    (зерна по поддеревьям). Без rolling/adaptive/stream_block.
+    cache — DecisionCache: при попадании по квантованной кривой и тем же
+    параметрам дерево и оптимизация пропускаются. Целое seed входит в ключ;
+    с seed-Generator (каждый вызов — новое дерево) и с rolling (дерево
+    должно катиться каждый клиринг) кеш не используется.
     """
-    nodes = build_tree(engine.gcurve, levels=levels, branch=branch)
-    V = getattr(engine.portfolio, "V", 1_000_000.0)
-    notional_unit = float(V) * float(unit_frac)
-    decision, info = grid_search_cvar(nodes, notional_unit, alpha=alpha, mu=mu, max_abs_units=max_abs_units)
-    # можно временно распечатать инфо:
-    # print("Rebalance info:", info, "Decision:", decision)
-    return decision
+    if solver not in ("grid", "lp"):
+        raise ValueError(f"solver must be 'grid' or 'lp', got {solver!r}")
+    if adaptive is not None and rolling is not None:
+        raise ValueError("adaptive sizing builds fresh replicate trees; rolling is not supported")
+    if stream_block is not None and (solver != "grid" or rolling is not None or reduce_to is not None
+                                     or adaptive is not None):
+        raise ValueError("stream_block supports solver='grid' only, without rolling/reduce_to/adaptive")
+    if workers is not None and (rolling is not None or adaptive is not None or stream_block is not None):
+        raise ValueError("workers builds a split tree; rolling/adaptive/stream_block are not supported")
+    with profiler.phase("rebalance_once"):
+        V = getattr(engine.portfolio, "V", 1_000_000.0)
+        notional_unit = float(V) * float(unit_frac)
+        if rolling is not None or isinstance(seed, np.random.Generator):
+            cache = None
+        if cache is not None:
+            seed_key = int(seed) if isinstance(seed, (int, np.integer)) else None
+            key = cache.key(engine.gcurve.snapshot(), seed=seed_key, levels=levels, branch=branch, alpha=alpha,
+                            mu=mu, unit_frac=unit_frac, max_abs_units=max_abs_units, V=float(V),
+                            solver=solver, round_to_units=round_to_units, scheme=scheme,
+                            reduce_to=reduce_to, adaptive=None if adaptive is None else adaptive.params(),
+                            stream=stream_block is not None, split=workers is not None)
+            cached = cache.get(key)
+            if cached is not None:
+                return Decision(*cached)
+        if stream_block is not None:
+            from streaming import stream_grid_search_cvar
+            decision, info = stream_grid_search_cvar(
+                engine.gcurve, notional_unit, levels=levels, branch=branch, alpha=alpha, mu=mu,
+                max_abs_units=max_abs_units, seed=seed, scheme=scheme, block_leaves=stream_block)
+            if cache is not None:
+                cache.put(key, (decision.x_6, decision.x_12, decision.x_24))
+            return decision
+        if adaptive is not None:
+            with profiler.phase("adaptive_search"):
+                decision, info = adaptive_search_cvar(
+                    engine.gcurve, adaptive, notional_unit, levels=levels, alpha=alpha, mu=mu,
+                    max_abs_units=max_abs_units, solver=solver, round_to_units=round_to_units,
+                    seed=seed, scheme=scheme, reduce_to=reduce_to)
+            if cache is not None:
+                cache.put(key, (decision.x_6, decision.x_12, decision.x_24))
+            return decision
+        expo = None
+        if workers is not None:
+            from parallel_tree import build_tree_parallel
+            tree, expo = build_tree_parallel(engine.gcurve, levels=levels, branch=branch, seed=seed,
+                                             scheme=scheme, workers=workers, exposures=True)
+        elif rolling is not None:
+            tree = rolling.get(engine.gcurve, levels, branch, seed=seed, scheme=scheme)
+        else:
+            tree = build_tree_arrays(engine.gcurve, levels=levels, branch=branch, seed=seed, scheme=scheme)
+        if reduce_to is not None:
+            with profiler.phase("reduce_tree"):
+                tree = reduce_tree(tree, reduce_to)
+            expo = None
+        with profiler.phase("optimize"):
+            if expo is None:
+                expo = leaf_exposures(tree)
+            if solver == "lp":
+                decision, info = _lp_on_exposures(expo, tree.leaf_prob, notional_unit, alpha, mu,
+                                                  max_abs_units, round_to_units)
+            else:
+                decision, info = _grid_on_exposures(expo, tree.leaf_prob, notional_unit, alpha, mu, max_abs_units)
+        # можно временно распечатать инфо:
+        # print("Rebalance info:", info, "Decision:", decision)
+        if cache is not None:
+            cache.put(key, (decision.x_6, decision.x_12, decision.x_24))
+        return decision
@@ -0,0 +1,204 @@
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import optimizer
+from optimizer import Decision, cvar_of_losses, grid_search_cvar, simulate_terminal_pnl
+from gcurve import GCurve
+from scenarios import build_tree
+
+
+def _path_walk_pnl(nodes, decision):
+    # прежний алгоритм: путь корень->лист по родителям для каждого листа
+    levels = max(n.level for n in nodes) + 1
+    root = nodes[0]
+    r_fix = {T: float(root.gcurve_snapshot[T]) for T in (6, 12, 24)}
+    pnl = []
+    for leaf in [i for i, n in enumerate(nodes) if n.level == levels-1]:
+        path, cur = [], leaf
+        while cur is not None:
+            path.append(cur)
+            cur = nodes[cur].parent
+        path = path[::-1]
+        acc = 0.0
+        for s in range(1, len(path)):
+            r_flt = float(nodes[path[s-1]].gcurve_snapshot[3])
+            coupon = 0.0
+            for T, x in ((6, decision.x_6), (12, decision.x_12), (24, decision.x_24)):
+                d = 'receive_fixed' if x >= 0 else 'pay_fixed'
+                coupon += optimizer.swap_coupon_quarter(abs(x), r_fix[T], r_flt, d)
+            acc = (acc + coupon) * nodes[path[s]].acc_mult_to_child
+        pnl.append(acc)
+    return np.array(pnl)
+
+
+class TestOptimizer(unittest.TestCase):
+    def setUp(self):
+        g = GCurve(datetime(2016,12,31), {0:0.09,3:0.095,6:0.10,12:0.105,24:0.11})
+        self.nodes = build_tree(g, levels=4, branch=4, seed=9)
+
+    def test_exposure_pnl_matches_path_walk(self):
+        dec = Decision(20000.0, -10000.0, 30000.0)
+        np.testing.assert_allclose(simulate_terminal_pnl(self.nodes, dec, 10000.0),
+                                   _path_walk_pnl(list(self.nodes), dec), rtol=1e-12, atol=1e-9)
+
+    def test_cvar_partition_matches_sort(self):
+        x = np.random.default_rng(0).normal(size=1001)
+        s = np.sort(x)
+        k = int(np.ceil(0.95 * x.size)) - 1
+        cvar, var = cvar_of_losses(x, 0.95)
+        self.assertEqual(var, s[k])
+        self.assertAlmostEqual(cvar, s[k:].mean(), places=12)
+
+    def test_weighted_cvar(self):
+        rng = np.random.default_rng(3)
+        x = rng.normal(size=200)
+        for alpha in (0.9, 0.95, 0.975):
+            np.testing.assert_allclose(cvar_of_losses(x, alpha, weights=np.full(200, 0.3)), cvar_of_losses(x, alpha))
+        # хвост — от сценария, на котором накопленная вероятность достигла alpha
+        cvar, var = cvar_of_losses(np.array([3.0, 1.0, 4.0, 2.0]), 0.8, weights=np.array([0.2, 0.4, 0.1, 0.3]))
+        self.assertEqual(var, 3.0)
+        self.assertAlmostEqual(cvar, (3.0 * 0.2 + 4.0 * 0.1) / 0.3)
+
+    def test_reduced_tree_cvar_close_to_full(self):
+        from scenarios import build_tree_arrays, reduce_tree
+        g = GCurve(datetime(2016,12,31), {0:0.09,3:0.095,6:0.10,12:0.105,24:0.11})
+        tree = build_tree_arrays(g, levels=4, branch=10, seed=0)
+        red = reduce_tree(tree, max_children=5)
+        d_full, m_full = grid_search_cvar(tree, 1e5, alpha=0.9, max_abs_units=1)
+        d_red, m_red = grid_search_cvar(red, 1e5, alpha=0.9, max_abs_units=1)
+        x = np.array([d_red.x_6, d_red.x_12, d_red.x_24])
+        on_full = cvar_of_losses(-(optimizer.leaf_exposures(tree) @ x), 0.9)[0]
+        self.assertLess(abs(m_red["best_cvar"] - m_full["best_cvar"]), 0.25 * abs(m_full["best_cvar"]))
+        self.assertLess(abs(on_full - m_full["best_cvar"]), 0.1 * abs(m_full["best_cvar"]))
+        d_lp, info = optimizer.lp_search_cvar(red, 1e5, alpha=0.9, max_abs_units=1)
+        self.assertLessEqual(info["best_cvar"], m_red["best_cvar"] + 1e-6)
+
+    def test_grid_search_matches_brute_force(self):
+        unit = 10000.0
+        best, info = grid_search_cvar(self.nodes, unit, alpha=0.9, mu=0.0, max_abs_units=1)
+        scores = {}
+        for n6 in (-1, 0, 1):
+            for n12 in (-1, 0, 1):
+                for n24 in (-1, 0, 1):
+                    if n6 == n12 == n24 == 0:
+                        continue
+                    pnl = _path_walk_pnl(list(self.nodes), Decision(n6*unit, n12*unit, n24*unit))
+                    if pnl.mean() >= 0.0:
+                        scores[(n6, n12, n24)] = cvar_of_losses(-pnl, 0.9)[0]
+        self.assertEqual(info["tried"], len(scores))
+        self.assertAlmostEqual(info["best_cvar"], min(scores.values()), places=6)
+        self.assertAlmostEqual(scores[(best.x_6/unit, best.x_12/unit, best.x_24/unit)], min(scores.values()), places=6)
+
+    def test_lp_agrees_with_grid(self):
+        unit = 10000.0
+        expo = optimizer.leaf_exposures(self.nodes.tree)
+        grid_dec, _ = grid_search_cvar(self.nodes, unit, alpha=0.9, max_abs_units=2)
+        lp_dec, info = optimizer.lp_search_cvar(self.nodes, unit, alpha=0.9, max_abs_units=2)
+        x_grid = np.array([grid_dec.x_6, grid_dec.x_12, grid_dec.x_24])
+        # непрерывный оптимум не хуже лучшей точки сетки по той же мере риска
+        self.assertLessEqual(info["lp_cvar"], optimizer.ru_cvar(-(expo @ x_grid), 0.9) + 1e-6)
+        rounded, rinfo = optimizer.lp_search_cvar(self.nodes, unit, alpha=0.9, max_abs_units=2, round_to_units=True)
+        self.assertEqual(rounded, grid_dec)
+
+    def test_lp_infeasible_mean(self):
+        dec, info = optimizer.lp_search_cvar(self.nodes, 10000.0, alpha=0.9, mu=1e9)
+        self.assertNotEqual(info["status"], 0)
+        self.assertEqual(dec, Decision(0.0, 0.0, 0.0))
+
+    def test_rebalance_decision_cache(self):
+        import os
+        import tempfile
+        from decision_cache import DecisionCache
+        from engine import HedgeEngine
+        from portfolio import Portfolio
+        e = HedgeEngine(Portfolio(N_C=3, N_D=3, V=100000))
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "decisions.pkl")
+            cache = DecisionCache(maxsize=2, path=path)
+            d1 = optimizer.rebalance_once(e, levels=3, branch=3, seed=1, cache=cache)
+            optimizer.rebalance_once(e, levels=3, branch=3, seed=2, cache=cache)
+            self.assertEqual((cache.hits, cache.misses), (0, 2))   # другое зерно — другое дерево
+            self.assertEqual(optimizer.rebalance_once(e, levels=3, branch=3, seed=1, cache=cache), d1)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            # с rolling кеш не читается и не пишется
+            from scenarios import RollingTree
+            rolling = RollingTree()
+            optimizer.rebalance_once(e, levels=3, branch=3, seed=1, cache=cache, rolling=rolling)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            self.assertEqual(rolling.stats()["rebuilt"], 1)
+            # и с Generator: зерно в ключ не попадает, а дерево каждый раз новое
+            optimizer.rebalance_once(e, levels=3, branch=3, seed=np.random.default_rng(0), cache=cache)
+            optimizer.rebalance_once(e, levels=3, branch=3, seed=np.random.default_rng(1), cache=cache)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            self.assertEqual(len(cache), 2)
+            optimizer.rebalance_once(e, levels=3, branch=4, cache=cache)
+            optimizer.rebalance_once(e, levels=4, branch=3, cache=cache)
+            self.assertEqual(len(cache), 2)          # LRU вытеснил первые записи
+            cache.save()
+            again = DecisionCache(maxsize=2, path=path)
+            self.assertEqual(len(again), 2)
+            optimizer.rebalance_once(e, levels=4, branch=3, cache=again)
+            self.assertEqual(again.hits, 1)
+
+    def test_rebalance_with_rolling_tree(self):
+        from engine import HedgeEngine, QUARTER_LEN_DAYS
+        from portfolio import Portfolio
+        from scenarios import RollingTree
+        rolling = RollingTree(max_drift=1.0)
+        e = HedgeEngine(Portfolio(N_C=10, N_D=10, V=100000))
+        e.optimizer = optimizer
+        e.rebalance_kwargs = {"levels": 4, "branch": 3, "seed": 0, "rolling": rolling}
+        e.step(3 * QUARTER_LEN_DAYS)
+        self.assertEqual(rolling.stats()["rebuilt"], 1)
+        self.assertEqual(rolling.stats()["reused"], 2)
+        self.assertEqual(rolling.tree.dates[0], e.t_curr - timedelta(days=1))
+
+    def test_rebalance_with_reduced_tree(self):
+        from engine import HedgeEngine
+        from portfolio import Portfolio
+        e = HedgeEngine(Portfolio(N_C=10, N_D=10, V=100000))
+        full = optimizer.rebalance_once(e, levels=3, branch=5, seed=0)
+        same = optimizer.rebalance_once(e, levels=3, branch=5, seed=0, reduce_to=5)
+        self.assertEqual(full, same)
+        optimizer.rebalance_once(e, levels=4, branch=8, seed=0, reduce_to=3)
+
+    def test_adaptive_sizing_stops_and_reports(self):
+        from optimizer import AdaptiveSizing, adaptive_search_cvar
+        g = GCurve(datetime(2016,12,31), {0:0.09,3:0.095,6:0.10,12:0.105,24:0.11})
+        loose = AdaptiveSizing(branch=3, tol=1.0, atol=1e9)
+        d1, info = adaptive_search_cvar(g, loose, 1e5, levels=4, seed=5)
+        rep = info["sizing"]
+        self.assertEqual((rep["stop"], rep["replicates"], rep["leaves"]), ("converged", 8, 8 * 27))
+        self.assertEqual(adaptive_search_cvar(g, loose, 1e5, levels=4, seed=5)[0], d1)
+        # недостижимая точность — упор в бюджет листьев
+        tight = AdaptiveSizing(branch=3, tol=0.0, max_leaves=500)
+        _, info = adaptive_search_cvar(g, tight, 1e5, levels=4, seed=5)
+        self.assertEqual(info["sizing"]["stop"], "max_leaves")
+        self.assertLessEqual(info["sizing"]["leaves"], 500)
+        # бюджет листьев ограничивает и первые min_reps реплик
+        few = AdaptiveSizing(branch=3, min_reps=8, max_leaves=100)
+        _, info = adaptive_search_cvar(g, few, 1e5, levels=4, seed=5)
+        self.assertEqual((info["sizing"]["replicates"], info["sizing"]["stop"]), (3, "max_leaves"))
+        with self.assertRaises(ValueError):
+            adaptive_search_cvar(g, AdaptiveSizing(branch=3, max_leaves=50), 1e5, levels=4, seed=5)
+        # время кончилось — новые реплики не строятся
+        _, info = adaptive_search_cvar(g, AdaptiveSizing(branch=3, tol=0.0, max_seconds=0.0), 1e5, levels=4, seed=5)
+        self.assertEqual((info["sizing"]["replicates"], info["sizing"]["stop"]), (2, "max_seconds"))
+        self.assertEqual(loose.stats()["calls"], 2)
+        self.assertEqual(tight.stats()["stops"], {"max_leaves": 1})
+
+    def test_rebalance_adaptive(self):
+        from engine import HedgeEngine, QUARTER_LEN_DAYS
+        from portfolio import Portfolio
+        from scenarios import RollingTree
+        sizing = optimizer.AdaptiveSizing(branch=2, max_reps=16)
+        e = HedgeEngine(Portfolio(N_C=10, N_D=10, V=100000))
+        e.optimizer = optimizer
+        e.rebalance_kwargs = {"levels": 3, "seed": 0, "adaptive": sizing}
+        e.step(2 * QUARTER_LEN_DAYS)
+        self.assertEqual(sizing.stats()["calls"], 2)
+        self.assertLessEqual(sizing.stats()["max_replicates"], 16)
+        with self.assertRaises(ValueError):
+            optimizer.rebalance_once(e, adaptive=sizing, rolling=RollingTree())
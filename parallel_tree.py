@@ -0,0 +1,115 @@
+# parallel_tree.py
+"""
+Параллельное построение дерева сценариев по поддеревьям.
+
+Дерево режется на уровне split (как StreamingTree): верх строится в
+основном процессе, поддеревья — в воркерах ProcessPoolExecutor. Воркер
+пишет кривые/множители своих поддеревьев (и экспозиции их листьев) прямо
+в общий блок multiprocessing.shared_memory, обратно не передаётся ничего,
+кроме номера задачи. У поддерева своё зерно (spawn_key (1, i)), поэтому
+дерево бит в бит одно и то же при любом workers.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from gcurve import GCurve, TERMS
+from optimizer import leaf_exposures, propagate_exposures, swap_fixed_rates
+from profiling import profiler
+from scenarios import QUARTER_LEN_DAYS, ScenarioTree, StreamingTree
+
+_tree = None     # StreamingTree воркера (передаётся один раз через initializer)
+_shm = None
+_layout = None   # имя массива -> (смещение в байтах, форма)
+
+
+def _init_worker(tree: StreamingTree, name: str, layout: dict) -> None:
+    global _tree, _shm, _layout
+    _tree, _layout = tree, layout
+    _shm = shared_memory.SharedMemory(name=name)
+
+
+def _view(name: str) -> np.ndarray:
+    offset, shape = _layout[name]
+    return np.ndarray(shape, dtype=np.float64, buffer=_shm.buf, offset=offset)
+
+
+def _build(span: tuple[int, int]) -> int:
+    first, stop = span
+    sub = _tree.forest(first, stop)
+    b = _tree.branch
+    for L in range(1, _tree.depth + 1):
+        rows = slice(first * b ** L, stop * b ** L)
+        _view(f"curves{L}")[rows] = sub.curves[L]
+        _view(f"acc_mult{L}")[rows] = sub.acc_mult[L]
+    if "expo" in _layout:
+        base = leaf_exposures(_tree.top)[first:stop]
+        leaves = slice(first * b ** _tree.depth, stop * b ** _tree.depth)
+        _view("expo")[leaves] = propagate_exposures(sub, swap_fixed_rates(_tree.top), base)
+    return first
+
+
+def _layout_for(tree: StreamingTree, exposures: bool) -> tuple[dict, int]:
+    layout, offset = {}, 0
+    shapes = {}
+    for L in range(1, tree.depth + 1):
+        n = tree.n_subtrees * tree.branch ** L
+        shapes[f"curves{L}"] = (n, len(TERMS))
+        shapes[f"acc_mult{L}"] = (n,)
+    if exposures:
+        shapes["expo"] = (tree.n_leaves, 3)
+    for name, shape in shapes.items():
+        layout[name] = (offset, shape)
+        offset += 8 * int(np.prod(shape))
+    return layout, offset
+
+
+def build_tree_parallel(g: GCurve, levels: int = 6, branch: int = 10, seed=None, scheme: str = "iid",
+                        split: int = 2, workers: int | None = None, exposures: bool = False):
+    """
+    То же дерево, что StreamingTree(g, levels, branch, seed, scheme, split),
+    целиком как ScenarioTree; поддеревья уровня split строятся в workers
+    процессах (None — os.cpu_count(), 1 — без пула). split не больше
+    levels - 1. exposures=True — ещё и leaf_exposures, посчитанные там же
+    по поддеревьям: возвращается (tree, expo).
+    """
+    tree = StreamingTree(g, levels=levels, branch=branch, seed=seed, scheme=scheme,
+                         split=min(split, levels - 1))
+    workers = workers or os.cpu_count() or 1
+    n = tree.n_subtrees
+    step = max(1, -(-n // (4 * workers)))
+    spans = [(i, min(i + step, n)) for i in range(0, n, step)]
+    layout, size = _layout_for(tree, exposures)
+
+    with profiler.phase("build_tree_parallel"):
+        shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        try:
+            if workers == 1 or len(spans) == 1:
+                _init_worker(tree, shm.name, layout)
+                try:
+                    for span in spans:
+                        _build(span)
+                finally:
+                    _shm.close()
+            else:
+                with ProcessPoolExecutor(max_workers=min(workers, len(spans)), initializer=_init_worker,
+                                         initargs=(tree, shm.name, layout)) as pool:
+                    list(pool.map(_build, spans))
+            out = {name: np.ndarray(shape, dtype=np.float64, buffer=shm.buf, offset=offset).copy()
+                   for name, (offset, shape) in layout.items()}
+        finally:
+            shm.close()
+            shm.unlink()
+
+    top, b = tree.top, tree.branch
+    parent, curves, acc_mult = list(top.parent), list(top.curves), list(top.acc_mult)
+    for L in range(1, tree.depth + 1):
+        parent.append(np.repeat(np.arange(n * b ** (L - 1)), b))
+        curves.append(out[f"curves{L}"])
+        acc_mult.append(out[f"acc_mult{L}"])
+    dates = top.dates + [top.dates[-1] + timedelta(days=QUARTER_LEN_DAYS * L) for L in range(1, tree.depth + 1)]
+    full = ScenarioTree(parent, curves, acc_mult, dates)
+    return (full, out["expo"]) if exposures else full
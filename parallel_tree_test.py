@@ -0,0 +1,51 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+import optimizer
+from gcurve import GCurve
+from optimizer import leaf_exposures
+from parallel_tree import build_tree_parallel
+from scenarios import StreamingTree
+from streaming import exposure_blocks
+
+BASE = {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}
+
+
+class TestParallelTree(unittest.TestCase):
+    def setUp(self):
+        self.g = GCurve(datetime(2016,12,31), BASE)
+
+    def test_bit_identical_across_workers(self):
+        ref, ref_expo = build_tree_parallel(self.g, levels=5, branch=4, seed=2, workers=1, exposures=True)
+        self.assertEqual([c.shape[0] for c in ref.curves], [1, 4, 16, 64, 256])
+        for workers in (2, 3):
+            tree, expo = build_tree_parallel(self.g, levels=5, branch=4, seed=2, workers=workers, exposures=True)
+            for name in ("parent", "curves", "acc_mult"):
+                for a, b in zip(getattr(tree, name), getattr(ref, name)):
+                    self.assertEqual(a.tobytes(), b.tobytes())
+            self.assertEqual(tree.dates, ref.dates)
+            self.assertEqual(expo.tobytes(), ref_expo.tobytes())
+        # экспозиции воркеров — те же, что по собранному дереву и потоком
+        np.testing.assert_array_equal(leaf_exposures(ref), ref_expo)
+        stream = StreamingTree(self.g, levels=5, branch=4, seed=2, split=2)
+        np.testing.assert_array_equal(np.concatenate(list(exposure_blocks(stream))), ref_expo)
+        np.testing.assert_allclose(ref.acc_mult[4], 1.0 + ref.curves[3][ref.parent[4], 3] / 4.0)
+
+    def test_shallow_tree_clamps_split(self):
+        tree = build_tree_parallel(self.g, levels=2, branch=3, seed=0, workers=2)
+        self.assertEqual([c.shape[0] for c in tree.curves], [1, 3])
+
+    def test_rebalance_with_workers(self):
+        from engine import HedgeEngine
+        from portfolio import Portfolio
+        e = HedgeEngine(Portfolio(N_C=10, N_D=10, V=100000))
+        one = optimizer.rebalance_once(e, levels=4, branch=4, seed=3, workers=1)
+        self.assertEqual(optimizer.rebalance_once(e, levels=4, branch=4, seed=3, workers=2), one)
+        self.assertEqual(optimizer.rebalance_once(e, levels=4, branch=4, seed=3, workers=2, solver="lp"),
+                         optimizer.rebalance_once(e, levels=4, branch=4, seed=3, workers=1, solver="lp"))
+
+
+if __name__ == "__main__":
+    unittest.main()
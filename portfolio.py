@@ -1,7 +1,13 @@
+import copy
+import json
+import os
+
 import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime
+
+from checkpoint import generator_from_state
+from dates import ORD_DTYPE, add_months, from_ordinals, to_ordinals
 
 LOAN_TERM_OPTS = np.array([6, 12, 24])
 DEP_TERM_OPTS  = np.array([3,  6, 12])
@@ -9,18 +15,109 @@ LOAN_TERM_PROB = None        # равномерно
 DEP_TERM_PROB  = None        # равномерно
 DAYS_PER_MONTH = 365.25 / 12
 
+LOAN, DEPOSIT = 1, -1        # знак денежного потока по стороне баланса
+TYPE_BY_SIGN = {LOAN: "loan", DEPOSIT: "deposit"}
+
+BOOK_COLUMNS = ("id", "type", "volume", "contract_months", "remaining_months",
+                "start_date", "next_payout_date", "maturity_date", "rate")
+REQUIRED_COLUMNS = ("type", "volume", "contract_months", "remaining_months",
+                    "start_date", "maturity_date", "rate")
+
+
+def validate_book(df: pd.DataFrame, offset: int = 0) -> None:
+    """
+        Проверки main.validate_portfolio для загружаемой книги (ValueError):
+        обязательные колонки, тип loan/deposit, объёмы >= 0, ставки > 0,
+        0 <= remaining_months <= contract_months. offset — номер первой
+        строки куска (для сообщений).
+    """
+    missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"portfolio is missing columns {missing}")
+    checks = {
+        "type must be 'loan' or 'deposit'": ~df["type"].isin(list(TYPE_BY_SIGN.values())),
+        "volume must be non-negative": ~(df["volume"] >= 0),
+        "rate must be positive": ~(df["rate"] > 0),
+        "contract_months must be positive": ~(df["contract_months"] > 0),
+        "remaining_months must be within [0, contract_months]":
+            ~((df["remaining_months"] >= 0) & (df["remaining_months"] <= df["contract_months"])),
+        "dates must be set": df[["start_date", "maturity_date"]].isna().any(axis=1),
+    }
+    for message, bad in checks.items():
+        if bad.any():
+            row = offset + int(np.flatnonzero(bad.to_numpy())[0])
+            raise ValueError(f"{message} (row {row})")
+
+
+def _frame_columns(df: pd.DataFrame) -> dict:
+    """DataFrame книги -> аргументы _set_columns."""
+    start = to_ordinals(df["start_date"])
+    if "next_payout_date" in df.columns:
+        next_payout = to_ordinals(df["next_payout_date"])
+    else:
+        next_payout = add_months(start, 1)
+    sign = np.where(np.asarray(df["type"]) == TYPE_BY_SIGN[LOAN], LOAN, DEPOSIT).astype(np.int8)
+    return dict(
+        ids=np.asarray(df["id"], dtype=np.int64) if "id" in df.columns else None,
+        sign=sign,
+        volume=np.asarray(df["volume"], dtype=float),
+        rate=np.asarray(df["rate"], dtype=float),
+        contract_months=np.asarray(df["contract_months"], dtype=np.int64),
+        remaining_months=np.asarray(df["remaining_months"], dtype=float),
+        start_ord=start,
+        next_payout_ord=next_payout,
+        maturity_ord=to_ordinals(df["maturity_date"]),
+    )
+
+
+def _fill_ids(columns: dict) -> dict:
+    """Без колонки id — как у синтетического портфеля: нумерация с 1 внутри стороны."""
+    if columns["ids"] is None:
+        sign = columns["sign"]
+        ids = np.empty(len(sign), dtype=np.int64)
+        for side in (LOAN, DEPOSIT):
+            mask = sign == side
+            ids[mask] = np.arange(1, mask.sum() + 1)
+        columns["ids"] = ids
+    return columns
+
+
+def _read_chunks(chunks) -> dict:
+    """Проверяет и сводит куски DataFrame к колонкам, склеивая их в конце."""
+    parts, offset = [], 0
+    for chunk in chunks:
+        validate_book(chunk, offset)
+        parts.append(_frame_columns(chunk))
+        offset += len(chunk)
+    if not parts:
+        raise ValueError("portfolio file is empty")
+    columns = {name: np.concatenate([p[name] for p in parts]) for name in parts[0] if name != "ids"}
+    columns["ids"] = None if parts[0]["ids"] is None else np.concatenate([p["ids"] for p in parts])
+    return _fill_ids(columns)
+
+
 class Portfolio:
+    """
+        Портфель хранится колонками NumPy (даты — порядковые номера дней),
+        DataFrame строится лениво только для совместимости (get_portfolio).
+    """
     T0 = datetime(2016, 12, 31)
-    credits = pd.DataFrame()
-    deposits = pd.DataFrame()
-    portfolio = pd.DataFrame()
-    
-    rng = np.random.default_rng(42)
+    debug_aggregates = False     # сверять агрегаты с полным пересчётом после каждого изменения
+    # колонки, которые дневное ядро не меняет (общие у fork()), и изменяемые
+    SHARED_COLUMNS = ("ids", "sign", "volume", "contract_months")
+    MUTABLE_COLUMNS = ("rate", "remaining_months", "start_ord", "next_payout_ord", "maturity_ord")
 
-    def __init__(self, N_C=0, N_D=0, V=0):
+    def __init__(self, N_C=0, N_D=0, V=0, seed=42, compact=False):
+        """
+            seed    — зерно (или np.random.Generator) генерации: один seed — один портфель.
+            compact — float32 объёмы/ставки, int8 сроки, категориальный type
+                      (для книг на миллионы контрактов).
+        """
         self.N_C = N_C
         self.N_D = N_D
         self.V = V
+        self.compact = compact
+        self.rng = np.random.default_rng(seed)
 
         # 1. объёмы ---------------------------------------------------------------
         u_loans = self.rng.random(N_C)
@@ -39,85 +136,310 @@ class Portfolio:
         rem_loans[rem_loans < eps] = eps
         rem_deps [rem_deps  < eps] = eps
 
+        terms = np.concatenate([loan_terms, dep_terms])
+        remaining = np.concatenate([rem_loans, rem_deps])
+        # T0 + timedelta(days=m * DAYS_PER_MONTH) с точностью до микросекунд, затем — день
+        micros = np.round(remaining * DAYS_PER_MONTH * 86_400e6).astype(np.int64)
+        maturity = self.T0.toordinal() + micros // 86_400_000_000
+        start = add_months(maturity, -terms)
+        next_payout = add_months(start, 1)
 
-        maturity_loans = [
-            self.T0 + timedelta(days=float(m) * DAYS_PER_MONTH)
-            for m in rem_loans
-        ]
-        maturity_deps = [
-            self.T0 + timedelta(days=float(m) * DAYS_PER_MONTH)
-            for m in rem_deps
-        ]
-
-        start_loans = [
-            mat - relativedelta(months=int(term))
-            for mat, term in zip(maturity_loans, loan_terms)
-        ]
-        start_deps = [
-            mat - relativedelta(months=int(term))
-            for mat, term in zip(maturity_deps, dep_terms)
-        ]
-        next_loans = [data + relativedelta(months=+1) for data in start_loans]
-        next_deps  = [data + relativedelta(months=+1) for data in start_deps]
-
-        # 4. ставка: строим кривыеы
-        rates_loans = [self.loan_curve(term) for term in loan_terms]
-        rates_deps  = [self.dep_curve(term)  for term in dep_terms]
-
-        # 5. собираем всё в DataFrame ---------------------------------------------
-        self.credits = pd.DataFrame(
-            {
-                "id":               range(1, N_C + 1),
-                "type":             "loan",
-                "volume":           vol_loans,
-                "contract_months":  loan_terms,
-                "remaining_months": rem_loans,
-                "start_date":       start_loans,
-                "next_payout_date": next_loans,
-                "maturity_date":    maturity_loans,
-                "rate":             rates_loans,
-            }
-        )
+        # 4. ставка: по одному пакетному розыгрышу на сторону
+        rates = np.concatenate([self.loan_curve(loan_terms), self.dep_curve(dep_terms)])
 
-        self.deposits = pd.DataFrame(
-            {
-                "id":               range(1, N_D + 1),
-                "type":             "deposit",
-                "volume":           vol_deps,
-                "contract_months":  dep_terms,
-                "remaining_months": rem_deps,
-                "start_date":       start_deps,
-                "next_payout_date": next_deps,
-                "maturity_date":    maturity_deps,
-                "rate":             rates_deps,
-            }
+        self._set_columns(
+            ids=np.concatenate([np.arange(1, N_C + 1), np.arange(1, N_D + 1)]),
+            sign=np.concatenate([np.full(N_C, LOAN), np.full(N_D, DEPOSIT)]),
+            volume=np.concatenate([vol_loans, vol_deps]),
+            rate=rates,
+            contract_months=terms,
+            remaining_months=remaining,
+            start_ord=start,
+            next_payout_ord=next_payout,
+            maturity_ord=maturity,
         )
 
-        self.portfolio = pd.concat([self.credits, self.deposits], ignore_index=True)
-        self.portfolio["start_date"] = pd.to_datetime(self.portfolio["start_date"]).dt.normalize()
-        self.portfolio["maturity_date"] = pd.to_datetime(self.portfolio["maturity_date"]).dt.normalize()
-        self.portfolio["next_payout_date"] = pd.to_datetime(self.portfolio["next_payout_date"]).dt.normalize()
-
-    def loan_curve(self, term_months: int, noise=0.0005):
+    def loan_curve(self, term_months, noise=0.0005):
         """
             Базовая линия 10% годовых, чуть падает c дюрацией + шум.
+            term_months может быть массивом — тогда шум берётся одним вызовом.
         """
-        return 0.10 - 0.003 * term_months / 12 + self.rng.normal(0, noise)
+        return 0.10 - 0.003 * term_months / 12 + self.rng.normal(0, noise, size=np.shape(term_months) or None)
 
-    def dep_curve(self, term_months: int, noise=0.0005):
+    def dep_curve(self, term_months, noise=0.0005):
         """
             Кривая ставок для депозитов - чуть ниже кредитной.
         """
-        return 0.08 - 0.0025 * term_months / 12 + self.rng.normal(0, noise)
+        return 0.08 - 0.0025 * term_months / 12 + self.rng.normal(0, noise, size=np.shape(term_months) or None)
+
+    def _set_columns(self, ids, sign, volume, rate, contract_months, remaining_months,
+                     start_ord, next_payout_ord, maturity_ord):
+        real = np.float32 if self.compact else float
+        self.ids              = np.asarray(ids, dtype=np.int64)
+        self.sign             = np.asarray(sign, dtype=np.int8)
+        self.volume           = np.asarray(volume, dtype=real)
+        self.rate             = np.array(rate, dtype=real)
+        self.contract_months  = np.asarray(contract_months, dtype=np.int8 if self.compact else np.int64)
+        self.remaining_months = np.array(remaining_months, dtype=float)
+        self.start_ord        = np.array(start_ord, dtype=ORD_DTYPE)
+        self.next_payout_ord  = np.array(next_payout_ord, dtype=ORD_DTYPE)
+        self.maturity_ord     = np.array(maturity_ord, dtype=ORD_DTYPE)
+        self._frame = None
+        self._agg = self._compute_aggregates()
 
     def get_credits(self):
-        return self.credits
+        return self._side_frame(LOAN)
 
     def get_deposits(self):
-        return self.deposits
+        return self._side_frame(DEPOSIT)
+
+    def _side_frame(self, sign):
+        df = self.get_portfolio()
+        return df.loc[self.sign == sign].reset_index(drop=True)
     
     def get_portfolio(self):
-        return self.portfolio
+        if self._frame is None:
+            self._frame = pd.DataFrame(
+                {
+                    "id":               self.ids,
+                    "type":             self._type_column(),
+                    "volume":           self.volume,
+                    "contract_months":  self.contract_months,
+                    "remaining_months": self.remaining_months,
+                    "start_date":       from_ordinals(self.start_ord),
+                    "next_payout_date": from_ordinals(self.next_payout_ord),
+                    "maturity_date":    from_ordinals(self.maturity_ord),
+                    "rate":             self.rate,
+                }
+            )
+        return self._frame
     
+    def _type_column(self):
+        if self.compact:
+            return pd.Categorical.from_codes((self.sign == DEPOSIT).astype(np.int8),
+                                             categories=[TYPE_BY_SIGN[LOAN], TYPE_BY_SIGN[DEPOSIT]])
+        return np.where(self.sign == LOAN, TYPE_BY_SIGN[LOAN], TYPE_BY_SIGN[DEPOSIT]).astype(object)
+
     def set_portfolio(self, portfolio):
-        self.portfolio = portfolio
\ No newline at end of file
+        """
+            Разбирает DataFrame в колонки. Если нет next_payout_date —
+            берём start_date + 1 месяц.
+        """
+        self._set_columns(**_fill_ids(_frame_columns(portfolio)))
+
+    # ---------------- загрузка реальной книги ----------------------------------
+
+    @classmethod
+    def _from_columns(cls, columns: dict, seed=42, compact=False) -> "Portfolio":
+        p = cls(seed=seed, compact=compact)
+        p._set_columns(**columns)
+        p.N_C = int((p.sign == LOAN).sum())
+        p.N_D = len(p) - p.N_C
+        p.V = p._agg["volume"][LOAN]
+        return p
+
+    @classmethod
+    def from_csv(cls, path, chunksize: int = 1_000_000, seed=42, compact=False, **read_csv_kwargs) -> "Portfolio":
+        """
+            Книга из CSV (колонки как у get_portfolio, id и next_payout_date —
+            необязательны). Читается кусками по chunksize строк: каждый кусок
+            проверяется и сразу сводится к колонкам NumPy, DataFrame целиком
+            не строится.
+        """
+        reader = pd.read_csv(path, chunksize=chunksize, float_precision="round_trip",
+                             usecols=lambda c: c in BOOK_COLUMNS, **read_csv_kwargs)
+        return cls._from_columns(_read_chunks(reader), seed=seed, compact=compact)
+
+    @classmethod
+    def from_parquet(cls, path, batch_size: int = 1_000_000, seed=42, compact=False) -> "Portfolio":
+        """
+            Книга из Parquet (нужен pyarrow). Файл отображается в память
+            (memory_map), колонки читаются батчами по batch_size строк.
+        """
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Portfolio.from_parquet requires pyarrow") from exc
+        pf = pq.ParquetFile(path, memory_map=True)
+        columns = [c for c in pf.schema_arrow.names if c in BOOK_COLUMNS]
+        batches = (b.to_pandas() for b in pf.iter_batches(batch_size=batch_size, columns=columns))
+        return cls._from_columns(_read_chunks(batches), seed=seed, compact=compact)
+
+    def save_npy(self, path: str) -> None:
+        """Колонки в каталог path (<колонка>.npy + meta.json) для from_npy."""
+        os.makedirs(path, exist_ok=True)
+        for name in self.SHARED_COLUMNS + self.MUTABLE_COLUMNS:
+            np.save(os.path.join(path, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"N_C": int(self.N_C), "N_D": int(self.N_D), "V": float(self.V),
+                       "compact": self.compact}, f)
+
+    @classmethod
+    def from_npy(cls, path: str, mmap_mode: str | None = "c", seed=42) -> "Portfolio":
+        """
+            Книга из save_npy. По умолчанию колонки отображаются в память
+            copy-on-write (mmap_mode="c"): неизменяемые колонки читаются с
+            диска по мере надобности, изменения движка остаются в памяти
+            процесса и файл не трогают.
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        p = cls(seed=seed, compact=meta["compact"])
+        for name in cls.SHARED_COLUMNS + cls.MUTABLE_COLUMNS:
+            setattr(p, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+        p.N_C, p.N_D, p.V = meta["N_C"], meta["N_D"], meta["V"]
+        p._frame = None
+        p._agg = p._compute_aggregates()
+        return p
+
+    @property
+    def portfolio(self):
+        return self.get_portfolio()
+
+    # ---------------- состояние: checkpoint / fork ------------------------------
+
+    def get_state(self) -> tuple[dict, dict]:
+        """(колонки, скаляры для JSON): всё, что нужно для from_state()."""
+        arrays = {name: getattr(self, name) for name in self.SHARED_COLUMNS + self.MUTABLE_COLUMNS}
+        meta = {
+            "N_C": self.N_C, "N_D": self.N_D, "V": self.V, "compact": self.compact,
+            "rng": self.rng.bit_generator.state,
+            # поддерживаемые агрегаты сохраняются как есть: полный пересчёт
+            # мог бы разойтись с ними в последних битах
+            "agg": {key: [[side, value] for side, value in by_side.items()]
+                    for key, by_side in self._agg.items()},
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_state(cls, arrays: dict, meta: dict) -> "Portfolio":
+        self = cls.__new__(cls)
+        self.N_C, self.N_D, self.V, self.compact = meta["N_C"], meta["N_D"], meta["V"], meta["compact"]
+        self.rng = generator_from_state(meta["rng"])
+        for name in cls.SHARED_COLUMNS + cls.MUTABLE_COLUMNS:
+            setattr(self, name, np.array(arrays[name]))
+        self._agg = {key: {int(side): value for side, value in pairs} for key, pairs in meta["agg"].items()}
+        for side, counts in self._agg["count_by_term"].items():
+            self._agg["count_by_term"][side] = {int(t): c for t, c in counts.items()}
+        self._frame = None
+        return self
+
+    def fork(self) -> "Portfolio":
+        """
+            Независимая копия для what-if ветки. SHARED_COLUMNS не копируются:
+            ветка получает на них read-only представления (запись в ветке
+            падает, а не портит родителя); изменяемые колонки копируются.
+        """
+        new = copy.copy(self)
+        for name in self.SHARED_COLUMNS:
+            view = getattr(self, name).view()
+            view.flags.writeable = False
+            setattr(new, name, view)
+        for name in self.MUTABLE_COLUMNS:
+            setattr(new, name, getattr(self, name).copy())
+        new.rng = copy.deepcopy(self.rng)
+        new._agg = copy.deepcopy(self._agg)
+        new._frame = None
+        return new
+
+    def __len__(self):
+        return self.volume.size
+
+    # ---------------- дневное ядро для HedgeEngine.step ----------------------
+
+    def _signed_coupon(self, mask) -> float:
+        """Месячный купон: кредиты минус депозиты по маске."""
+        coupon = self.volume[mask] * self.rate[mask] / 12.0
+        sign = self.sign[mask]
+        return float(coupon[sign == LOAN].sum() - coupon[sign == DEPOSIT].sum())
+
+    def pay_coupons(self, t_ord: int) -> float:
+        """
+            Выплаты по контрактам с next_payout_date <= t_ord; дата выплаты
+            сдвигается на месяц. Возвращает чистый поток (кредиты - депозиты).
+        """
+        due = self.next_payout_ord <= t_ord
+        if not due.any():
+            return 0.0
+        cash = self._signed_coupon(due)
+        self.next_payout_ord[due] = add_months(self.next_payout_ord[due], 1)
+        self._frame = None
+        return cash
+
+    def age(self, days: int = 1) -> None:
+        self.remaining_months -= days * (1.0 / DAYS_PER_MONTH)
+        self._frame = None
+
+    def rollover(self, t_ord: int, rate_fn) -> float:
+        """
+            Перекатывает погашенные контракты (remaining_months <= 0) по
+            текущей кривой rate_fn(term). Возвращает последний купон.
+        """
+        matured = np.flatnonzero(self.remaining_months <= 0)
+        if matured.size == 0:
+            return 0.0
+        sign = self.sign[matured]
+        cash = float(np.sum(sign * self.volume[matured] * (self.rate[matured] / 12)))
+
+        terms = self.contract_months[matured]
+        old_vr = self.volume[matured] * self.rate[matured].astype(float)
+        for term in np.unique(terms):
+            self.rate[matured[terms == term]] = float(rate_fn(int(term)))
+        # агрегаты: объёмы и сроки не меняются, сдвигается только Σ volume * rate
+        delta = self.volume[matured] * self.rate[matured].astype(float) - old_vr
+        self._agg["vr"][LOAN] += float(delta[sign == LOAN].sum())
+        self._agg["vr"][DEPOSIT] += float(delta[sign == DEPOSIT].sum())
+        if self.debug_aggregates:
+            self.check_aggregates()
+        self.start_ord[matured] = t_ord
+        self.maturity_ord[matured] = add_months(np.full(matured.size, t_ord), terms)
+        self.remaining_months[matured] = terms.astype(float)
+        self._frame = None
+        return cash
+
+    # ---------------- агрегаты по сторонам ------------------------------------
+
+    def _compute_aggregates(self) -> dict:
+        """Полный пересчёт: Σ объёма, Σ объём*ставка и число контрактов по срокам."""
+        agg = {"volume": {}, "vr": {}, "count_by_term": {}}
+        for side in (LOAN, DEPOSIT):
+            mask = self.sign == side
+            vol = self.volume[mask].astype(float)
+            agg["volume"][side] = float(vol.sum())
+            agg["vr"][side] = float(np.dot(vol, self.rate[mask].astype(float)))
+            terms, counts = np.unique(self.contract_months[mask], return_counts=True)
+            agg["count_by_term"][side] = {int(t): int(c) for t, c in zip(terms, counts)}
+        return agg
+
+    def aggregates(self) -> dict:
+        """
+            Итоги по сторонам за O(1): объём, средневзвешенная ставка,
+            месячный купон, число контрактов по срокам.
+            Поддерживаются rollover()/set_portfolio(); прямые правки self.rate
+            их не обновляют (см. check_aggregates).
+        """
+        out = {}
+        for side in (LOAN, DEPOSIT):
+            vol, vr = self._agg["volume"][side], self._agg["vr"][side]
+            out[TYPE_BY_SIGN[side]] = {
+                "volume": vol,
+                "rate": vr / vol if vol else 0.0,
+                "monthly_coupon": vr / 12.0,
+                "count_by_term": dict(self._agg["count_by_term"][side]),
+            }
+        return out
+
+    def daily_accrual(self) -> float:
+        """Чистое дневное начисление по портфелю (кредиты - депозиты), /365."""
+        return (self._agg["vr"][LOAN] - self._agg["vr"][DEPOSIT]) / 365.0
+
+    def check_aggregates(self, rtol: float = 1e-9) -> None:
+        """Сверка поддерживаемых агрегатов с полным пересчётом (RuntimeError при расхождении)."""
+        fresh = self._compute_aggregates()
+        for side in (LOAN, DEPOSIT):
+            for key in ("volume", "vr"):
+                a, b = self._agg[key][side], fresh[key][side]
+                if abs(a - b) > rtol * max(1.0, abs(b)):
+                    raise RuntimeError(f"aggregate {key}[{TYPE_BY_SIGN[side]}] drifted: {a} != {b}")
+            if self._agg["count_by_term"][side] != fresh["count_by_term"][side]:
+                raise RuntimeError(f"term counts for {TYPE_BY_SIGN[side]} drifted")
@@ -0,0 +1,141 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+from dateutil.relativedelta import relativedelta
+
+from dates import add_months
+from portfolio import Portfolio
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+class TestPortfolioColumns(unittest.TestCase):
+    def test_frame_roundtrip(self):
+        p = Portfolio(N_C=7, N_D=5, V=10000)
+        df = p.get_portfolio().copy()
+        q = Portfolio()
+        q.set_portfolio(df)
+        self.assertEqual(len(q), 12)
+        self.assertTrue((q.next_payout_ord == p.next_payout_ord).all())
+        self.assertTrue((q.get_portfolio()["type"] == df["type"]).all())
+
+    def test_rollover_reprices_from_curve(self):
+        p = Portfolio(N_C=4, N_D=4, V=10000)
+        p.remaining_months[:] = 1.0
+        p.remaining_months[0] = 0.0
+        t = datetime(2017, 1, 31).toordinal()
+        cash = p.rollover(t, lambda term: 0.5)
+        self.assertNotEqual(cash, 0.0)
+        self.assertEqual(p.rate[0], 0.5)
+        self.assertEqual(p.remaining_months[0], p.contract_months[0])
+        self.assertEqual(p.maturity_ord[0], add_months(t, p.contract_months[0]))
+        # остальные не тронуты
+        self.assertTrue((p.rate[1:] != 0.5).all())
+
+    def test_seed_reproducible(self):
+        a = Portfolio(N_C=50, N_D=40, V=10000, seed=3)
+        b = Portfolio(N_C=50, N_D=40, V=10000, seed=3)
+        c = Portfolio(N_C=50, N_D=40, V=10000, seed=4)
+        self.assertTrue((a.rate == b.rate).all() and (a.maturity_ord == b.maturity_ord).all())
+        self.assertFalse((a.rate == c.rate).all())
+
+    def test_vectorized_dates_match_scalar_construction(self):
+        p = Portfolio(N_C=200, N_D=200, V=10000, seed=1)
+        for i in range(len(p)):
+            mat = p.T0 + timedelta(days=float(p.remaining_months[i]) * (365.25 / 12))
+            start = mat - relativedelta(months=int(p.contract_months[i]))
+            self.assertEqual(p.maturity_ord[i], mat.toordinal())
+            self.assertEqual(p.start_ord[i], start.toordinal())
+            self.assertEqual(p.next_payout_ord[i], (start + relativedelta(months=1)).toordinal())
+
+    def test_compact_dtypes(self):
+        p = Portfolio(N_C=30, N_D=20, V=10000, compact=True)
+        df = p.get_portfolio()
+        self.assertEqual(p.volume.dtype, np.float32)
+        self.assertEqual(p.contract_months.dtype, np.int8)
+        self.assertEqual(str(df["type"].dtype), "category")
+        self.assertAlmostEqual(float(p.get_credits()["volume"].sum()), 10000, places=1)
+        self.assertEqual(len(p.get_deposits()), 20)
+
+    def test_aggregates_follow_rollovers(self):
+        from engine import HedgeEngine
+        p = Portfolio(N_C=40, N_D=30, V=10000, seed=2)
+        p.debug_aggregates = True            # каждая перекатка сверяется с пересчётом
+        e = HedgeEngine(p)
+        e.step(400)
+        agg = p.aggregates()
+        df = p.get_portfolio()
+        loans = df[df["type"] == "loan"]
+        self.assertAlmostEqual(agg["loan"]["volume"], loans["volume"].sum(), places=6)
+        self.assertAlmostEqual(agg["loan"]["rate"],
+                               (loans["volume"] * loans["rate"]).sum() / loans["volume"].sum(), places=12)
+        self.assertEqual(sum(agg["deposit"]["count_by_term"].values()), 30)
+        self.assertEqual(e.snapshot_state()["portfolio_total_deps"], agg["deposit"]["volume"])
+
+    def test_check_aggregates_detects_drift(self):
+        p = Portfolio(N_C=5, N_D=5, V=10000)
+        p.check_aggregates()
+        p.rate[0] += 0.01                    # правка в обход rollover
+        with self.assertRaises(RuntimeError):
+            p.check_aggregates()
+
+    # ---------------- загрузка книги из файлов ----------------------------------
+
+    def _engine_result(self, p):
+        from engine import HedgeEngine
+        e = HedgeEngine(p)
+        e.add_swap("pay_fixed", 12, 20000)
+        e.step(200)
+        return e.bank_account, e.swap_account, p.rate.tolist(), p.next_payout_ord.tolist()
+
+    def test_from_csv_chunked_matches_synthetic(self):
+        src = Portfolio(N_C=40, N_D=30, V=100000, seed=8)
+        df = src.get_portfolio()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.csv")
+            df.drop(columns=["id", "next_payout_date"]).to_csv(path, index=False)
+            p = Portfolio.from_csv(path, chunksize=16)
+        self.assertEqual((p.N_C, p.N_D), (40, 30))
+        self.assertAlmostEqual(p.V, 100000, places=6)
+        self.assertTrue((p.ids == src.ids).all())
+        self.assertEqual(p.aggregates(), src.aggregates())
+        ref = Portfolio(N_C=40, N_D=30, V=100000, seed=8)
+        self.assertEqual(self._engine_result(p), self._engine_result(ref))
+
+    def test_from_csv_validates_each_chunk(self):
+        df = Portfolio(N_C=10, N_D=10, V=1000).get_portfolio().copy()
+        df.loc[13, "remaining_months"] = df.loc[13, "contract_months"] + 1
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.csv")
+            df.to_csv(path, index=False)
+            with self.assertRaisesRegex(ValueError, r"remaining_months.*row 13"):
+                Portfolio.from_csv(path, chunksize=5)
+            df.drop(columns=["rate"]).to_csv(path, index=False)
+            with self.assertRaisesRegex(ValueError, "missing columns"):
+                Portfolio.from_csv(path)
+
+    def test_npy_memory_mapped_copy_on_write(self):
+        src = Portfolio(N_C=40, N_D=30, V=100000, seed=8, compact=True)
+        with tempfile.TemporaryDirectory() as tmp:
+            src.save_npy(tmp)
+            p = Portfolio.from_npy(tmp)
+            self.assertIsInstance(p.volume, np.memmap)
+            self.assertEqual(p.volume.dtype, np.float32)
+            self.assertEqual(self._engine_result(p), self._engine_result(src.fork()))
+            on_disk = np.load(os.path.join(tmp, "rate.npy"))
+            self.assertTrue((on_disk == Portfolio(N_C=40, N_D=30, V=100000, seed=8, compact=True).rate).all())
+
+    @unittest.skipUnless(pyarrow, "pyarrow is not installed")
+    def test_from_parquet_matches_frame(self):
+        src = Portfolio(N_C=40, N_D=30, V=100000, seed=8)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "book.parquet")
+            src.get_portfolio().to_parquet(path)
+            p = Portfolio.from_parquet(path, batch_size=16)
+        self.assertEqual(self._engine_result(p), self._engine_result(Portfolio(N_C=40, N_D=30, V=100000, seed=8)))
@@ -0,0 +1,92 @@
+# profiling.py
+import cProfile
+import json
+import os
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+
+_OFF = nullcontext()
+
+
+class _Phase:
+    __slots__ = ("prof", "name", "t0")
+
+    def __init__(self, prof, name):
+        self.prof = prof
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        self.prof.seconds[self.name] = self.prof.seconds.get(self.name, 0.0) + dt
+        self.prof.calls[self.name] = self.prof.calls.get(self.name, 0) + 1
+        return False
+
+
+class Profiler:
+    """
+    Накопительные таймеры и счётчики вызовов по фазам:
+        with profiler.phase("gcurve_step"): ...
+    Выключенный профайлер отдаёт общий nullcontext — накладные расходы
+    сводятся к одному вызову метода. Включается enable() или переменной
+    окружения HEDGING_PROFILE=1.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.seconds = {}
+        self.calls = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def reset(self) -> None:
+        self.seconds.clear()
+        self.calls.clear()
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return _OFF
+        return _Phase(self, name)
+
+    def report(self) -> dict:
+        """{фаза: {"seconds", "calls", "mean_us"}}, по убыванию времени."""
+        rows = sorted(self.seconds.items(), key=lambda kv: -kv[1])
+        return {name: {"seconds": sec,
+                       "calls": self.calls[name],
+                       "mean_us": 1e6 * sec / self.calls[name]}
+                for name, sec in rows}
+
+    def to_json(self, path: str | None = None) -> str:
+        text = json.dumps(self.report(), indent=2)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    @contextmanager
+    def cprofile(self, path: str | None = None, sort: str = "cumulative", top: int = 0):
+        """
+        cProfile на время блока. path — дамп для pstats/snakeviz;
+        top > 0 — напечатать top строк статистики.
+        """
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield prof
+        finally:
+            prof.disable()
+            if path is not None:
+                prof.dump_stats(path)
+            if top:
+                pstats.Stats(prof).sort_stats(sort).print_stats(top)
+
+
+profiler = Profiler(enabled=os.environ.get("HEDGING_PROFILE", "") not in ("", "0"))
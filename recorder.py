@@ -0,0 +1,147 @@
+# recorder.py
+import json
+import os
+
+import numpy as np
+
+from dates import ORD_DTYPE, from_ordinals
+from gcurve import TERMS
+
+COLUMNS = {
+    "date":            ORD_DTYPE,        # порядковый номер дня (date.toordinal())
+    "bank_account":    np.float64,
+    "swap_account":    np.float64,
+    "accrued_swap":    np.float64,
+    **{f"r_{m}": np.float64 for m in TERMS},
+    "swaps_count":     np.int32,
+    "loans_volume":    np.float64,
+    "deposits_volume": np.float64,
+}
+
+
+class Recorder:
+    """
+    Дневной ряд состояния HedgeEngine в преаллоцированных колонках NumPy.
+    Подключение: engine.recorder = Recorder(...); запись — в конце каждого дня step().
+    path=None — всё в памяти; иначе полные буферы по chunk_size строк дописываются
+    на диск, так что память ограничена одним буфером:
+      fmt="raw"     — по файлу на колонку (<col>.bin, сырые данные) + meta.json;
+                      load() отдаёт np.memmap на весь ряд;
+      fmt="parquet" — одна row group на буфер (нужен pyarrow).
+    """
+
+    def __init__(self, path: str | None = None, chunk_size: int = 4096, fmt: str = "raw"):
+        if fmt not in ("raw", "parquet"):
+            raise ValueError(f"fmt must be 'raw' or 'parquet', got {fmt!r}")
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        self.path = path
+        self.fmt = fmt
+        self.chunk_size = int(chunk_size)
+        self.rows = 0                # всего записано (включая сброшенное на диск)
+        self._n = 0                  # заполнено в текущем буфере
+        self._buf = {name: np.empty(self.chunk_size, dtype=dt) for name, dt in COLUMNS.items()}
+        self._chunks = []            # path=None: сброшенные буферы в памяти
+        self._writer = None
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            if fmt == "raw":
+                for name in COLUMNS:
+                    open(self._column_file(path, name), "wb").close()
+                self._write_meta()
+
+    @staticmethod
+    def _column_file(path: str, name: str) -> str:
+        return os.path.join(path, f"{name}.bin")
+
+    def record(self, engine) -> None:
+        i = self._n
+        b = self._buf
+        b["date"][i] = engine.t_curr.toordinal()
+        b["bank_account"][i] = engine.bank_account
+        b["swap_account"][i] = engine.swap_account
+        b["accrued_swap"][i] = engine.accrued_swap
+        for m in TERMS:
+            b[f"r_{m}"][i] = engine.gcurve.rate(m)
+        b["swaps_count"][i] = len(engine.swap_book)
+        agg = engine.portfolio.aggregates()
+        b["loans_volume"][i] = agg["loan"]["volume"]
+        b["deposits_volume"][i] = agg["deposit"]["volume"]
+        self._n += 1
+        self.rows += 1
+        if self._n == self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self._n == 0:
+            return
+        chunk = {name: buf[:self._n] for name, buf in self._buf.items()}
+        if self.path is None:
+            self._chunks.append({name: col.copy() for name, col in chunk.items()})
+        elif self.fmt == "raw":
+            for name, col in chunk.items():
+                with open(self._column_file(self.path, name), "ab") as f:
+                    f.write(col.tobytes())
+        else:
+            self._write_parquet(chunk)
+        self._n = 0
+        if self.path is not None and self.fmt == "raw":
+            self._write_meta()
+
+    def _write_meta(self) -> None:
+        meta = {"rows": self.rows - self._n,
+                "columns": {name: np.dtype(dt).str for name, dt in COLUMNS.items()}}
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    def _write_parquet(self, chunk: dict) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("Recorder(fmt='parquet') requires pyarrow") from exc
+        table = pa.table(chunk)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(os.path.join(self.path, "series.parquet"), table.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def columns(self) -> dict:
+        """Весь ряд как словарь колонок (для path=None и для записанного на диск)."""
+        if self.path is not None:
+            self.flush()
+            if self._writer is not None:
+                raise RuntimeError("close() the parquet recorder before reading it back")
+            return load(self.path)
+        parts = self._chunks + [{name: buf[:self._n] for name, buf in self._buf.items()}]
+        return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+    def to_frame(self):
+        import pandas as pd
+        df = pd.DataFrame({name: np.asarray(col) for name, col in self.columns().items()})
+        df["date"] = from_ordinals(df["date"].to_numpy())
+        return df
+
+
+def load(path: str) -> dict:
+    """Ряд, записанный Recorder(path): колонки как np.memmap (raw) или из parquet."""
+    meta_file = os.path.join(path, "meta.json")
+    if os.path.exists(meta_file):
+        with open(meta_file) as f:
+            meta = json.load(f)
+        rows = meta["rows"]
+        out = {}
+        for name, dt in meta["columns"].items():
+            if rows == 0:
+                out[name] = np.empty(0, dtype=dt)
+            else:
+                out[name] = np.memmap(Recorder._column_file(path, name), dtype=dt, mode="r", shape=(rows,))
+        return out
+    import pyarrow.parquet as pq
+    table = pq.read_table(os.path.join(path, "series.parquet"), memory_map=True)
+    return {name: table.column(name).to_numpy() for name in table.column_names}
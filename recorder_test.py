@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from engine import HedgeEngine
+from portfolio import Portfolio
+from recorder import COLUMNS, Recorder, load
+
+
+class TestRecorder(unittest.TestCase):
+    def _run(self, recorder, days=50):
+        e = HedgeEngine(Portfolio(N_C=20, N_D=20, V=100000, seed=3))
+        e.recorder = recorder
+        states = []
+        for _ in range(days):
+            e.step()
+            states.append(e.snapshot_state())
+        return states
+
+    def test_in_memory_matches_snapshots(self):
+        rec = Recorder(chunk_size=7)
+        states = self._run(rec)
+        cols = rec.columns()
+        self.assertEqual(rec.rows, 50)
+        self.assertEqual(set(cols), set(COLUMNS))
+        self.assertEqual(cols["date"].tolist(), [s["date"].toordinal() for s in states])
+        np.testing.assert_array_equal(cols["bank_account"], [s["bank_account"] for s in states])
+        np.testing.assert_allclose(cols["r_12"], [s["gcurve"][12] for s in states], atol=5e-7)
+        np.testing.assert_array_equal(cols["loans_volume"], [s["portfolio_total_loans"] for s in states])
+        df = rec.to_frame()
+        self.assertEqual(df["date"].iloc[0], states[0]["date"])
+
+    def test_raw_chunks_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            mem = Recorder(chunk_size=16)
+            self._run(mem)
+            rec = Recorder(os.path.join(tmp, "run"), chunk_size=16)
+            self._run(rec)
+            self.assertEqual(load(rec.path)["date"].size, 48)   # хвост ещё в буфере
+            rec.close()
+            cols = load(rec.path)
+            self.assertIsInstance(cols["bank_account"], np.memmap)
+            for name, col in mem.columns().items():
+                np.testing.assert_array_equal(cols[name], col)
+                self.assertEqual(cols[name].dtype, col.dtype)
+
+    def test_advance_records_every_day(self):
+        rec = Recorder()
+        e = HedgeEngine(Portfolio(N_C=5, N_D=5, V=100000))
+        e.recorder = rec
+        e.advance(30)
+        self.assertEqual(np.diff(rec.columns()["date"]).tolist(), [1] * 29)
+
+
+if __name__ == "__main__":
+    unittest.main()
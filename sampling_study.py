@@ -0,0 +1,62 @@
+# sampling_study.py
+"""
+Сходимость CVaR по схемам шоков дерева (scenarios.branch_shocks).
+
+    python sampling_study.py --levels 4 --branches 4 8 16 --reps 40
+
+Для каждой схемы и branch — reps деревьев с независимыми зёрнами; CVaR
+терминального PnL фиксированной позиции сравнивается с эталоном (iid,
+ref_branch веток, среднее по ref_reps деревьям): среднее, разброс, RMSE.
+"""
+import argparse
+
+import numpy as np
+
+from gcurve import GCurve
+from optimizer import Decision, cvar_of_losses, simulate_terminal_pnl
+from portfolio import Portfolio
+from scenarios import SCHEMES, build_tree_arrays
+
+BASE = {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}
+DECISION = Decision(100_000.0, -100_000.0, 50_000.0)
+
+
+def tree_cvar(g: GCurve, levels: int, branch: int, scheme: str, seed, alpha: float = 0.95,
+              decision: Decision = DECISION) -> float:
+    tree = build_tree_arrays(g, levels=levels, branch=branch, seed=seed, scheme=scheme)
+    return cvar_of_losses(-simulate_terminal_pnl(tree, decision, 1.0), alpha)[0]
+
+
+def convergence_study(g: GCurve | None = None, levels: int = 4, branches=(4, 8, 16), schemes=SCHEMES,
+                      reps: int = 40, ref_branch: int = 48, ref_reps: int = 4,
+                      alpha: float = 0.95, seed: int = 0) -> list[dict]:
+    """Строки {scheme, branch, leaves, mean, std, rmse} и эталон (scheme="reference")."""
+    g = g or GCurve(Portfolio.T0, BASE)
+    ss = np.random.SeedSequence(seed)
+    ref_seeds, *run_seeds = ss.spawn(1 + len(schemes) * len(branches))
+    ref = float(np.mean([tree_cvar(g, levels, ref_branch, "iid", s, alpha) for s in ref_seeds.spawn(ref_reps)]))
+    rows = [{"scheme": "reference", "branch": ref_branch, "leaves": ref_branch ** (levels - 1),
+             "mean": ref, "std": 0.0, "rmse": 0.0}]
+    it = iter(run_seeds)
+    for scheme in schemes:
+        for branch in branches:
+            est = np.array([tree_cvar(g, levels, branch, scheme, s, alpha) for s in next(it).spawn(reps)])
+            rows.append({"scheme": scheme, "branch": branch, "leaves": branch ** (levels - 1),
+                         "mean": float(est.mean()), "std": float(est.std(ddof=1)),
+                         "rmse": float(np.sqrt(np.mean((est - ref) ** 2)))})
+    return rows
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="CVaR convergence by branch sampling scheme")
+    ap.add_argument("--levels", type=int, default=4)
+    ap.add_argument("--branches", type=int, nargs="+", default=[4, 8, 16])
+    ap.add_argument("--reps", type=int, default=40)
+    ap.add_argument("--ref-branch", type=int, default=48)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    rows = convergence_study(levels=args.levels, branches=args.branches, reps=args.reps,
+                             ref_branch=args.ref_branch, seed=args.seed)
+    print(f"{'scheme':12s} {'branch':>6s} {'leaves':>8s} {'mean':>12s} {'std':>10s} {'rmse':>10s}")
+    for r in rows:
+        print(f"{r['scheme']:12s} {r['branch']:6d} {r['leaves']:8d} {r['mean']:12.2f} {r['std']:10.2f} {r['rmse']:10.2f}")
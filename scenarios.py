@@ -1,11 +1,18 @@
 # scenarios.py
+from bisect import bisect_right
+from collections.abc import Sequence
 from dataclasses import dataclass
 from typing import List, Optional
-from copy import deepcopy
-from gcurve import GCurve
 from datetime import timedelta
 
+import numpy as np
+
+from gcurve import GCurve, TERMS, DEFAULT_PHI, DEFAULT_SIGMA, ar1_jump
+from profiling import profiler
+
 QUARTER_LEN_DAYS = 91
+TERM_COL = {m: j for j, m in enumerate(TERMS)}   # столбец срока в матрице кривых
+SCHEMES = ("iid", "antithetic", "moment", "sobol")
 
 @dataclass
 class Node:
@@ -15,29 +22,435 @@ class Node:
     gcurve_snapshot: dict
     acc_mult_to_child: float  # множитель наращения до следующего узла (1 + r_1y/4)
 
-def build_tree(g: GCurve, levels: int = 6, branch: int = 10) -> List[Node]:
-    nodes: List[Node] = []
-    idx_by_level = []  # списки индексов узлов каждого уровня
-    # корень
-    nodes.append(Node(0, None, g.t_curr, g.snapshot(), 1.0))
-    idx_by_level.append([0])
-
-    for L in range(1, levels):
-        idx_by_level.append([])
-        new_nodes = []
-        for p_idx in idx_by_level[L-1]:
-            # из снапшота восстановим временную кривую для ветвления
-            base = {m: nodes[p_idx].gcurve_snapshot[m] for m in [0,3,6,12,24]}
-            # для каждой ветки копируем кривую и «прокручиваем» квартал случайно
-            for _ in range(branch):
-                g_local = GCurve(nodes[p_idx].date, base, seed=None)  # seed=None для разнообразия
-                g_local.step(QUARTER_LEN_DAYS)
-                snap = g_local.snapshot()
-                # множитель наращения: 1 + r_1y(parent)/4
-                r1y_parent = nodes[p_idx].gcurve_snapshot[12]
-                acc_mult = 1.0 + float(r1y_parent) / 4.0
-                node = Node(L, p_idx, g_local.t_curr, snap, acc_mult)
-                idx_by_level[L].append(len(nodes) + len(new_nodes))
-                new_nodes.append(node)
-        nodes.extend(new_nodes)
-    return nodes
+
+@dataclass
+class ScenarioTree:
+    """
+    Дерево сценариев по уровням. Для уровня L:
+      parent[L]   — индекс родителя в уровне L-1 (у корня -1);
+      curves[L]   — кривые узлов [n_L, len(TERMS)] (как в snapshot(), округлены до 1e-6);
+      acc_mult[L] — множитель наращения от родителя (1 + r_1y(parent)/4);
+      dates[L]    — дата уровня;
+      prob[L]     — вероятности узлов уровня (сумма 1); None — равновероятные
+                    (дерево build_tree), иначе — после reduce_tree.
+    Узлы уровня упорядочены по родителю, внутри — по ветке.
+    """
+    parent: List[np.ndarray]
+    curves: List[np.ndarray]
+    acc_mult: List[np.ndarray]
+    dates: List[object]
+    prob: Optional[List[np.ndarray]] = None
+
+    @property
+    def levels(self) -> int:
+        return len(self.curves)
+
+    @property
+    def n_nodes(self) -> int:
+        return sum(c.shape[0] for c in self.curves)
+
+    @property
+    def n_leaves(self) -> int:
+        return self.curves[-1].shape[0]
+
+    @property
+    def leaf_prob(self) -> Optional[np.ndarray]:
+        """Вероятности листьев или None, если листья равновероятны."""
+        return None if self.prob is None else self.prob[-1]
+
+    def nodes(self) -> "NodeList":
+        return NodeList(self)
+
+    @classmethod
+    def from_nodes(cls, nodes) -> "ScenarioTree":
+        """Обратное преобразование из списка Node (узлы уровня подряд, как в build_tree)."""
+        if isinstance(nodes, cls):
+            return nodes
+        tree = getattr(nodes, "tree", None)
+        if tree is not None:
+            return tree
+        levels = max(n.level for n in nodes) + 1
+        local = {}
+        parent, curves, acc_mult, dates = [], [], [], []
+        for L in range(levels):
+            idx = [i for i, n in enumerate(nodes) if n.level == L]
+            for k, i in enumerate(idx):
+                local[i] = k
+            parent.append(np.array([-1 if nodes[i].parent is None else local[nodes[i].parent] for i in idx], dtype=np.int64))
+            curves.append(np.array([[float(nodes[i].gcurve_snapshot[m]) for m in TERMS] for i in idx]))
+            acc_mult.append(np.array([nodes[i].acc_mult_to_child for i in idx], dtype=float))
+            dates.append(nodes[idx[0]].date)
+        return cls(parent, curves, acc_mult, dates)
+
+
+class NodeList(Sequence):
+    """Ленивое представление ScenarioTree списком Node (для старого кода)."""
+
+    def __init__(self, tree: ScenarioTree):
+        self.tree = tree
+        self._offsets = np.cumsum([0] + [c.shape[0] for c in tree.curves]).tolist()
+
+    def __len__(self):
+        return self._offsets[-1]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        L = bisect_right(self._offsets, i) - 1
+        k = i - self._offsets[L]
+        t = self.tree
+        snap = {m: float(v) for m, v in zip(TERMS, t.curves[L][k])}
+        snap['date'] = t.dates[L]
+        parent = None if L == 0 else self._offsets[L-1] + int(t.parent[L][k])
+        return Node(L, parent, t.dates[L], snap, float(t.acc_mult[L][k]))
+
+
+def branch_shocks(rng: np.random.Generator, n_parents: int, branch: int, scheme: str = "iid") -> np.ndarray:
+    """
+    Стандартные нормальные шоки квартального перехода [n_parents * branch, len(TERMS)],
+    ветки родителя подряд. Схемы:
+      iid        — независимые розыгрыши;
+      antithetic — пары (z, -z) (при нечётном branch последняя ветка — iid);
+      moment     — у каждого родителя выборочное среднее ровно 0, ковариация
+                   ровно I (при branch <= len(TERMS) — только дисперсии);
+      sobol      — скрэмблированная последовательность Соболя, общая для
+                   уровня, со случайным сдвигом по модулю 1 на родителя
+                   (рандомизированный QMC), затем обратная функция Φ.
+    """
+    d = len(TERMS)
+    if scheme == "iid":
+        z = rng.standard_normal((n_parents, branch, d))
+    elif scheme == "antithetic":
+        half = rng.standard_normal((n_parents, branch // 2, d))
+        z = np.concatenate([half, -half, rng.standard_normal((n_parents, branch % 2, d))], axis=1)
+    elif scheme == "moment":
+        z = rng.standard_normal((n_parents, branch, d))
+        z -= z.mean(axis=1, keepdims=True)
+        if branch > d:
+            cov = np.einsum("pbi,pbj->pij", z, z) / branch
+            L = np.linalg.cholesky(cov)
+            z = np.linalg.solve(L[:, None], z[..., None])[..., 0]
+        elif branch > 1:
+            z /= z.std(axis=1, keepdims=True)
+    elif scheme == "sobol":
+        import warnings
+        from scipy.stats import norm, qmc
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)      # branch не степень двойки
+            points = qmc.Sobol(d, scramble=True, seed=rng).random(branch)
+        u = (points[None, :, :] + rng.random((n_parents, 1, d))) % 1.0
+        z = norm.ppf(np.clip(u, 1e-12, 1.0 - 1e-12))
+    else:
+        raise ValueError(f"scheme must be one of {SCHEMES}, got {scheme!r}")
+    return z.reshape(n_parents * branch, d)
+
+
+def tree_seed(g: GCurve) -> np.random.SeedSequence:
+    """Зерно дерева по умолчанию: из даты и снапшота кривой — одно состояние, одно дерево."""
+    snap = g.snapshot()
+    return np.random.SeedSequence([g.t_curr.toordinal()] + [int(round(snap[m] * 1e6)) for m in TERMS])
+
+
+def quarter_transition(base: np.ndarray, rng: np.random.Generator, days: int = QUARTER_LEN_DAYS,
+                       phi: float = DEFAULT_PHI, sigma: dict = DEFAULT_SIGMA,
+                       exact: bool = False, z: np.ndarray | None = None) -> np.ndarray:
+    """
+    AR(1) GCurve на days дней сразу для всех строк base [n, len(TERMS)];
+    среднее, как и у GCurve(date, base), — сама стартовая кривая.
+    По умолчанию — закрытая форма ar1_jump (один шок на срок, пол в нуле
+    цензурированием); exact=True — дневная рекурсия с полом на каждом шаге.
+    z — готовые шоки закрытой формы (см. branch_shocks), иначе iid из rng.
+    """
+    mu = np.asarray(base, dtype=float)
+    sig = np.array([sigma[m] for m in TERMS])
+    if not exact:
+        # старт в mu: среднее конечной точки — mu, остаётся только шум
+        return ar1_jump(mu, mu, phi, sig, days, rng.standard_normal(mu.shape) if z is None else z)
+    if z is not None:
+        raise ValueError("shocks z apply to the closed-form transition only (exact=False)")
+    rate = mu.copy()
+    eps = np.empty_like(rate)
+    for _ in range(days):
+        rng.standard_normal(out=eps)
+        eps *= sig
+        rate -= mu
+        rate *= phi
+        rate += mu
+        rate += eps
+        np.maximum(rate, 0.0, out=rate)
+    return rate
+
+
+def build_tree_arrays(g: GCurve, levels: int = 6, branch: int = 10,
+                      seed: int | None = None, exact: bool = False, scheme: str = "iid") -> ScenarioTree:
+    """
+    exact=True — квартальные переходы дневной рекурсией (см. quarter_transition).
+    scheme — схема шоков веток (см. branch_shocks; при exact — только "iid").
+    seed=None — tree_seed(g): дерево воспроизводимо по состоянию кривой.
+    """
+    if scheme not in SCHEMES:
+        raise ValueError(f"scheme must be one of {SCHEMES}, got {scheme!r}")
+    if exact and scheme != "iid":
+        raise ValueError("sampling schemes need the closed-form transition (exact=False)")
+    with profiler.phase("build_tree"):
+        rng = np.random.default_rng(tree_seed(g) if seed is None else seed)
+        root = g.snapshot()
+        parent = [np.array([-1], dtype=np.int64)]
+        curves = [np.array([[float(root[m]) for m in TERMS]])]
+        acc_mult = [np.ones(1)]
+        dates = [g.t_curr]
+
+        for L in range(1, levels):
+            prev = curves[L-1]
+            # каждая ветка стартует со снапшота родителя и «прокручивает» квартал
+            z = None if exact else branch_shocks(rng, prev.shape[0], branch, scheme)
+            children = quarter_transition(np.repeat(prev, branch, axis=0), rng, exact=exact, z=z)
+            parent.append(np.repeat(np.arange(prev.shape[0]), branch))
+            curves.append(np.round(children, 6))
+            # множитель наращения: 1 + r_1y(parent)/4
+            acc_mult.append(np.repeat(1.0 + prev[:, TERM_COL[12]] / 4.0, branch))
+            dates.append(dates[L-1] + timedelta(days=QUARTER_LEN_DAYS))
+        return ScenarioTree(parent, curves, acc_mult, dates)
+
+
+def build_tree(g: GCurve, levels: int = 6, branch: int = 10, seed: int | None = None,
+               exact: bool = False, scheme: str = "iid") -> List[Node]:
+    """Совместимый вход: то же дерево, но как (ленивый) список Node."""
+    return build_tree_arrays(g, levels=levels, branch=branch, seed=seed, exact=exact, scheme=scheme).nodes()
+
+
+class StreamingTree:
+    """
+    Дерево levels x branch по частям, без материализации всех узлов.
+    Верх — уровни 0..split (top, обычный ScenarioTree), ниже — поддеревья
+    с корнями в узлах уровня split. blocks() каждый раз заново порождает
+    лес поддеревьев блоками (first, ScenarioTree): уровень 0 блока — корни
+    поддеревьев first..first+n-1 (строки уровня split верха), parent —
+    внутри блока; в блоке не больше max(block_leaves, листьев одного
+    поддерева) листьев. Повторные проходы дают те же блоки бит в бит.
+    Зерна: SeedSequence(seed) (None — tree_seed(g)), верх — spawn_key (0,),
+    поддерево i — (1, i): дерево зависит от seed и split, но не от
+    block_leaves. Generator вместо seed даёт одно зерно из своего потока.
+    Переходы — закрытая форма; с build_tree_arrays при том же seed дерево
+    не совпадает (другие потоки шоков).
+    split=None — поддеревья глубиной в 3 квартала (levels - 4).
+    """
+
+    def __init__(self, g: GCurve, levels: int = 6, branch: int = 10, seed=None, scheme: str = "iid",
+                 split: int | None = None, block_leaves: int = 1 << 16):
+        if scheme not in SCHEMES:
+            raise ValueError(f"scheme must be one of {SCHEMES}, got {scheme!r}")
+        split = max(0, levels - 4) if split is None else int(split)
+        if not 0 <= split < levels:
+            raise ValueError(f"split must be in [0, levels), got {split}")
+        if seed is None:
+            seed = tree_seed(g)
+        elif isinstance(seed, np.random.Generator):
+            seed = np.random.SeedSequence(int(seed.integers(2 ** 63)))
+        elif not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        self.seed = seed
+        self.levels, self.branch, self.scheme, self.split = levels, branch, scheme, split
+        self.depth = levels - 1 - split
+        self.top = build_tree_arrays(g, levels=split + 1, branch=branch, seed=self._child(0), scheme=scheme)
+        self.per_block = max(1, int(block_leaves) // branch ** self.depth)
+
+    @property
+    def n_subtrees(self) -> int:
+        return self.top.n_leaves
+
+    @property
+    def n_leaves(self) -> int:
+        return self.n_subtrees * self.branch ** self.depth
+
+    def _child(self, *key) -> np.random.SeedSequence:
+        return np.random.SeedSequence(self.seed.entropy, spawn_key=self.seed.spawn_key + key)
+
+    def blocks(self):
+        for first in range(0, self.n_subtrees, self.per_block):
+            yield first, self.forest(first, min(first + self.per_block, self.n_subtrees))
+
+    def forest(self, first: int, stop: int) -> ScenarioTree:
+        """Лес поддеревьев first..stop-1 (см. blocks)."""
+        branch, n = self.branch, stop - first
+        rngs = [np.random.default_rng(self._child(1, i)) for i in range(first, stop)]
+        parent = [np.full(n, -1, dtype=np.int64)]
+        curves = [self.top.curves[-1][first:stop]]
+        acc_mult = [np.ones(n)]
+        for L in range(1, self.depth + 1):
+            prev = curves[L-1]
+            per_tree = prev.shape[0] // n                     # родителей уровня на поддерево
+            z = np.concatenate([branch_shocks(rng, per_tree, branch, self.scheme) for rng in rngs])
+            children = quarter_transition(np.repeat(prev, branch, axis=0), None, z=z)
+            parent.append(np.repeat(np.arange(prev.shape[0]), branch))
+            curves.append(np.round(children, 6))
+            acc_mult.append(np.repeat(1.0 + prev[:, TERM_COL[12]] / 4.0, branch))
+        dates = [self.top.dates[-1] + timedelta(days=QUARTER_LEN_DAYS * L) for L in range(self.depth + 1)]
+        return ScenarioTree(parent, curves, acc_mult, dates)
+
+
+def _grouped_kmeans(x: np.ndarray, w: np.ndarray, group: np.ndarray, n_groups: int, k: int,
+                    rng: np.random.Generator, iters: int = 10) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Взвешенный k-means сразу во всех группах (итерации Ллойда общими
+    операциями NumPy); старт — k случайных членов группы. Группы не больше
+    k не кластеризуются. Возвращает (метку кластера в группе [n],
+    центры [n_groups, k, d]); пустые кластеры — с нулевой массой.
+    """
+    n, d = x.shape
+    order = np.lexsort((rng.random(n), group))
+    sizes = np.bincount(group, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - np.repeat(starts, sizes)
+    labels = np.where(rank < k, rank, 0)
+    centers = np.zeros((n_groups, k, d))
+    seed_pts = rank < k
+    centers[group[seed_pts], rank[seed_pts]] = x[seed_pts]
+    small = sizes[group] <= k
+    # в группе с m < k членами центры m..k-1 не заняты
+    unused = np.arange(k)[None, :] >= sizes[group][:, None]
+    dist = np.empty((n, k))
+    for it in range(iters):
+        for j in range(k):
+            diff = x - centers[group, j]
+            dist[:, j] = np.einsum("nd,nd->n", diff, diff)
+        dist[unused] = np.inf
+        new = np.where(small, rank, dist.argmin(axis=1))
+        if it > 0 and (new == labels).all():
+            break
+        labels = new
+        cell = group * k + labels
+        mass = np.bincount(cell, weights=w, minlength=n_groups * k)
+        sums = np.stack([np.bincount(cell, weights=w * x[:, j], minlength=n_groups * k) for j in range(d)], axis=1)
+        keep = mass > 0
+        flat = centers.reshape(-1, d)
+        flat[keep] = sums[keep] / mass[keep, None]
+    return labels, centers
+
+
+def reduce_tree(tree: ScenarioTree, max_children: int = 4, seed: int = 0,
+                match_moments: bool = True) -> ScenarioTree:
+    """
+    Редукция дерева сценариев сверху вниз. На каждом уровне дети всех
+    исходных узлов, слитых в один представитель, объединяются и
+    кластеризуются (взвешенный k-means по кривым) не более чем в
+    max_children представителей: кривая — взвешенный центроид,
+    вероятность — сумма вероятностей членов. match_moments — центроиды
+    растягиваются от среднего группы так, чтобы совпали среднее и
+    дисперсия каждого срока (кластеризация сама по себе сжимает хвосты).
+    acc_mult пересчитывается от r_1y нового родителя. Листьев не больше
+    max_children^(levels-1); CVaR/решение на редуцированном дереве
+    считаются с весами prob.
+    """
+    rng = np.random.default_rng(seed)
+    k = int(max_children)
+    parent = [np.array([-1], dtype=np.int64)]
+    curves = [tree.curves[0].copy()]
+    prob = [np.ones(1)]
+    acc_mult = [np.ones(1)]
+    rep_of = np.zeros(1, dtype=np.int64)       # исходный узел уровня L-1 -> представитель
+    for L in range(1, tree.levels):
+        n_groups = curves[L-1].shape[0]
+        group = rep_of[tree.parent[L]]
+        x = tree.curves[L]
+        p = np.full(x.shape[0], 1.0 / x.shape[0]) if tree.prob is None else tree.prob[L]
+        labels, centers = _grouped_kmeans(x, p, group, n_groups, k, rng)
+        cell = group * k + labels
+        mass = np.bincount(cell, weights=p, minlength=n_groups * k)
+        if match_moments:
+            gmass = np.bincount(group, weights=p, minlength=n_groups)
+            mean = np.stack([np.bincount(group, weights=p * x[:, j], minlength=n_groups)
+                             for j in range(x.shape[1])], axis=1) / gmass[:, None]
+            var = np.stack([np.bincount(group, weights=p * (x[:, j] - mean[group, j]) ** 2, minlength=n_groups)
+                            for j in range(x.shape[1])], axis=1) / gmass[:, None]
+            dev = centers - mean[:, None, :]
+            rep_var = (mass.reshape(n_groups, k)[..., None] * dev ** 2).sum(axis=1) / gmass[:, None]
+            scale = np.sqrt(np.divide(var, rep_var, out=np.ones_like(var), where=rep_var > 0))
+            centers = np.maximum(mean[:, None, :] + dev * scale[:, None, :], 0.0)
+        used = np.flatnonzero(mass > 0)                 # по группам, внутри — по метке
+        new_index = np.full(n_groups * k, -1)
+        new_index[used] = np.arange(used.size)
+        rep_of = new_index[cell]
+        parent.append(used // k)
+        curves.append(centers.reshape(-1, x.shape[1])[used])
+        prob.append(mass[used])
+        acc_mult.append(1.0 + curves[L-1][parent[L], TERM_COL[12]] / 4.0)
+    return ScenarioTree(parent, curves, acc_mult, list(tree.dates), prob)
+
+
+class RollingTree:
+    """
+    Дерево со сдвигом горизонта между клирингами. На следующем клиринге
+    (дата = уровень 1 прошлого дерева) берётся поддерево ребёнка корня,
+    ближайшего к реализованной кривой (max |Δ| по срокам), и целиком
+    сдвигается на Δ = кривая - ребёнок: приращения AR(1) относительно
+    родителя от уровня не зависят, меняется только пол в нуле. Достраивается
+    один новый уровень листьев — branch^(levels-1) узлов вместо всего дерева.
+    Δ (drift) — расстояние переиспользованного дерева от свежего по корню;
+    при drift > max_drift, смене levels/branch/scheme или пропуске квартала —
+    полная перестройка build_tree_arrays.
+    """
+
+    def __init__(self, max_drift: float = 0.005):
+        self.max_drift = float(max_drift)
+        self.tree = None
+        self._params = None
+        self.reused = 0
+        self.rebuilt = 0
+        self.drifts = []             # drift каждой попытки переиспользования
+
+    def get(self, g: GCurve, levels: int, branch: int, seed=None, scheme: str = "iid") -> ScenarioTree:
+        if scheme not in SCHEMES:
+            raise ValueError(f"scheme must be one of {SCHEMES}, got {scheme!r}")
+        rng = np.random.default_rng(tree_seed(g) if seed is None else seed)
+        prev, params = self.tree, (levels, branch, scheme)
+        if prev is not None and self._params == params and levels >= 2 and prev.dates[1] == g.t_curr:
+            snap = g.snapshot()
+            root = np.array([float(snap[m]) for m in TERMS])
+            dist = np.abs(prev.curves[1] - root).max(axis=1)
+            j = int(np.argmin(dist))
+            self.drifts.append(float(dist[j]))
+            if dist[j] <= self.max_drift:
+                with profiler.phase("build_tree"):
+                    self.tree = self._roll(prev, j, root, rng, branch, scheme, g.t_curr)
+                self.reused += 1
+                return self.tree
+        self.tree = build_tree_arrays(g, levels=levels, branch=branch, seed=rng, scheme=scheme)
+        self._params = params
+        self.rebuilt += 1
+        return self.tree
+
+    @staticmethod
+    def _roll(prev: ScenarioTree, j: int, root: np.ndarray, rng: np.random.Generator,
+              branch: int, scheme: str, t_curr) -> ScenarioTree:
+        delta = root - prev.curves[1][j]
+        curves = [root[None, :]]
+        for L in range(2, prev.levels):
+            # поддерево ребёнка j на уровне L — непрерывный блок (узлы упорядочены по родителю)
+            size = branch ** (L - 1)
+            block = prev.curves[L][j * size:(j + 1) * size]
+            curves.append(np.round(np.maximum(block + delta, 0.0), 6))
+        last = curves[-1]
+        z = branch_shocks(rng, last.shape[0], branch, scheme)
+        curves.append(np.round(quarter_transition(np.repeat(last, branch, axis=0), rng, z=z), 6))
+
+        parent = [np.array([-1], dtype=np.int64)]
+        acc_mult = [np.ones(1)]
+        dates = [t_curr]
+        for L in range(1, len(curves)):
+            n_prev = curves[L-1].shape[0]
+            parent.append(np.repeat(np.arange(n_prev), branch))
+            acc_mult.append(np.repeat(1.0 + curves[L-1][:, TERM_COL[12]] / 4.0, branch))
+            dates.append(dates[L-1] + timedelta(days=QUARTER_LEN_DAYS))
+        return ScenarioTree(parent, curves, acc_mult, dates)
+
+    def stats(self) -> dict:
+        d = np.array(self.drifts)
+        return {"reused": self.reused, "rebuilt": self.rebuilt,
+                "mean_drift": float(d.mean()) if d.size else 0.0,
+                "max_drift": float(d.max()) if d.size else 0.0}
@@ -0,0 +1,172 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+from gcurve import GCurve
+from scenarios import QUARTER_LEN_DAYS, ScenarioTree, build_tree, build_tree_arrays
+
+
+class TestScenarioTree(unittest.TestCase):
+    def setUp(self):
+        self.g = GCurve(datetime(2016,12,31), {0:0.09,3:0.095,6:0.10,12:0.105,24:0.11})
+
+    def test_shapes_and_links(self):
+        tree = build_tree_arrays(self.g, levels=4, branch=3, seed=1)
+        self.assertEqual([c.shape[0] for c in tree.curves], [1, 3, 9, 27])
+        self.assertEqual(tree.n_leaves, 27)
+        self.assertTrue((tree.parent[3] == np.repeat(np.arange(9), 3)).all())
+        # множитель наращения — от годовой ставки родителя
+        np.testing.assert_allclose(tree.acc_mult[2], 1.0 + np.repeat(tree.curves[1][:, 3], 3) / 4.0)
+
+    def test_seed_reproducible(self):
+        a = build_tree_arrays(self.g, levels=3, branch=4, seed=7)
+        b = build_tree_arrays(self.g, levels=3, branch=4, seed=7)
+        for x, y in zip(a.curves, b.curves):
+            self.assertTrue((x == y).all())
+
+    def test_node_list_adapter(self):
+        nodes = build_tree(self.g, levels=3, branch=2, seed=3)
+        self.assertEqual(len(nodes), 7)
+        self.assertIsNone(nodes[0].parent)
+        self.assertEqual([n.level for n in nodes], [0, 1, 1, 2, 2, 2, 2])
+        self.assertEqual(nodes[6].parent, 2)
+        self.assertEqual(nodes[3].gcurve_snapshot[12], nodes.tree.curves[2][0, 3])
+        back = ScenarioTree.from_nodes(list(nodes))
+        for x, y in zip(back.curves, nodes.tree.curves):
+            self.assertTrue((x == y).all())
+
+    def test_transition_matches_gcurve_stepping(self):
+        # распределение квартального перехода = GCurve.step(QUARTER_LEN_DAYS) из той же точки
+        tree = build_tree_arrays(self.g, levels=2, branch=4000, seed=5)
+        ref = self.g.simulate_paths(4000, QUARTER_LEN_DAYS, seed=6)[:, -1]
+        np.testing.assert_allclose(tree.curves[1].mean(axis=0), ref.mean(axis=0), atol=3e-4)
+        np.testing.assert_allclose(tree.curves[1].std(axis=0), ref.std(axis=0), rtol=0.1)
+
+    def test_jump_matches_daily_distribution(self):
+        # закрытая форма квартального перехода против дневной рекурсии: KS по каждому сроку
+        from scipy.stats import ks_2samp
+        from scenarios import quarter_transition
+        base = np.tile([0.09, 0.095, 0.10, 0.105, 0.11], (20000, 1))
+        fast = quarter_transition(base, np.random.default_rng(1))
+        slow = quarter_transition(base, np.random.default_rng(2), exact=True)
+        for j in range(base.shape[1]):
+            self.assertGreater(ks_2samp(fast[:, j], slow[:, j]).pvalue, 1e-3, j)
+        # моменты — теоретические
+        phi, n = 0.97, QUARTER_LEN_DAYS
+        sd = 0.0005 * np.sqrt((1 - phi ** (2 * n)) / (1 - phi ** 2))
+        self.assertAlmostEqual(fast[:, 3].std(), sd, delta=0.03 * sd)
+        self.assertAlmostEqual(fast[:, 3].mean(), 0.105, delta=4 * sd / np.sqrt(len(fast)))
+
+    def test_gcurve_jump(self):
+        from copy import deepcopy
+        g = GCurve(datetime(2016, 12, 31), {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}, seed=3)
+        g.current = {0: 0.12, 3: 0.12, 6: 0.12, 12: 0.12, 24: 0.12}
+        exact = deepcopy(g)
+        exact.jump(QUARTER_LEN_DAYS, exact=True)
+        ref = deepcopy(g)
+        ref.step(QUARTER_LEN_DAYS)
+        self.assertEqual(exact.current, ref.current)
+        ends = []
+        for seed in range(2000):
+            h = deepcopy(g)
+            h.rng = np.random.default_rng(seed)
+            h.jump(QUARTER_LEN_DAYS)
+            ends.append(h.current[12])
+        self.assertEqual(h.t_curr, ref.t_curr)
+        # среднее тянется к mu: mu + phi^n (r - mu)
+        expected = 0.105 + 0.97 ** QUARTER_LEN_DAYS * (0.12 - 0.105)
+        self.assertAlmostEqual(np.mean(ends), expected, delta=1e-4)
+
+    def test_exact_tree_keeps_daily_recursion(self):
+        a = build_tree_arrays(self.g, levels=3, branch=3, seed=4, exact=True)
+        b = build_tree_arrays(self.g, levels=3, branch=3, seed=4)
+        self.assertEqual([c.shape for c in a.curves], [c.shape for c in b.curves])
+        self.assertFalse((a.curves[1] == b.curves[1]).all())
+
+    def test_branch_shock_schemes(self):
+        from scenarios import branch_shocks
+        rng = np.random.default_rng(0)
+        z = branch_shocks(rng, 4, 6, "antithetic").reshape(4, 6, 5)
+        np.testing.assert_array_equal(z[:, :3], -z[:, 3:])
+        self.assertEqual(branch_shocks(rng, 4, 7, "antithetic").shape, (28, 5))
+        z = branch_shocks(rng, 4, 8, "moment").reshape(4, 8, 5)
+        np.testing.assert_allclose(z.mean(axis=1), 0.0, atol=1e-12)
+        np.testing.assert_allclose(np.einsum("pbi,pbj->pij", z, z) / 8, np.broadcast_to(np.eye(5), (4, 5, 5)), atol=1e-12)
+        z = branch_shocks(rng, 4, 3, "moment").reshape(4, 3, 5)
+        np.testing.assert_allclose(z.std(axis=1), 1.0)
+        a = branch_shocks(np.random.default_rng(1), 4, 8, "sobol")
+        b = branch_shocks(np.random.default_rng(1), 4, 8, "sobol")
+        self.assertTrue(np.isfinite(a).all() and (a == b).all())
+        with self.assertRaises(ValueError):
+            branch_shocks(rng, 1, 2, "halton")
+        with self.assertRaises(ValueError):
+            build_tree_arrays(self.g, levels=2, branch=2, exact=True, scheme="moment")
+
+    def test_default_seed_follows_curve_state(self):
+        a = build_tree_arrays(self.g, levels=3, branch=3)
+        b = build_tree_arrays(self.g, levels=3, branch=3)
+        self.assertTrue((a.curves[2] == b.curves[2]).all())
+        self.g.step()
+        c = build_tree_arrays(self.g, levels=3, branch=3)
+        self.assertFalse((a.curves[2] == c.curves[2]).all())
+
+    def test_moment_matching_reduces_cvar_noise(self):
+        from sampling_study import convergence_study
+        rows = convergence_study(self.g, levels=3, branches=(8,), schemes=("iid", "moment"),
+                                 reps=20, ref_branch=32, ref_reps=2)
+        by_scheme = {r["scheme"]: r for r in rows}
+        self.assertLess(by_scheme["moment"]["std"], by_scheme["iid"]["std"])
+        self.assertLess(by_scheme["moment"]["rmse"], by_scheme["iid"]["rmse"])
+
+    def test_rolling_tree_reuses_nearest_subtree(self):
+        from scenarios import RollingTree
+        rolling = RollingTree(max_drift=1.0)
+        first = rolling.get(self.g, levels=4, branch=3, seed=1)
+        self.g.step(QUARTER_LEN_DAYS)
+        second = rolling.get(self.g, levels=4, branch=3, seed=2)
+        self.assertEqual((rolling.reused, rolling.rebuilt), (1, 1))
+        fresh = build_tree_arrays(self.g, levels=4, branch=3, seed=2)
+        self.assertEqual([c.shape for c in second.curves], [c.shape for c in fresh.curves])
+        self.assertEqual(second.dates, fresh.dates)
+        np.testing.assert_array_equal(second.curves[0], fresh.curves[0])
+        # уровни 1..2 — сдвинутое поддерево ближайшего ребёнка прошлого дерева
+        j = int(np.argmin(np.abs(first.curves[1] - second.curves[0]).max(axis=1)))
+        delta = second.curves[0][0] - first.curves[1][j]
+        np.testing.assert_allclose(second.curves[1], first.curves[2][3 * j:3 * j + 3] + delta, atol=1e-6)
+        self.assertAlmostEqual(rolling.stats()["max_drift"], np.abs(delta).max())
+        np.testing.assert_allclose(second.acc_mult[3], 1.0 + np.repeat(second.curves[2][:, 3], 3) / 4.0)
+
+    def test_rolling_tree_falls_back_to_rebuild(self):
+        from scenarios import RollingTree
+        rolling = RollingTree(max_drift=0.0)
+        rolling.get(self.g, levels=3, branch=3, seed=1)
+        self.g.step(QUARTER_LEN_DAYS)
+        tree = rolling.get(self.g, levels=3, branch=3, seed=2)
+        self.assertEqual((rolling.reused, rolling.rebuilt), (0, 2))
+        fresh = build_tree_arrays(self.g, levels=3, branch=3, seed=2)
+        for a, b in zip(tree.curves, fresh.curves):
+            self.assertTrue((a == b).all())
+        # другие параметры или пропущенный квартал — тоже перестройка
+        self.g.step(2 * QUARTER_LEN_DAYS)
+        rolling.max_drift = 1.0
+        rolling.get(self.g, levels=3, branch=3, seed=3)
+        self.assertEqual(rolling.rebuilt, 3)
+
+    def test_reduce_tree_weights_and_moments(self):
+        from scenarios import reduce_tree
+        tree = build_tree_arrays(self.g, levels=4, branch=10, seed=1)
+        red = reduce_tree(tree, max_children=3)
+        self.assertLessEqual(red.n_leaves, 27)
+        for L in range(red.levels):
+            self.assertAlmostEqual(red.prob[L].sum(), 1.0)
+            self.assertTrue((red.prob[L] > 0).all())
+            # среднее и дисперсия уровня сохранены
+            np.testing.assert_allclose(red.prob[L] @ red.curves[L], tree.curves[L].mean(axis=0), atol=1e-9)
+        np.testing.assert_allclose(red.prob[1] @ (red.curves[1] - tree.curves[1].mean(axis=0)) ** 2,
+                                   tree.curves[1].var(axis=0), rtol=1e-6)
+        np.testing.assert_allclose(red.acc_mult[2], 1.0 + red.curves[1][red.parent[2], 3] / 4.0)
+        # узлы уровня упорядочены по родителю, масса детей = масса родителя
+        self.assertTrue((np.diff(red.parent[3]) >= 0).all())
+        np.testing.assert_allclose(np.bincount(red.parent[3], weights=red.prob[3]), red.prob[2])
+        self.assertEqual(reduce_tree(tree, max_children=10).n_leaves, 1000)
@@ -0,0 +1,162 @@
+# streaming.py
+"""
+Оценка дерева сценариев потоком: экспозиции листьев StreamingTree блоками
+и точный CVaR по столбцам потерь за несколько проходов по дереву.
+
+    python streaming.py --levels 8 --branch 10      # 10^7 листьев
+
+Память — O(верх дерева + блок + D * cap) вместо O(листьев): блоки каждый
+проход порождаются заново из тех же зёрен.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from gcurve import GCurve
+from optimizer import Decision, _pick_grid, leaf_exposures, propagate_exposures, swap_fixed_rates, unit_grid
+from profiling import profiler
+from scenarios import StreamingTree
+
+BINS = 1024
+CAP = 1 << 16
+
+
+def exposure_blocks(tree: StreamingTree):
+    """Экспозиции листьев [m, 3] блоками, в порядке листьев дерева."""
+    r_fix = swap_fixed_rates(tree.top)
+    base = leaf_exposures(tree.top)             # экспозиции корней поддеревьев
+    for first, sub in tree.blocks():
+        yield propagate_exposures(sub, r_fix, base[first:first + sub.curves[0].shape[0]])
+
+
+def _scale(width: np.ndarray) -> np.ndarray:
+    with np.errstate(divide="ignore", over="ignore"):
+        scale = BINS / width
+    return np.where(np.isfinite(scale) & (width > 0), scale, 0.0)
+
+
+def streaming_cvar(make_losses, alpha: float = 0.95, cap: int = CAP,
+                   max_passes: int = 32) -> tuple[np.ndarray, np.ndarray, np.ndarray, dict]:
+    """
+    (CVaR, VaR, среднее, info) по столбцам потерь, которые make_losses()
+    при каждом вызове заново отдаёт блоками [m, D]. Результат — как у
+    cvar_of_losses_batch на всей матрице (до порядка суммирования).
+    Проход 1 — число сценариев, суммы, min/max. Дальше k-я порядковая
+    статистика зажимается в «скобку» [lo, hi]: за проход — гистограмма
+    BINS корзин по скобке (число, сумма, min/max значений корзины), скобка
+    сужается до min/max корзины с k-й статистикой, число и сумма значений
+    выше скобки копятся. Номер корзины монотонен по значению, поэтому
+    скобка — ровно значения корзины. Когда в скобке не больше cap
+    значений на столбец (или все они равны), последний проход собирает
+    их и сортирует. info — {"scenarios", "passes"}.
+    """
+    S, total, lo, hi = 0, None, None, None
+    for x in make_losses():
+        S += x.shape[0]
+        total = x.sum(axis=0) if total is None else total + x.sum(axis=0)
+        lo = x.min(axis=0) if lo is None else np.minimum(lo, x.min(axis=0))
+        hi = x.max(axis=0) if hi is None else np.maximum(hi, x.max(axis=0))
+    if S == 0:
+        raise ValueError("make_losses() yielded no scenarios")
+    D = total.size
+    k = max(0, min(S - 1, int(np.ceil(alpha * S)) - 1))
+    n_tail = S - k
+    below = np.zeros(D, dtype=np.int64)
+    above_n = np.zeros(D, dtype=np.int64)
+    above_sum = np.zeros(D)
+    count = np.full(D, S, dtype=np.int64)
+    passes = 1
+    rows, offsets = np.arange(D), np.arange(D) * BINS
+
+    while not ((count <= cap) | (lo == hi)).all():
+        if passes >= max_passes:
+            raise RuntimeError(f"streaming_cvar: no convergence in {max_passes} passes")
+        scale = _scale(hi - lo)
+        cnt = np.zeros(D * BINS, dtype=np.int64)
+        sums = np.zeros(D * BINS)
+        b_lo, b_hi = np.full(D * BINS, np.inf), np.full(D * BINS, -np.inf)
+        for x in make_losses():
+            mask = (x >= lo) & (x <= hi)
+            pos = (x - lo) * scale
+            np.clip(pos, 0, BINS - 1, out=pos)
+            cell = (pos.astype(np.int64) + offsets)[mask]
+            vals = x[mask]
+            cnt += np.bincount(cell, minlength=D * BINS)
+            sums += np.bincount(cell, weights=vals, minlength=D * BINS)
+            np.minimum.at(b_lo, cell, vals)
+            np.maximum.at(b_hi, cell, vals)
+        passes += 1
+        cnt, sums = cnt.reshape(D, BINS), sums.reshape(D, BINS)
+        cum = np.cumsum(cnt, axis=1)
+        b = np.argmax(cum > (k - below)[:, None], axis=1)
+        in_b = cnt[rows, b]
+        above_n += count - cum[rows, b]
+        above_sum += sums.sum(axis=1) - np.cumsum(sums, axis=1)[rows, b]
+        below += cum[rows, b] - in_b
+        count = in_b
+        lo, hi = b_lo[offsets + b], b_hi[offsets + b]
+
+    tie = lo == hi
+    var = lo.copy()
+    cvar = (above_sum + (n_tail - above_n) * var) / n_tail
+    todo = np.flatnonzero(~tie)
+    if todo.size:
+        kept = [[] for _ in range(D)]
+        for x in make_losses():
+            mask = (x >= lo) & (x <= hi)
+            for j in todo:
+                kept[j].append(x[mask[:, j], j])
+        passes += 1
+        for j in todo:
+            v = np.sort(np.concatenate(kept[j]))
+            r = k - below[j]
+            var[j] = v[r]
+            cvar[j] = (above_sum[j] + v[r:].sum()) / n_tail
+    return cvar, var, total / S, {"scenarios": S, "passes": passes}
+
+
+def stream_grid_search_cvar(g: GCurve, notional_unit: float, levels: int = 6, branch: int = 10,
+                            alpha: float = 0.95, mu: float = 0.0, max_abs_units: int = 2, seed=None,
+                            scheme: str = "iid", split: int | None = None,
+                            block_leaves: int = 1 << 14) -> tuple[Decision, dict]:
+    """
+    grid_search_cvar по StreamingTree: дерево не материализуется, каждый
+    проход streaming_cvar заново порождает блоки листьев. Решение и
+    метрики — как у grid_search_cvar на том же (потоковом) дереве.
+    """
+    tree = StreamingTree(g, levels=levels, branch=branch, seed=seed, scheme=scheme,
+                         split=split, block_leaves=block_leaves)
+    decisions = unit_grid(max_abs_units) * float(notional_unit)
+
+    def losses():
+        for expo in exposure_blocks(tree):
+            yield -(expo @ decisions.T)
+
+    with profiler.phase("stream_cvar"):
+        cvars, _, mean_loss, stats = streaming_cvar(losses, alpha)
+    decision, info = _pick_grid(decisions, -mean_loss, cvars, alpha, mu)
+    info.update(leaves=stats["scenarios"], passes=stats["passes"], split=tree.split)
+    return decision, info
+
+
+if __name__ == "__main__":
+    import tracemalloc
+
+    from portfolio import Portfolio
+
+    ap = argparse.ArgumentParser(description="streaming CVaR grid search over a large scenario tree")
+    ap.add_argument("--levels", type=int, default=8)
+    ap.add_argument("--branch", type=int, default=10)
+    ap.add_argument("--block", type=int, default=1 << 14)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    g = GCurve(Portfolio.T0, {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11})
+    tracemalloc.start()
+    t = time.perf_counter()
+    decision, info = stream_grid_search_cvar(g, 1e5, levels=args.levels, branch=args.branch,
+                                             seed=args.seed, block_leaves=args.block)
+    peak = tracemalloc.get_traced_memory()[1]
+    print(decision, info)
+    print(f"{info['leaves']} leaves in {time.perf_counter() - t:.1f}s, peak {peak / 2 ** 20:.0f} MB")
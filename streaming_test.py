@@ -0,0 +1,78 @@
+import unittest
+from datetime import datetime
+
+import numpy as np
+
+import optimizer
+from gcurve import GCurve
+from optimizer import cvar_of_losses_batch, grid_search_cvar, leaf_exposures
+from scenarios import ScenarioTree, StreamingTree
+from streaming import exposure_blocks, stream_grid_search_cvar, streaming_cvar
+
+BASE = {0: 0.09, 3: 0.095, 6: 0.10, 12: 0.105, 24: 0.11}
+
+
+def _assemble(tree: StreamingTree) -> ScenarioTree:
+    """Всё дерево целиком из верха и единственного блока поддеревьев."""
+    (_, sub), = list(tree.blocks())
+    top = tree.top
+    return ScenarioTree(top.parent + sub.parent[1:], top.curves + sub.curves[1:],
+                        top.acc_mult + sub.acc_mult[1:], top.dates + sub.dates[1:])
+
+
+class TestStreaming(unittest.TestCase):
+    def setUp(self):
+        self.g = GCurve(datetime(2016,12,31), BASE)
+
+    def test_blocks_do_not_change_tree(self):
+        small = StreamingTree(self.g, levels=5, branch=4, seed=3, split=2, block_leaves=10)
+        whole = StreamingTree(self.g, levels=5, branch=4, seed=3, split=2, block_leaves=10 ** 6)
+        self.assertGreater(len(list(small.blocks())), 1)
+        a = np.concatenate(list(exposure_blocks(small)))
+        b = np.concatenate(list(exposure_blocks(whole)))
+        self.assertEqual(a.shape, (small.n_leaves, 3))
+        np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(np.concatenate(list(exposure_blocks(small))), a)   # повторный проход
+        tree = _assemble(whole)
+        self.assertEqual([c.shape[0] for c in tree.curves], [1, 4, 16, 64, 256])
+        np.testing.assert_array_equal(leaf_exposures(tree), a)
+
+    def test_streaming_cvar_is_exact(self):
+        rng = np.random.default_rng(0)
+        x = rng.normal(size=(50_001, 4))
+        x[:, 3] = np.round(x[:, 3])                  # много равных значений
+        x[:, 2] = 1.5                                # все равны
+
+        def blocks():
+            for i in range(0, x.shape[0], 4096):
+                yield x[i:i + 4096]
+
+        for alpha in (0.9, 0.95, 0.999):
+            for cap in (16, 1 << 16):
+                cvar, var, mean, info = streaming_cvar(blocks, alpha, cap=cap)
+                ref_cvar, ref_var = cvar_of_losses_batch(x, alpha)
+                np.testing.assert_array_equal(var, ref_var)
+                np.testing.assert_allclose(cvar, ref_cvar, rtol=1e-12, atol=1e-12)
+                np.testing.assert_allclose(mean, x.mean(axis=0))
+                self.assertEqual(info["scenarios"], x.shape[0])
+
+    def test_stream_grid_matches_materialized(self):
+        tree = StreamingTree(self.g, levels=5, branch=5, seed=7, split=1)
+        d_full, m_full = grid_search_cvar(_assemble(tree), 1e5)
+        d, m = stream_grid_search_cvar(self.g, 1e5, levels=5, branch=5, seed=7, split=1, block_leaves=50)
+        self.assertEqual(d, d_full)
+        self.assertAlmostEqual(m["best_cvar"], m_full["best_cvar"], places=6)
+        self.assertEqual(m["leaves"], 625)
+
+    def test_rebalance_streaming(self):
+        from engine import HedgeEngine
+        from portfolio import Portfolio
+        e = HedgeEngine(Portfolio(N_C=10, N_D=10, V=100000))
+        d = optimizer.rebalance_once(e, levels=4, branch=4, seed=1, stream_block=16)
+        self.assertEqual(d, optimizer.rebalance_once(e, levels=4, branch=4, seed=1, stream_block=1000))
+        with self.assertRaises(ValueError):
+            optimizer.rebalance_once(e, solver="lp", stream_block=16)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,17 @@ import unittest
 
 from engine_test import TestEngineMethods
 from gcurve_test import TestNSCurve, TestCurveQuality
+from gcurve_paths_test import TestGCurvePaths
+from portfolio_test import TestPortfolioColumns
+from scenarios_test import TestScenarioTree
+from optimizer_test import TestOptimizer
+from backtest_test import TestBacktest
+from dates_test import TestDates
+from recorder_test import TestRecorder
+from batch_engine_test import TestBatchEngine
+from bench_suite_test import TestBenchSuite
+from streaming_test import TestStreaming
+from parallel_tree_test import TestParallelTree
 
 
 